@@ -0,0 +1,83 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+
+def build_cache_key(
+    transcript: str,
+    prompt: str,
+    system_message: str,
+    deployment: str,
+    api_version: str,
+) -> str:
+    """Content address of an analysis: identical inputs give an identical key"""
+    payload = json.dumps(
+        [transcript, prompt, system_message, deployment, api_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Analysis results cached in a Cosmos DB container.
+
+    Entries expire through the per-item `ttl` property, which Cosmos applies
+    when the container has time-to-live enabled (default TTL of -1).
+    """
+
+    def __init__(self, container, ttl_seconds: int):
+        self.container = container
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached analysis for a key, or None on a miss"""
+        try:
+            return self.container.read_item(item=key, partition_key=key)
+        except CosmosResourceNotFoundError:
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store an analysis result under a key"""
+        self.container.upsert_item(
+            body={
+                **value,
+                "id": key,
+                "ttl": self.ttl_seconds,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+        )
+
+
+class InMemoryAnalysisCache:
+    """Process-local stand-in for AnalysisCache with TTL and LRU eviction"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return dict(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (time.time() + self.ttl_seconds, dict(value, id=key))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
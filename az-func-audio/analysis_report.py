@@ -0,0 +1,110 @@
+import logging
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def raise_for_failed(analysis_results: Dict[str, Dict[str, Any]]) -> None:
+    """Fail the job rather than completing it with empty sections"""
+    failed = {
+        key: result.get("error")
+        for key, result in analysis_results.items()
+        if result["status"] != "success"
+    }
+    if failed:
+        raise RuntimeError(f"Analysis failed for prompts: {failed}")
+
+
+def build_report(
+    analysis_results: Dict[str, Dict[str, Any]]
+) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+    """
+    Combine per-prompt analysis results into the report text and the
+    analysis_sections stored on the job.
+    """
+    analysis_sections = {
+        key: {
+            "analysis_text": result["analysis_text"],
+            "status": result["status"],
+            "cache_hit": result.get("cache_hit", False),
+            "tier": result.get("tier"),
+            "deployment": result.get("deployment"),
+            "latency_ms": result.get("latency_ms"),
+        }
+        for key, result in analysis_results.items()
+    }
+    if len(analysis_results) == 1:
+        analysis_text = next(iter(analysis_results.values()))["analysis_text"]
+    else:
+        analysis_text = "\n\n".join(
+            f"{key}\n\n{result['analysis_text']}"
+            for key, result in analysis_results.items()
+        )
+    return analysis_text, analysis_sections
+
+
+def publish_report(
+    job_id: str,
+    analysis_text: str,
+    analysis_sections: Dict[str, Dict[str, Any]],
+    pdf_blob_name: str,
+    cosmos_service,
+    storage_service,
+    analysis_stored: bool = False,
+    **extra_fields,
+) -> Dict[str, Any]:
+    """
+    Generate the analysis PDF and mark the job completed.
+
+    When analysis_stored, the text and sections are already on the job
+    document and are not sent again; only the PDF path, the status and the
+    routing summary are patched.
+    """
+    logger.info("Generating and uploading analysis PDF...")
+    pdf_blob_url = storage_service.generate_and_upload_pdf(analysis_text, pdf_blob_name)
+    logger.debug(f"Analysis PDF uploaded: {pdf_blob_url}")
+
+    latencies = [
+        section["latency_ms"]
+        for section in analysis_sections.values()
+        if section["latency_ms"] is not None
+    ]
+    if not analysis_stored:
+        extra_fields.update(
+            analysis_text=analysis_text, analysis_sections=analysis_sections
+        )
+    return cosmos_service.update_job_status(
+        job_id,
+        "completed",
+        analysis_file_path=pdf_blob_url,
+        analysis_partial=None,
+        analysis_cache_hit=all(
+            section["cache_hit"] for section in analysis_sections.values()
+        ),
+        # Every prompt of a job shares the tier picked for the transcript
+        analysis_tier=next(iter(analysis_sections.values()))["tier"],
+        analysis_latency_ms=max(latencies) if latencies else None,
+        **extra_fields,
+    )
+
+
+def complete_job(
+    job_id: str,
+    analysis_results: Dict[str, Dict[str, Any]],
+    pdf_blob_name: str,
+    cosmos_service,
+    storage_service,
+    **extra_fields,
+) -> Dict[str, Any]:
+    """Build the report from analysis results, publish it and complete the job"""
+    raise_for_failed(analysis_results)
+    analysis_text, analysis_sections = build_report(analysis_results)
+    return publish_report(
+        job_id,
+        analysis_text,
+        analysis_sections,
+        pdf_blob_name,
+        cosmos_service,
+        storage_service,
+        **extra_fields,
+    )
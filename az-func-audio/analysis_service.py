@@ -1,75 +1,765 @@
-from typing import Dict, Any
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import re
+import threading
+import time
 import requests
 import logging
 from config import AppConfig
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI, RateLimitError
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from token_utils import estimate_tokens, estimate_message_tokens
+from analysis_cache import build_cache_key
+from rate_limiter import retry_after_seconds
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_MESSAGE = "You are an AI assistant designed to help adult social care workers evaluate the progress of their service users. You will provide concise and accurate summaries of conversations."
+
+# A speaker banner as written by TranscriptionService.format_transcription
+SPEAKER_TURN_PATTERN = re.compile(r"^\s*--- Speaker .* ---\s*$")
+
+# A turn line of a compacted transcript ("S1: ...", see transcript_compaction)
+COMPACT_TURN_PATTERN = re.compile(r"^S\S*: ")
+
+
+def build_messages(conversation: str, context: str) -> List[Dict[str, str]]:
+    """Chat messages of a single analysis request, transcript first"""
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": conversation},
+        {"role": "user", "content": context},
+    ]
+
+
+def split_into_turns(conversation: str) -> List[str]:
+    """Split a formatted transcript into speaker turns, each starting with its banner"""
+    turns: List[List[str]] = []
+    for line in conversation.splitlines():
+        if (
+            SPEAKER_TURN_PATTERN.match(line)
+            or COMPACT_TURN_PATTERN.match(line)
+            or not turns
+        ):
+            turns.append([])
+        turns[-1].append(line)
+    return ["\n".join(turn).strip("\n") for turn in turns if "".join(turn).strip()]
+
+
+def split_transcript(conversation: str, max_tokens: int) -> List[str]:
+    """
+    Split a formatted transcript into chunks of at most max_tokens.
+
+    Cuts only on speaker-turn boundaries. A single turn longer than the
+    budget is cut between lines, repeating its speaker banner on every piece.
+    """
+    pieces: List[str] = []
+    for turn in split_into_turns(conversation):
+        if estimate_tokens(turn) <= max_tokens:
+            pieces.append(turn)
+            continue
+
+        lines = turn.splitlines()
+        banner = lines[0] if SPEAKER_TURN_PATTERN.match(lines[0]) else ""
+        body = lines[1:] if banner else lines
+        current: List[str] = []
+        for line in body:
+            candidate = "\n".join([banner] + current + [line]).strip("\n")
+            if current and estimate_tokens(candidate) > max_tokens:
+                pieces.append("\n".join([banner] + current).strip("\n"))
+                current = []
+            current.append(line)
+        if current:
+            pieces.append("\n".join([banner] + current).strip("\n"))
+
+    chunks: List[str] = []
+    current_chunk: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current_chunk and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current_chunk))
+            current_chunk, current_tokens = [], 0
+        current_chunk.append(piece)
+        current_tokens += piece_tokens
+    if current_chunk:
+        chunks.append("\n\n".join(current_chunk))
+    return chunks
+
+
+class PartialAnalysisWriter:
+    """
+    Collects streamed analysis text per prompt key and hands snapshots to a
+    flush callback, throttled to every flush_every_tokens deltas or every
+    min_interval_seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[Dict[str, str]], Any],
+        min_interval_seconds: float,
+        flush_every_tokens: int,
+    ):
+        self.flush_fn = flush_fn
+        self.min_interval_seconds = min_interval_seconds
+        self.flush_every_tokens = flush_every_tokens
+        self._parts: Dict[str, List[str]] = {}
+        self._pending_tokens = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, key: str, delta: str) -> bool:
+        """Record a streamed delta; returns True when a flush is due"""
+        with self._lock:
+            self._parts.setdefault(key, []).append(delta)
+            self._pending_tokens += 1
+            return (
+                self._pending_tokens >= self.flush_every_tokens
+                or time.monotonic() - self._last_flush >= self.min_interval_seconds
+            )
+
+    def flush(self) -> None:
+        """Write the current partial text; failures are logged, never raised"""
+        with self._lock:
+            if not self._pending_tokens:
+                return
+            snapshot = {key: "".join(parts) for key, parts in self._parts.items()}
+            self._pending_tokens = 0
+            self._last_flush = time.monotonic()
+        with self._flush_lock:
+            try:
+                self.flush_fn(snapshot)
+            except Exception as e:
+                logger.warning(f"Failed to write partial analysis: {str(e)}")
+
 
 class AnalysisService:
-    def __init__(self, config: AppConfig):
+    def __init__(
+        self,
+        config: AppConfig,
+        cache: Optional[Any] = None,
+        rate_limiters: Optional[Dict[str, Any]] = None,
+        credential=None,
+    ):
         self.config = config
-        self.credential = DefaultAzureCredential()
+        self.credential = credential or DefaultAzureCredential()
+        # Optional AnalysisCache (or in-memory stand-in) keyed by content hash
+        self.cache = cache
+        # Optional TokenBucketRateLimiter per deployment, shared across
+        # Function instances
+        self.rate_limiters = rate_limiters or {}
 
-    def analyze_conversation(self, conversation: str, context: str) -> Dict[str, Any]:
-        """
-        Analyze conversation using Azure OpenAI.
+        # Clients are created once per service instance and reused
+        self._token_provider = None
+        self._client: Optional[AzureOpenAI] = None
+        self._client_lock = threading.Lock()
+        self._async_client: Optional[AsyncAzureOpenAI] = None
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Event loop the sync entry points run their analyses on, started on
+        # first use and kept for the life of the worker
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
-        Args:
-            conversation: The conversation text to analyze
-            context: The system context/prompt for analysis
+    def select_tier(
+        self, conversation: str, min_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Pick the deployment tier for a transcript.
 
-        Returns:
-            Dict containing the analysis results
+        The smallest tier whose max_tokens fits the transcript is used, but
+        never one below min_tier (a subcategory's analysis_tier setting).
         """
+        tiers = self.config.analysis_deployment_tiers
+        transcript_tokens = estimate_tokens(conversation)
+        index = next(
+            i
+            for i, tier in enumerate(tiers)
+            if tier["max_tokens"] is None or transcript_tokens <= tier["max_tokens"]
+        )
+        if min_tier:
+            names = [tier["name"] for tier in tiers]
+            if min_tier in names:
+                index = max(index, names.index(min_tier))
+            else:
+                logger.warning(f"Unknown analysis tier {min_tier}, ignoring it")
+        tier = tiers[index]
+        logger.info(
+            f"Transcript has ~{transcript_tokens} tokens, routing analysis to "
+            f"tier {tier['name']} ({tier['deployment']})"
+        )
+        return tier
+
+    def _cache_key(self, conversation: str, context: str, deployment: str) -> str:
+        return build_cache_key(
+            conversation,
+            context,
+            SYSTEM_MESSAGE,
+            deployment,
+            self.config.azure_openai_version,
+        )
+
+    def _get_cached(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached analysis; cache errors never fail the analysis"""
+        if not self.cache:
+            return None
+        try:
+            return self.cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Analysis cache lookup failed: {str(e)}")
+            return None
+
+    def _store_cached(self, cache_key: str, result: Dict[str, Any]) -> None:
+        if not self.cache:
+            return
         try:
+            self.cache.set(
+                cache_key,
+                {
+                    "analysis_text": result["analysis_text"],
+                    "chunk_count": result["chunk_count"],
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Analysis cache write failed: {str(e)}")
+
+    # Messages put the transcript before the instructions. Every prompt run
+    # against the same transcript then shares the system + transcript prefix,
+    # which the service can serve from its prompt cache.
+
+    def _build_messages(self, conversation: str, context: str) -> List[Dict[str, str]]:
+        """Build the chat messages for a single analysis request"""
+        logger.info(
+            f"Prompt created successfully: {len(context)} instruction chars, "
+            f"{len(conversation)} transcript chars"
+        )
+        return build_messages(conversation, context)
+
+    def _build_chunk_messages(
+        self, chunk: str, context: str, index: int, total: int
+    ) -> List[Dict[str, str]]:
+        """Build the map-step messages for one chunk of a long transcript"""
+        return [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {
+                "role": "user",
+                "content": f"Part {index} of {total} of a longer conversation:\n\n{chunk}",
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"{context}\n\n"
+                    "Apply the instructions above to this part of the conversation "
+                    "only; the partial results will be merged afterwards."
+                ),
+            },
+        ]
+
+    def _build_reduce_messages(
+        self, partial_results: List[str], context: str
+    ) -> List[Dict[str, str]]:
+        """Build the reduce-step messages that merge the partial analyses"""
+        parts = "\n\n".join(
+            f"### Part {index} of {len(partial_results)}\n{text}"
+            for index, text in enumerate(partial_results, start=1)
+        )
+        instructions = (
+            f"{context}\n\n"
+            f"The conversation was too long to analyse at once, so it was split into "
+            f"{len(partial_results)} consecutive parts and each part was analysed with "
+            "the instructions above. Merge the partial analyses into a single "
+            "response that follows the instructions above. Combine duplicated "
+            "attendees and topics, keep the chronological order and do not add "
+            "information that is not in the partial analyses."
+        )
+        return [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": parts},
+            {"role": "user", "content": instructions},
+        ]
+
+    def _get_token_provider(self):
+        """Bearer token provider shared by the sync and async clients"""
+        if self._token_provider is None:
             logger.info("Getting Bearer Token...")
-            token_provider = get_bearer_token_provider(
+            self._token_provider = get_bearer_token_provider(
                 self.credential, "https://cognitiveservices.azure.com/.default"
             )
             logger.info("Bearer Token obtained successfully :")
-            logger.info("Creating AzureOpenAI client...")
-            client = AzureOpenAI(
+        return self._token_provider
+
+    def _get_client(self) -> AzureOpenAI:
+        """Long-lived AzureOpenAI client, created on first use"""
+        with self._client_lock:
+            if self._client is None:
+                logger.info("Creating AzureOpenAI client...")
+                self._client = AzureOpenAI(
+                    azure_endpoint=self.config.azure_openai_endpoint,
+                    azure_ad_token_provider=self._get_token_provider(),
+                    api_version=self.config.azure_openai_version
+                )
+                logger.info("AzureOpenAI client created successfully: ")
+            return self._client
+
+    @property
+    def client(self) -> AzureOpenAI:
+        """The shared AzureOpenAI client, e.g. for Batch API calls"""
+        return self._get_client()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """The service's long-lived event loop, running in a daemon thread"""
+        with self._client_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="analysis-loop", daemon=True
+                ).start()
+            return self._loop
+
+    def _get_async_client(self) -> Tuple[AsyncAzureOpenAI, asyncio.Semaphore]:
+        """
+        AsyncAzureOpenAI client and concurrency semaphore for the running loop.
+
+        Both are bound to an event loop. Analyses started through the sync
+        entry points all run on the service's own loop, so they share one
+        client and its connection pool. Callers that drive their own loop get
+        a new client when the loop changes; the previous one is closed if its
+        loop still runs.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            if self._async_client is not None and self._async_loop.is_running():
+                asyncio.run_coroutine_threadsafe(
+                    self._async_client.close(), self._async_loop
+                )
+            logger.info("Creating AsyncAzureOpenAI client...")
+            self._async_client = AsyncAzureOpenAI(
                 azure_endpoint=self.config.azure_openai_endpoint,
-                azure_ad_token_provider=token_provider,
-                api_version=self.config.azure_openai_version
+                azure_ad_token_provider=self._get_token_provider(),
+                api_version=self.config.azure_openai_version,
             )
-            logger.info("AzureOpenAI client created successfully: ")  
-
-            prompt = f"{context}\n\n{conversation}"
-            logger.info("Prompt created successfully: "+ prompt)
-            messages = [
-                {"role": "system", "content": "You are an AI assistant designed to help adult social care workers evaluate the progress of their service users. You will provide concise and accurate summaries of conversations."},
-                {"role": "user", "content": prompt}
-                ]
-            logger.info("Sending analysis request to AzureOpenAI")
-            response = client.chat.completions.create(
-                model=self.config.azure_openai_deployment,  # deployment/model name
-                messages=messages            
+            self._async_semaphore = asyncio.Semaphore(
+                self.config.analysis_max_concurrency
             )
-            logger.info("Response received from AzureOpenAI")
-            # Validate and extract analysis_text from response
-            if not response.choices or not hasattr(response.choices[0], "message"):
-                logger.error("Response missing expected message content. Full response: %s", response)
-                raise ValueError("Missing message content in response from AzureOpenAI")
-            analysis_text = response.choices[0].message.content
-            logger.info("Analysis completed successfully:" + analysis_text)
+            self._async_loop = loop
+        return self._async_client, self._async_semaphore
 
-            return {
-                "analysis_text": analysis_text,
-                "raw_response": response,
-                "status": "success",
-            }
+    @staticmethod
+    def _validate_response(response):
+        # Validate and extract analysis_text from response
+        if not response.choices or not hasattr(response.choices[0], "message"):
+            logger.error("Response missing expected message content. Full response: %s", response)
+            raise ValueError("Missing message content in response from AzureOpenAI")
+        return response
+
+    def _reserve_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Tokens to take from the rate limiter before dispatching a request"""
+        return (
+            estimate_message_tokens(messages)
+            + self.config.analysis_max_completion_tokens
+        )
+
+    @staticmethod
+    def _used_tokens(messages: List[Dict[str, str]], response) -> int:
+        usage = getattr(response, "usage", None)
+        if usage and usage.total_tokens:
+            return usage.total_tokens
+        # Streamed responses carry no usage; count them locally
+        return estimate_message_tokens(messages) + estimate_tokens(
+            response.choices[0].message.content
+        )
+
+    def _rate_limit_backoff(
+        self, rate_limiter, error: RateLimitError, attempt: int
+    ) -> bool:
+        """Block the shared limiter after a 429; False when the request should fail"""
+        if not rate_limiter or attempt >= self.config.analysis_rate_limit_max_retries:
+            return False
+        delay = retry_after_seconds(error, default=min(2 ** attempt, 60))
+        rate_limiter.block_for(delay)
+        return True
+
+    def _complete(self, messages: List[Dict[str, str]], deployment: str):
+        """Send one chat completion request and validate the response.
+
+        With a rate limiter the request waits for budget before dispatch and a
+        429 is retried after the server's Retry-After instead of failing.
+        """
+        rate_limiter = self.rate_limiters.get(deployment)
+        reserved = self._reserve_tokens(messages)
+        attempt = 0
+        while True:
+            attempt += 1
+            if rate_limiter:
+                rate_limiter.acquire(reserved)
+            try:
+                response = self._get_client().chat.completions.create(
+                    model=deployment,  # deployment/model name
+                    messages=messages
+                )
+            except RateLimitError as e:
+                if self._rate_limit_backoff(rate_limiter, e, attempt):
+                    continue
+                raise
+            response = self._validate_response(response)
+            if rate_limiter:
+                rate_limiter.settle(reserved, self._used_tokens(messages, response))
+            return response
+
+    async def _stream_async(
+        self,
+        messages: List[Dict[str, str]],
+        deployment: str,
+        on_delta: Callable[[str], Awaitable[None]],
+    ) -> ChatCompletion:
+        """Stream one chat completion, passing each text delta to on_delta"""
+        client, semaphore = self._get_async_client()
+        parts: List[str] = []
+        completion_id, model, finish_reason = None, None, None
+        async with semaphore:
+            stream = await client.chat.completions.create(
+                model=deployment,
+                messages=messages,
+                stream=True,
+            )
+            async for chunk in stream:
+                completion_id = completion_id or chunk.id
+                model = chunk.model or model
+                # Azure sends prompt content-filter results in a chunk without choices
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    parts.append(choice.delta.content)
+                    await on_delta(choice.delta.content)
+                finish_reason = choice.finish_reason or finish_reason
+
+        if not parts:
+            logger.error("Streamed response contained no message content")
+            raise ValueError("Missing message content in response from AzureOpenAI")
+
+        # Same shape as a non-streamed response for the callers
+        return ChatCompletion.model_construct(
+            id=completion_id,
+            object="chat.completion",
+            created=int(time.time()),
+            model=model or deployment,
+            choices=[
+                Choice.model_construct(
+                    index=0,
+                    finish_reason=finish_reason or "stop",
+                    message=ChatCompletionMessage.model_construct(
+                        role="assistant", content="".join(parts)
+                    ),
+                )
+            ],
+        )
+
+    async def _send_async(
+        self,
+        messages: List[Dict[str, str]],
+        deployment: str,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        if on_delta:
+            return await self._stream_async(messages, deployment, on_delta)
+
+        client, semaphore = self._get_async_client()
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model=deployment,
+                messages=messages,
+            )
+        return self._validate_response(response)
+
+    async def _complete_async(
+        self,
+        messages: List[Dict[str, str]],
+        deployment: str,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        """Send one chat completion request, bounded by the concurrency semaphore
+        and, when configured, the shared rate limiter"""
+        rate_limiter = self.rate_limiters.get(deployment)
+        reserved = self._reserve_tokens(messages)
+        attempt = 0
+        while True:
+            attempt += 1
+            if rate_limiter:
+                await rate_limiter.acquire_async(reserved)
+            try:
+                response = await self._send_async(messages, deployment, on_delta)
+            except RateLimitError as e:
+                if await asyncio.to_thread(
+                    self._rate_limit_backoff, rate_limiter, e, attempt
+                ):
+                    continue
+                raise
+            if rate_limiter:
+                await asyncio.to_thread(
+                    rate_limiter.settle,
+                    reserved,
+                    self._used_tokens(messages, response),
+                )
+            return response
+
+    def _use_map_reduce(self, conversation: str) -> bool:
+        transcript_tokens = estimate_tokens(conversation)
+        if transcript_tokens > self.config.analysis_map_reduce_threshold_tokens:
+            logger.info(
+                f"Transcript has ~{transcript_tokens} tokens, using map-reduce analysis"
+            )
+            return True
+        return False
+
+    def _map_reduce(self, conversation: str, context: str, deployment: str):
+        """Analyse a long transcript chunk by chunk, then merge the partial results"""
+        chunks = split_transcript(conversation, self.config.analysis_chunk_tokens)
+        logger.info(
+            f"Transcript split into {len(chunks)} chunks for map-reduce analysis"
+        )
+
+        def analyze_chunk(item):
+            index, chunk = item
+            messages = self._build_chunk_messages(chunk, context, index, len(chunks))
+            return self._complete(messages, deployment).choices[0].message.content
+
+        workers = max(1, min(self.config.analysis_max_parallel_chunks, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            partial_results = list(
+                executor.map(analyze_chunk, enumerate(chunks, start=1))
+            )
+        logger.info("All chunks analysed, merging partial results")
+
+        response = self._complete(
+            self._build_reduce_messages(partial_results, context), deployment
+        )
+        return response, len(chunks)
+
+    async def _map_reduce_async(
+        self,
+        conversation: str,
+        context: str,
+        deployment: str,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        """Async map-reduce; only the reduce step is streamed.
+
+        Chunk calls share the service-wide semaphore, and at most
+        analysis_max_parallel_chunks of one transcript run at a time, so a
+        long transcript does not take every slot from other analyses.
+        """
+        chunks = split_transcript(conversation, self.config.analysis_chunk_tokens)
+        logger.info(
+            f"Transcript split into {len(chunks)} chunks for map-reduce analysis"
+        )
+        chunk_slots = asyncio.Semaphore(max(1, self.config.analysis_max_parallel_chunks))
+
+        async def analyze_chunk(index: int, chunk: str):
+            async with chunk_slots:
+                return await self._complete_async(
+                    self._build_chunk_messages(chunk, context, index, len(chunks)),
+                    deployment,
+                )
+
+        responses = await asyncio.gather(
+            *(analyze_chunk(index, chunk) for index, chunk in enumerate(chunks, start=1))
+        )
+        partial_results = [r.choices[0].message.content for r in responses]
+        logger.info("All chunks analysed, merging partial results")
+
+        response = await self._complete_async(
+            self._build_reduce_messages(partial_results, context), deployment, on_delta
+        )
+        return response, len(chunks)
+
+    @staticmethod
+    def _cached_result(cached: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "analysis_text": cached["analysis_text"],
+            "raw_response": None,
+            "chunk_count": cached.get("chunk_count", 1),
+            "cache_hit": True,
+            "status": "success",
+        }
+
+    @staticmethod
+    def _with_routing(
+        result: Dict[str, Any], tier: Dict[str, Any], started: float
+    ) -> Dict[str, Any]:
+        """Record the tier that served the analysis and how long it took"""
+        result["tier"] = tier["name"]
+        result["deployment"] = tier["deployment"]
+        result["latency_ms"] = int((time.monotonic() - started) * 1000)
+        return result
+
+    @staticmethod
+    def _success_result(response, chunk_count: int) -> Dict[str, Any]:
+        logger.info("Response received from AzureOpenAI")
+        analysis_text = response.choices[0].message.content
+        logger.info("Analysis completed successfully:" + analysis_text)
+        return {
+            "analysis_text": analysis_text,
+            "raw_response": response,
+            "chunk_count": chunk_count,
+            "cache_hit": False,
+            "status": "success",
+        }
+
+    @staticmethod
+    def _error_result(error: Exception) -> Dict[str, Any]:
+        logger.error(f"Analysis failed: {str(error)}")
+        return {
+            "analysis_text": "",  # ensure key exists even on error
+            "raw_response": None,
+            "status": "error",
+            "error": str(error)
+        }
+
+    def analyze_conversation(
+        self, conversation: str, context: str, min_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze conversation using Azure OpenAI.
+
+        The request goes to the deployment tier picked by select_tier.
+        Transcripts above the configured token threshold are analysed with a
+        map-reduce over speaker-turn chunks instead of a single request.
+        Results are served from the analysis cache when the same transcript,
+        prompt and model were analysed before.
+
+        Args:
+            conversation: The conversation text to analyze
+            context: The system context/prompt for analysis
+            min_tier: Smallest deployment tier allowed for this analysis
+
+        Returns:
+            Dict containing the analysis results
+        """
+        started = time.monotonic()
+        try:
+            tier = self.select_tier(conversation, min_tier)
+            deployment = tier["deployment"]
+            cache_key = self._cache_key(conversation, context, deployment)
+            cached = self._get_cached(cache_key)
+            if cached:
+                logger.info(f"Analysis served from cache: {cache_key}")
+                return self._with_routing(self._cached_result(cached), tier, started)
+
+            if self._use_map_reduce(conversation):
+                response, chunk_count = self._map_reduce(
+                    conversation, context, deployment
+                )
+            else:
+                messages = self._build_messages(conversation, context)
+                logger.info("Sending analysis request to AzureOpenAI")
+                response = self._complete(messages, deployment)
+                chunk_count = 1
+
+            result = self._success_result(response, chunk_count)
+            self._store_cached(cache_key, result)
+            return self._with_routing(result, tier, started)
         except Exception as e:
-            logger.error(f"Analysis failed: {str(e)}")
-            return {
-                "analysis_text": "",  # ensure key exists even on error
-                "raw_response": None,
-                "status": "error",
-                "error": str(e)
-            }
+            return self._error_result(e)
+
+    async def analyze_conversation_async(
+        self,
+        conversation: str,
+        context: str,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        min_tier: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async variant of analyze_conversation.
+
+        Completion calls from every concurrent analysis on this worker share
+        one AsyncAzureOpenAI client and are bounded by a semaphore of
+        AZURE_OPENAI_MAX_CONCURRENCY, so several prompts or chunks can run in
+        parallel without flooding the deployment. When on_delta is given the
+        final completion is streamed and each text delta is passed to it.
+        """
+        started = time.monotonic()
+        try:
+            tier = self.select_tier(conversation, min_tier)
+            deployment = tier["deployment"]
+            cache_key = self._cache_key(conversation, context, deployment)
+            cached = await asyncio.to_thread(self._get_cached, cache_key)
+            if cached:
+                logger.info(f"Analysis served from cache: {cache_key}")
+                return self._with_routing(self._cached_result(cached), tier, started)
+
+            if self._use_map_reduce(conversation):
+                response, chunk_count = await self._map_reduce_async(
+                    conversation, context, deployment, on_delta
+                )
+            else:
+                messages = self._build_messages(conversation, context)
+                logger.info("Sending analysis request to AsyncAzureOpenAI")
+                response = await self._complete_async(messages, deployment, on_delta)
+                chunk_count = 1
+
+            result = self._success_result(response, chunk_count)
+            await asyncio.to_thread(self._store_cached, cache_key, result)
+            return self._with_routing(result, tier, started)
+        except Exception as e:
+            return self._error_result(e)
+
+    async def analyze_prompts_async(
+        self,
+        conversation: str,
+        prompts: Dict[str, str],
+        partial_writer: Optional[PartialAnalysisWriter] = None,
+        min_tier: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Run every prompt against the same transcript concurrently"""
+
+        async def analyze_key(key: str) -> Dict[str, Any]:
+            on_delta = None
+            if partial_writer:
+
+                async def on_delta(delta: str) -> None:
+                    if partial_writer.add(key, delta):
+                        await asyncio.to_thread(partial_writer.flush)
+
+            return await self.analyze_conversation_async(
+                conversation, prompts[key], on_delta=on_delta, min_tier=min_tier
+            )
+
+        keys = list(prompts)
+        results = await asyncio.gather(*(analyze_key(key) for key in keys))
+        if partial_writer:
+            await asyncio.to_thread(partial_writer.flush)
+        return dict(zip(keys, results))
+
+    def analyze_prompts(
+        self,
+        conversation: str,
+        prompts: Dict[str, str],
+        partial_writer: Optional[PartialAnalysisWriter] = None,
+        min_tier: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Analyze one transcript with every prompt of a subcategory.
+
+        Prompts run in parallel, bounded by AZURE_OPENAI_MAX_CONCURRENCY, on
+        the service's event loop, so every call reuses the same client.
+
+        Args:
+            conversation: The conversation text to analyze
+            prompts: Prompt text by prompt key
+            partial_writer: Receives the streamed text while the analyses run
+            min_tier: Smallest deployment tier allowed (subcategory setting)
+
+        Returns:
+            Analysis result (as returned by analyze_conversation) by prompt key
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.analyze_prompts_async(conversation, prompts, partial_writer, min_tier),
+            self._get_loop(),
+        ).result()
 
     def process_transcription_results(
         self, transcription_result: Dict[str, Any], context: str
@@ -0,0 +1,523 @@
+import bisect
+import io
+import logging
+import shutil
+import struct
+import subprocess
+from typing import Any, Dict, List, Sequence, Tuple
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+# Speech timestamps are in 100 ns ticks
+TICKS_PER_SECOND = 10_000_000
+
+# Frames louder than this are never silence, so a quiet speaker is not taken
+# for the noise floor of a recording that has no real pauses
+SILENCE_CEILING_DB = -50.0
+
+# Speech frames around a voiced frame that count as voiced too, so word
+# onsets and trailing consonants are not cut
+VAD_HANGOVER_FRAMES = 3
+
+# Seconds of audio decoded at a time
+DECODE_BLOCK_SECONDS = 10
+
+# Waveform peaks blob, all little-endian: a header (magic, version, level
+# count, reserved, duration in ms), one directory entry per level (peaks per
+# second, pair count, byte offset of its data) and then each level's int8
+# (min, max) pairs
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sBBHI")
+PEAKS_LEVEL = struct.Struct("<III")
+
+
+def downmix(samples):
+    """Average all channels into one"""
+    return samples.mean(axis=1, dtype="float32") if samples.ndim == 2 else samples
+
+
+def _box_mean(samples, width: int):
+    """Mean of every run of width samples, len(samples) - width + 1 values"""
+    import numpy as np
+
+    cumulative = np.cumsum(samples, dtype=np.float64)
+    cumulative = np.concatenate(([0.0], cumulative))
+    return ((cumulative[width:] - cumulative[:-width]) / width).astype(np.float32)
+
+
+class Resampler:
+    """
+    Resample mono audio block by block, by linear interpolation.
+
+    Downsampling first applies a box filter as long as the decimation step,
+    a cheap anti-aliasing filter that is adequate for speech recognition.
+    Only the samples of the current block and the few carried over from the
+    previous one are held, so hours of audio resample in little memory.
+    """
+
+    def __init__(self, source_rate: int, target_rate: int):
+        import numpy as np
+
+        self.step = source_rate / target_rate
+        self.width = max(1, int(round(self.step)))
+        self.buffer = np.zeros(0, dtype=np.float32)
+        # Source index of buffer[0], source samples seen, samples produced
+        self.start = 0
+        self.total = 0
+        self.produced = 0
+
+    def _interpolate(self, smoothed, end: int):
+        import numpy as np
+
+        positions = np.arange(self.produced, end) * self.step - self.start
+        self.produced = max(self.produced, end)
+        return np.interp(positions, np.arange(len(smoothed)), smoothed).astype(
+            np.float32
+        )
+
+    def push(self, block):
+        """Resampled audio for as much of the input as is known so far"""
+        import numpy as np
+
+        self.total += len(block)
+        if self.step == 1:
+            return block.astype(np.float32, copy=False)
+        self.buffer = np.concatenate((self.buffer, block.astype(np.float32, copy=False)))
+        if len(self.buffer) < self.width + 1:
+            return np.zeros(0, dtype=np.float32)
+        smoothed = _box_mean(self.buffer, self.width)
+        # Interpolating at a position needs the smoothed sample after it
+        last = self.start + len(smoothed) - 2
+        end = max(self.produced, int(last // self.step) + 1)
+        resampled = self._interpolate(smoothed, end)
+
+        # Keep what the next position needs, and enough for the final box
+        drop = min(int(self.produced * self.step) - self.start, len(self.buffer) - self.width)
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.start += drop
+        return resampled
+
+    def finish(self):
+        """The rest of the resampled audio, once all input was pushed"""
+        import numpy as np
+
+        end = int(self.total / self.step)
+        if self.step == 1 or end <= self.produced or not len(self.buffer):
+            return np.zeros(0, dtype=np.float32)
+        smoothed = _box_mean(self.buffer, min(self.width, len(self.buffer)))
+        # Positions past the last smoothed sample take its value
+        return self._interpolate(smoothed, end)
+
+
+def _append(samples, length: int, block):
+    """Write block after the first length samples, growing samples if needed"""
+    import numpy as np
+
+    end = length + len(block)
+    if end > len(samples):
+        grown = np.empty(max(end, 2 * len(samples)), dtype=np.float32)
+        grown[:length] = samples[:length]
+        samples = grown
+    samples[length:end] = block
+    return samples, end
+
+
+def decode_audio(data: bytes, extension: str, sample_rate: int):
+    """
+    Decode a recording to mono float32 samples at sample_rate.
+
+    WAV, FLAC, OGG and MP3 are read with soundfile, DECODE_BLOCK_SECONDS at
+    a time, each block downmixed and resampled before the next is read, so
+    the full-rate audio is never held whole. Anything soundfile cannot read,
+    such as M4A from phones, goes through ffmpeg, which downmixes and
+    resamples on the way.
+
+    Returns (samples, source_rate).
+    """
+    import numpy as np
+    import soundfile
+
+    try:
+        source = soundfile.SoundFile(io.BytesIO(data))
+    except RuntimeError as e:
+        logger.info(f"soundfile cannot decode {extension} audio ({str(e)}), using ffmpeg")
+    else:
+        with source:
+            source_rate = source.samplerate
+            resampler = Resampler(source_rate, sample_rate)
+            # Filled in place; the frame count of compressed formats is an
+            # estimate, so the buffer grows if it was short
+            samples = np.empty(int(source.frames / resampler.step) + 1, dtype=np.float32)
+            length = 0
+            blocks = source.blocks(
+                blocksize=source_rate * DECODE_BLOCK_SECONDS,
+                dtype="float32",
+                always_2d=True,
+            )
+            for block in blocks:
+                samples, length = _append(samples, length, resampler.push(downmix(block)))
+            samples, length = _append(samples, length, resampler.finish())
+        return samples[:length], source_rate
+
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise ValueError(f"Cannot decode {extension} audio: ffmpeg is not available")
+    result = subprocess.run(
+        [
+            ffmpeg,
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-i",
+            "pipe:0",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "-f",
+            "f32le",
+            "pipe:1",
+        ],
+        input=data,
+        capture_output=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise ValueError(
+            f"ffmpeg could not decode {extension} audio: "
+            f"{result.stderr.decode('utf-8', 'replace').strip()}"
+        )
+    return np.frombuffer(result.stdout, dtype=np.float32), sample_rate
+
+
+def frame_activity(samples, sample_rate: int, frame_seconds: float, margin_db: float):
+    """
+    Energy based voice-activity detection.
+
+    A frame is voiced when its RMS level is margin_db above the recording's
+    noise floor (its 10th percentile frame level) or above
+    SILENCE_CEILING_DB. Returns one boolean per frame.
+    """
+    import numpy as np
+
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    frame_count = len(samples) // frame_length
+    if not frame_count:
+        return np.ones(1 if len(samples) else 0, dtype=bool)
+    frames = samples[: frame_count * frame_length].reshape(frame_count, frame_length)
+    # Sums of squares without a float64 copy of the whole recording
+    power = np.einsum("ij,ij->i", frames, frames) / frame_length
+    levels = 10 * np.log10(power.astype(np.float64) + 1e-12)
+    threshold = min(np.percentile(levels, 10) + margin_db, SILENCE_CEILING_DB)
+    active = levels > threshold
+    window = np.ones(2 * VAD_HANGOVER_FRAMES + 1)
+    return np.convolve(active, window, mode="same") > 0
+
+
+def silence_runs(active) -> List[Tuple[int, int]]:
+    """(start, end) frame indices of every unvoiced run"""
+    import numpy as np
+
+    edges = np.diff(np.concatenate(([0], (~active).astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1).tolist()
+    ends = np.flatnonzero(edges == -1).tolist()
+    return list(zip(starts, ends))
+
+
+def detect_silences(
+    samples, sample_rate: int, frame_seconds: float, margin_db: float
+) -> List[Tuple[float, float]]:
+    """(start, end) seconds of every silence in the audio"""
+    duration = len(samples) / sample_rate
+    active = frame_activity(samples, sample_rate, frame_seconds, margin_db)
+    return [
+        (start * frame_seconds, min(end * frame_seconds, duration))
+        for start, end in silence_runs(active)
+    ]
+
+
+def plan_kept_regions(
+    silences: Sequence[Tuple[float, float]],
+    duration: float,
+    min_silence: float,
+    keep_silence: float,
+) -> List[Tuple[float, float]]:
+    """
+    Regions of the original recording, in seconds, that survive trimming.
+
+    Silences longer than min_silence are shortened to keep_silence, half of
+    it on each side so speech keeps a little padding. Leading and trailing
+    silence is trimmed the same way.
+    """
+    pad = keep_silence / 2
+    dropped = []
+    for start, end in silences:
+        if end - start <= min_silence:
+            continue
+        drop_start = start + pad if start > 0 else start
+        drop_end = end - pad if end < duration else end
+        if drop_end > drop_start:
+            dropped.append((drop_start, drop_end))
+
+    regions = []
+    position = 0.0
+    for drop_start, drop_end in dropped:
+        if drop_start > position:
+            regions.append((position, drop_start))
+        position = drop_end
+    if position < duration:
+        regions.append((position, duration))
+    # All silence: keep the recording as it is rather than submit nothing
+    return regions or [(0.0, duration)]
+
+
+def plan_segments(
+    silences: Sequence[Tuple[float, float]],
+    duration: float,
+    segment_seconds: float,
+    overlap_seconds: float,
+) -> List[Dict[str, float]]:
+    """
+    Split audio into segments of at most segment_seconds (plus overlap).
+
+    Each cut goes into the longest silence within the last quarter before
+    the target length, or at the target itself when there is none. A
+    segment covers overlap_seconds on either side of its cuts; keep_from and
+    keep_until are the cuts, the part of the segment that is its own.
+    """
+    cuts = []
+    position = 0.0
+    while duration - position > segment_seconds:
+        target = position + segment_seconds
+        candidates = [
+            (end - start, (start + end) / 2)
+            for start, end in silences
+            if target - segment_seconds / 4 <= (start + end) / 2 <= target
+        ]
+        cut = max(candidates)[1] if candidates else target
+        cuts.append(cut)
+        position = cut
+
+    bounds = [0.0, *cuts, duration]
+    return [
+        {
+            "start": max(0.0, keep_from - overlap_seconds),
+            "end": min(duration, keep_until + overlap_seconds),
+            "keep_from": keep_from,
+            "keep_until": keep_until,
+        }
+        for keep_from, keep_until in zip(bounds, bounds[1:])
+    ]
+
+
+def build_offset_map(regions: Sequence[Tuple[float, float]]) -> List[List[float]]:
+    """
+    [normalized_start, original_start] pairs, one per kept region.
+
+    A timestamp in the trimmed audio belongs to the last pair whose
+    normalized start is not after it, and moves by that pair's difference.
+    """
+    offset_map = []
+    normalized = 0.0
+    for start, end in regions:
+        offset_map.append([round(normalized, 3), round(start, 3)])
+        normalized += end - start
+    return offset_map
+
+
+def to_original_seconds(offset_map: Sequence[Sequence[float]], seconds: float) -> float:
+    """Map a time in the trimmed audio back to the original recording"""
+    if not offset_map:
+        return seconds
+    index = bisect.bisect_right([pair[0] for pair in offset_map], seconds) - 1
+    normalized_start, original_start = offset_map[max(0, index)]
+    return original_start + seconds - normalized_start
+
+
+def shift_offset(item: Dict[str, Any], seconds: float) -> None:
+    """Move a Speech phrase or word timestamp by a number of seconds"""
+    if "offsetInTicks" not in item:
+        return
+    item["offsetInTicks"] = item["offsetInTicks"] + seconds * TICKS_PER_SECOND
+    if "offsetMilliseconds" in item:
+        item["offsetMilliseconds"] = int(round(item["offsetInTicks"] / 10_000))
+    item["offset"] = f"PT{item['offsetInTicks'] / TICKS_PER_SECOND:.2f}S"
+
+
+def phrase_words(phrase: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every word of every recognition alternative of a phrase"""
+    return [word for best in phrase.get("nBest", []) for word in best.get("words", [])]
+
+
+def remap_phrase_offsets(
+    phrases: List[Dict[str, Any]], offset_map: Sequence[Sequence[float]]
+) -> None:
+    """Move Speech phrase and word timestamps onto the original recording"""
+    if not offset_map:
+        return
+    starts = [pair[0] for pair in offset_map]
+
+    def remap(item: Dict[str, Any]) -> None:
+        if "offsetInTicks" not in item:
+            return
+        seconds = item["offsetInTicks"] / TICKS_PER_SECOND
+        index = max(0, bisect.bisect_right(starts, seconds) - 1)
+        shift_offset(item, offset_map[index][1] - offset_map[index][0])
+
+    for phrase in phrases:
+        remap(phrase)
+        for word in phrase_words(phrase):
+            remap(word)
+
+
+def encode_flac(samples, sample_rate: int) -> bytes:
+    """16-bit mono FLAC of the samples"""
+    import soundfile
+
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, sample_rate, format="FLAC", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def compute_peaks(samples, sample_rate: int, levels: Sequence[int]) -> bytes:
+    """
+    Min/max waveform peaks of mono audio at several zoom levels.
+
+    Each level splits the audio into blocks of sample_rate / peaks_per_second
+    samples and keeps the lowest and highest sample of every block, scaled to
+    int8. See PEAKS_HEADER for the layout of the returned blob.
+    """
+    import numpy as np
+
+    level_data = []
+    for peaks_per_second in levels:
+        block = max(1, int(round(sample_rate / peaks_per_second)))
+        whole = len(samples) // block
+        # A view, so two hours of audio is not copied once per level
+        blocks = samples[: whole * block].reshape(whole, block)
+        lows, highs = [blocks.min(axis=1)], [blocks.max(axis=1)]
+        tail = samples[whole * block :]
+        if len(tail):
+            lows.append(tail.min(keepdims=True))
+            highs.append(tail.max(keepdims=True))
+        pairs = np.stack((np.concatenate(lows), np.concatenate(highs)), axis=1)
+        level_data.append(
+            (
+                peaks_per_second,
+                len(pairs),
+                np.clip(np.round(pairs * 127), -128, 127).astype("<i1").tobytes(),
+            )
+        )
+
+    duration_ms = int(round(len(samples) / sample_rate * 1000))
+    blob = [PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), 0, duration_ms)]
+    offset = PEAKS_HEADER.size + PEAKS_LEVEL.size * len(level_data)
+    for peaks_per_second, count, data in level_data:
+        blob.append(PEAKS_LEVEL.pack(peaks_per_second, count, offset))
+        offset += len(data)
+    blob.extend(data for _, _, data in level_data)
+    return b"".join(blob)
+
+
+def read_peaks_header(blob: bytes) -> Dict[str, Any]:
+    """Duration and level directory of a waveform peaks blob"""
+    magic, version, level_count, _, duration_ms = PEAKS_HEADER.unpack_from(blob)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Not a version 1 waveform peaks blob")
+    levels = []
+    for index in range(level_count):
+        peaks_per_second, count, offset = PEAKS_LEVEL.unpack_from(
+            blob, PEAKS_HEADER.size + index * PEAKS_LEVEL.size
+        )
+        levels.append(
+            {"peaks_per_second": peaks_per_second, "count": count, "offset": offset}
+        )
+    return {"duration_ms": duration_ms, "levels": levels}
+
+
+def normalize_samples(samples, rate: int, config: AppConfig) -> Dict[str, Any]:
+    """
+    Turn decoded mono audio into a compact derivative for Speech.
+
+    Long silences are shortened and the result is encoded as FLAC. The
+    offset map relates timestamps in the derivative to the original
+    recording.
+
+    Audio longer than speech_segment_threshold_seconds is split into
+    overlapping segments cut at silences (see plan_segments), so Speech can
+    transcribe them in parallel; shorter audio is a single segment.
+    """
+    import numpy as np
+
+    duration = len(samples) / rate
+    frame_seconds = config.audio_vad_frame_ms / 1000
+    silences = detect_silences(samples, rate, frame_seconds, config.audio_vad_margin_db)
+    regions = plan_kept_regions(
+        silences,
+        duration,
+        config.audio_min_silence_seconds,
+        config.audio_keep_silence_seconds,
+    )
+    trimmed = np.concatenate(
+        [samples[int(start * rate) : int(end * rate)] for start, end in regions]
+    )
+
+    trimmed_duration = len(trimmed) / rate
+
+    segments = [
+        {
+            "start": 0.0,
+            "end": trimmed_duration,
+            "keep_from": 0.0,
+            "keep_until": trimmed_duration,
+        }
+    ]
+    if trimmed_duration > config.speech_segment_threshold_seconds:
+        segments = plan_segments(
+            detect_silences(trimmed, rate, frame_seconds, config.audio_vad_margin_db),
+            trimmed_duration,
+            config.speech_segment_seconds,
+            config.speech_segment_overlap_seconds,
+        )
+    for segment in segments:
+        segment["audio"] = encode_flac(
+            trimmed[int(segment["start"] * rate) : int(segment["end"] * rate)], rate
+        )
+
+    logger.info(
+        f"Normalized audio: {duration:.1f}s -> {trimmed_duration:.1f}s at {rate} Hz "
+        f"mono, {len(regions)} regions kept, {len(segments)} segments"
+    )
+    return {
+        "segments": segments,
+        "content_type": "audio/flac",
+        "offset_map": build_offset_map(regions),
+        "original_seconds": round(duration, 3),
+        "normalized_seconds": round(trimmed_duration, 3),
+    }
+
+
+def process_audio(data: bytes, extension: str, config: AppConfig) -> Dict[str, Any]:
+    """
+    Decode an uploaded recording once and derive what is enabled from it.
+
+    The audio is downmixed to mono and resampled to the target rate. The
+    result has "peaks" (see compute_peaks) when audio_peaks_enabled and the
+    normalize_samples fields when audio_normalization_enabled.
+    """
+    rate = config.audio_target_sample_rate
+    samples, source_rate = decode_audio(data, extension, rate)
+    logger.info(
+        f"Decoded {extension} audio: {len(samples) / rate:.1f}s at {source_rate} Hz"
+    )
+
+    processed: Dict[str, Any] = {}
+    if config.audio_peaks_enabled:
+        processed["peaks"] = compute_peaks(samples, rate, config.audio_peak_levels)
+    if config.audio_normalization_enabled:
+        processed.update(normalize_samples(samples, rate, config))
+    return processed
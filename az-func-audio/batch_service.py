@@ -0,0 +1,397 @@
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+from analysis_report import complete_job
+from analysis_service import build_messages
+from config import AppConfig
+from token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/chat/completions"
+COMPLETION_WINDOW = "24h"
+
+# Job statuses of the deferred analysis flow
+STATUS_DEFERRED = "analysis_deferred"
+STATUS_SUBMITTING = "analysis_submitting"
+STATUS_BATCHED = "analysis_batched"
+
+# Jobs in these statuses belong to the Batch API; pipeline messages for them
+# are redeliveries
+BATCH_STATUSES = {STATUS_DEFERRED, STATUS_SUBMITTING, STATUS_BATCHED}
+
+# Status the format stage leaves a job in, the only one a job is deferred from
+STATUS_TRANSCRIBED = "transcribed"
+
+# Jobs claimed for a batch that was never recorded, because the run that
+# claimed them died, are deferred again after this long
+STALE_SUBMITTING_SECONDS = 3600
+
+# Batches that ended without output; expired ones are resubmitted
+FAILED_BATCH_STATUSES = {"failed", "cancelled"}
+EXPIRED_BATCH_STATUSES = {"expired"}
+
+
+class BatchAnalysisService:
+    """
+    Deferred analysis through the Azure OpenAI Batch API.
+
+    Deferred jobs keep their analysis input in blob storage, where the format
+    stage wrote it. A timer collects them into one JSONL batch request file
+    per run, and later fans the batch
+    output back into the jobs, generating the PDF just like the interactive
+    path does.
+    """
+
+    def __init__(self, config: AppConfig, cosmos_service, storage_service, client):
+        self.config = config
+        self.cosmos_service = cosmos_service
+        self.storage_service = storage_service
+        # AzureOpenAI client, or InMemoryBatchClient in tests
+        self.client = client
+
+    def can_defer(self, conversation: str) -> bool:
+        """Batch requests are single calls, so map-reduce sized transcripts are not deferred"""
+        return (
+            estimate_tokens(conversation)
+            <= self.config.analysis_map_reduce_threshold_tokens
+        )
+
+    def defer(
+        self,
+        job_id: str,
+        prompts: Dict[str, str],
+        input_blob_name: str,
+        pdf_blob_name: str,
+    ) -> bool:
+        """
+        Park a job's analysis, stored in input_blob_name, until the next batch
+        submission; False when the job was already deferred
+        """
+        try:
+            self.cosmos_service.update_job_status(
+                job_id,
+                STATUS_DEFERRED,
+                expected_status=STATUS_TRANSCRIBED,
+                deferred_analysis={
+                    "input_blob_name": input_blob_name,
+                    "pdf_blob_name": pdf_blob_name,
+                    "prompts": prompts,
+                    "deferred_at": datetime.utcnow().isoformat(),
+                },
+            )
+            return True
+        except CosmosAccessConditionFailedError:
+            logger.info(f"Job {job_id} has moved on from {STATUS_TRANSCRIBED}, not deferring")
+            return False
+
+    def _job_requests(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """One batch request line per prompt of a job"""
+        deferred = job["deferred_analysis"]
+        conversation = self.storage_service.download_text(
+            self.config.storage_results_container, deferred["input_blob_name"]
+        )
+        return [
+            {
+                "custom_id": f"{job['id']}:{index}",
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": self.config.analysis_batch_deployment,
+                    "messages": build_messages(conversation, prompt),
+                },
+            }
+            for index, prompt in enumerate(deferred["prompts"].values())
+        ]
+
+    def _claim(self, job_id: str) -> bool:
+        """Take a deferred job for this run; False when another run has it"""
+        try:
+            self.cosmos_service.update_job_status(
+                job_id,
+                STATUS_SUBMITTING,
+                expected_status=STATUS_DEFERRED,
+                submitting_at=datetime.utcnow().isoformat(),
+            )
+            return True
+        except CosmosAccessConditionFailedError:
+            logger.info(f"Deferred job {job_id} was claimed by another run")
+            return False
+
+    def _release_stale_claims(self) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=STALE_SUBMITTING_SECONDS)
+        for job in self.cosmos_service.get_jobs_by_status(STATUS_SUBMITTING):
+            if datetime.fromisoformat(job["submitting_at"]) > cutoff:
+                continue
+            logger.warning(f"Deferred job {job['id']} was never batched, deferring again")
+            try:
+                self.cosmos_service.update_job_status(
+                    job["id"], STATUS_DEFERRED, expected_status=STATUS_SUBMITTING
+                )
+            except CosmosAccessConditionFailedError:
+                pass
+
+    def _submit(self, requests: List[Dict[str, Any]], job_ids: List[str]) -> int:
+        """Submit the requests of claimed jobs as one batch; returns jobs batched"""
+        try:
+            payload = "\n".join(json.dumps(request) for request in requests)
+            input_file = self.client.files.create(
+                file=("analysis_batch.jsonl", payload.encode("utf-8")), purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=COMPLETION_WINDOW,
+            )
+        except Exception:
+            # Nothing was submitted, so the next run may take the jobs again
+            for job_id in job_ids:
+                self.cosmos_service.update_job_status(
+                    job_id, STATUS_DEFERRED, expected_status=STATUS_SUBMITTING
+                )
+            raise
+        logger.info(
+            f"Submitted analysis batch {batch.id}: {len(requests)} requests, "
+            f"{len(job_ids)} jobs"
+        )
+        batched = 0
+        for job_id in job_ids:
+            try:
+                self.cosmos_service.update_job_status(
+                    job_id,
+                    STATUS_BATCHED,
+                    expected_status=STATUS_SUBMITTING,
+                    batch_id=batch.id,
+                )
+                batched += 1
+            except CosmosAccessConditionFailedError:
+                logger.warning(
+                    f"Job {job_id} was released before batch {batch.id} was recorded"
+                )
+        return batched
+
+    def submit_pending(self) -> int:
+        """
+        Submit every deferred job; returns the number of jobs submitted.
+
+        Each job is claimed before its requests join a batch, so concurrent
+        runs never submit (and bill) the same job twice.
+        """
+        self._release_stale_claims()
+        requests: List[Dict[str, Any]] = []
+        job_ids: List[str] = []
+        submitted = 0
+        for job in self.cosmos_service.get_jobs_by_status(STATUS_DEFERRED):
+            try:
+                job_requests = self._job_requests(job)
+            except Exception as e:
+                logger.error(f"Could not prepare deferred job {job['id']}: {str(e)}")
+                try:
+                    self.cosmos_service.update_job_status(
+                        job["id"],
+                        "failed",
+                        expected_status=STATUS_DEFERRED,
+                        error_message=str(e),
+                    )
+                except CosmosAccessConditionFailedError:
+                    pass
+                continue
+            if (
+                requests
+                and len(requests) + len(job_requests)
+                > self.config.analysis_batch_max_requests
+            ):
+                submitted += self._submit(requests, job_ids)
+                requests, job_ids = [], []
+            if not self._claim(job["id"]):
+                continue
+            requests.extend(job_requests)
+            job_ids.append(job["id"])
+
+        if requests:
+            submitted += self._submit(requests, job_ids)
+        return submitted
+
+    def _read_output(self, file_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        if not file_id:
+            return {}
+        content = self.client.files.content(file_id).text
+        lines = (json.loads(line) for line in content.splitlines() if line.strip())
+        return {line["custom_id"]: line for line in lines}
+
+    @staticmethod
+    def _line_result(line: Optional[Dict[str, Any]], deployment: str) -> Dict[str, Any]:
+        """Turn one batch output line into an analyze_conversation style result"""
+        response = (line or {}).get("response") or {}
+        if response.get("status_code") != 200:
+            error = (line or {}).get("error") or response.get("body") or "missing output"
+            return {
+                "analysis_text": "",
+                "raw_response": None,
+                "status": "error",
+                "error": str(error),
+            }
+        body = response["body"]
+        return {
+            "analysis_text": body["choices"][0]["message"]["content"],
+            "raw_response": body,
+            "chunk_count": 1,
+            "cache_hit": False,
+            "status": "success",
+            "tier": "batch",
+            "deployment": deployment,
+            "latency_ms": None,
+        }
+
+    def _complete_jobs(self, batch, jobs: List[Dict[str, Any]]) -> int:
+        outputs = self._read_output(batch.output_file_id)
+        outputs.update(self._read_output(batch.error_file_id))
+
+        completed = 0
+        for job in jobs:
+            deferred = job["deferred_analysis"]
+            analysis_results = {
+                key: self._line_result(
+                    outputs.get(f"{job['id']}:{index}"),
+                    self.config.analysis_batch_deployment,
+                )
+                for index, key in enumerate(deferred["prompts"])
+            }
+            try:
+                complete_job(
+                    job["id"],
+                    analysis_results,
+                    deferred["pdf_blob_name"],
+                    self.cosmos_service,
+                    self.storage_service,
+                    expected_status=STATUS_BATCHED,
+                )
+                completed += 1
+            except CosmosAccessConditionFailedError:
+                logger.info(f"Job {job['id']} was already collected by another run")
+            except Exception as e:
+                logger.error(f"Deferred analysis failed for job {job['id']}: {str(e)}")
+                self.cosmos_service.update_job_status(
+                    job["id"],
+                    "failed",
+                    expected_status=STATUS_BATCHED,
+                    error_message=str(e),
+                )
+        return completed
+
+    def collect_results(self) -> int:
+        """Fan finished batches back into their jobs; returns jobs completed"""
+        jobs_by_batch: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for job in self.cosmos_service.get_jobs_by_status(STATUS_BATCHED):
+            jobs_by_batch[job["batch_id"]].append(job)
+
+        completed = 0
+        for batch_id, jobs in jobs_by_batch.items():
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                completed += self._complete_jobs(batch, jobs)
+            elif batch.status in EXPIRED_BATCH_STATUSES:
+                logger.warning(f"Analysis batch {batch_id} expired, resubmitting jobs")
+                for job in jobs:
+                    self.cosmos_service.update_job_status(
+                        job["id"],
+                        STATUS_DEFERRED,
+                        expected_status=STATUS_BATCHED,
+                        batch_id=None,
+                    )
+            elif batch.status in FAILED_BATCH_STATUSES:
+                logger.error(f"Analysis batch {batch_id} ended as {batch.status}")
+                for job in jobs:
+                    try:
+                        self.cosmos_service.update_job_status(
+                            job["id"],
+                            "failed",
+                            expected_status=STATUS_BATCHED,
+                            error_message=f"Analysis batch {batch.status}",
+                        )
+                    except CosmosAccessConditionFailedError:
+                        logger.info(f"Job {job['id']} has moved on from batch {batch_id}")
+            else:
+                logger.info(f"Analysis batch {batch_id} is {batch.status}")
+        return completed
+
+
+class InMemoryBatchClient:
+    """
+    Local stand-in for the Batch API parts of the AzureOpenAI client.
+
+    Batches complete on the first retrieve, answering each request with
+    responder(body) -> completion text.
+    """
+
+    def __init__(self, responder: Callable[[Dict[str, Any]], str]):
+        self.responder = responder
+        self._files: Dict[str, str] = {}
+        self._batches: Dict[str, SimpleNamespace] = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(
+            create=self._create_batch, retrieve=self._retrieve_batch
+        )
+
+    def _create_file(self, file, purpose: str):
+        _, content = file
+        file_id = f"file-{uuid.uuid4().hex}"
+        self._files[file_id] = content.decode("utf-8")
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id: str):
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str):
+        batch = SimpleNamespace(
+            id=f"batch-{uuid.uuid4().hex}",
+            status="validating",
+            input_file_id=input_file_id,
+            output_file_id=None,
+            error_file_id=None,
+            created_at=int(time.time()),
+        )
+        self._batches[batch.id] = batch
+        return batch
+
+    def _retrieve_batch(self, batch_id: str):
+        batch = self._batches[batch_id]
+        if batch.status == "validating":
+            lines = []
+            for line in self._files[batch.input_file_id].splitlines():
+                request = json.loads(line)
+                lines.append(
+                    {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {
+                                "choices": [
+                                    {
+                                        "index": 0,
+                                        "message": {
+                                            "role": "assistant",
+                                            "content": self.responder(request["body"]),
+                                        },
+                                    }
+                                ]
+                            },
+                        },
+                        "error": None,
+                    }
+                )
+            output = self._create_file(
+                ("output.jsonl", "\n".join(json.dumps(l) for l in lines).encode("utf-8")),
+                purpose="batch_output",
+            )
+            batch.output_file_id = output.id
+            batch.status = "completed"
+        return batch
@@ -1,5 +1,7 @@
 import os
+import json
 import logging
+from typing import Any, Dict, List
 from dotenv import load_dotenv
 import ast
 
@@ -20,6 +22,48 @@ def get_required_env_var(var_name: str) -> str:
     return value
 
 
+def parse_deployment_tiers(
+    raw: str, default_deployment: str, default_tpm: int, default_rpm: int
+) -> List[Dict[str, Any]]:
+    """
+    Parse the analysis deployment tiers, smallest first.
+
+    `raw` is a JSON list such as
+    [{"name": "small", "deployment": "gpt-4o-mini", "max_tokens": 8000},
+     {"name": "large", "deployment": "gpt-4o"}]
+    where a tier without max_tokens takes every longer transcript. Without
+    tiers the single AZURE_OPENAI_DEPLOYMENT is used for everything.
+    """
+    if not raw:
+        return [
+            {
+                "name": "default",
+                "deployment": default_deployment,
+                "max_tokens": None,
+                "tpm_limit": default_tpm,
+                "rpm_limit": default_rpm,
+            }
+        ]
+
+    tiers = []
+    for tier in json.loads(raw):
+        if not tier.get("name") or not tier.get("deployment"):
+            raise ValueError(f"Deployment tier needs a name and a deployment: {tier}")
+        tiers.append(
+            {
+                "name": tier["name"],
+                "deployment": tier["deployment"],
+                "max_tokens": tier.get("max_tokens"),
+                "tpm_limit": int(tier.get("tpm_limit", 0)),
+                "rpm_limit": int(tier.get("rpm_limit", 0)),
+            }
+        )
+    tiers.sort(key=lambda t: float("inf") if t["max_tokens"] is None else t["max_tokens"])
+    if tiers[-1]["max_tokens"] is not None:
+        raise ValueError("The last deployment tier must not set max_tokens")
+    return tiers
+
+
 class AppConfig:
     def __init__(self):
         try:
@@ -30,6 +74,8 @@ class AppConfig:
             self.cosmos_database: str = os.getenv("AZURE_COSMOS_DB_NAME", "VoiceDB")
             self.cosmos_jobs_container: str = f"{prefix}jobs"
             self.cosmos_prompts_container: str = f"{prefix}prompts"
+            self.cosmos_analysis_cache_container: str = f"{prefix}analysis_cache"
+            self.cosmos_leases_container: str = f"{prefix}leases"
 
             # Supported Audio Extensions List
             self.supported_audio_extensions = {
@@ -55,6 +101,16 @@ class AppConfig:
             self.storage_recordings_container: str = os.getenv(
                 "AZURE_STORAGE_RECORDINGS_CONTAINER"
             )
+            # Transcripts, analysis inputs and PDFs are written here, apart
+            # from the uploaded recordings
+            self.storage_results_container: str = os.getenv(
+                "AZURE_STORAGE_RESULTS_CONTAINER", "results"
+            )
+            # Queues connecting the pipeline stages (same account by default)
+            self.storage_queue_account_url: str = os.getenv(
+                "AZURE_STORAGE_QUEUE_ACCOUNT_URL",
+                (self.storage_account_url or "").replace(".blob.", ".queue."),
+            )
 
             # Speech settings
             self.speech_max_speakers: int = int(os.getenv("AZURE_SPEECH_MAX_SPEAKERS"))
@@ -63,6 +119,110 @@ class AppConfig:
             )
 
             self.speech_deployment: str = os.getenv("AZURE_SPEECH_DEPLOYMENT")
+            self.speech_result_download_workers: int = int(
+                os.getenv("AZURE_SPEECH_RESULT_DOWNLOAD_WORKERS", "4")
+            )
+            self.speech_http_retries: int = int(
+                os.getenv("AZURE_SPEECH_HTTP_RETRIES", "3")
+            )
+            self.speech_poll_interval_seconds: int = int(
+                os.getenv("AZURE_SPEECH_POLL_INTERVAL_SECONDS", "30")
+            )
+            self.speech_poll_timeout_seconds: int = int(
+                os.getenv("AZURE_SPEECH_POLL_TIMEOUT_SECONDS", "18000")
+            )
+
+            # Recordings up to this long are transcribed synchronously by the
+            # fast transcription API instead of a batch job
+            self.speech_fast_transcription_enabled: bool = (
+                os.getenv("AZURE_SPEECH_FAST_TRANSCRIPTION_ENABLED", "true").lower()
+                == "true"
+            )
+            self.speech_fast_max_seconds: float = float(
+                os.getenv("AZURE_SPEECH_FAST_MAX_SECONDS", "300")
+            )
+            self.speech_fast_timeout_seconds: int = int(
+                os.getenv("AZURE_SPEECH_FAST_TIMEOUT_SECONDS", "120")
+            )
+
+            # Ceiling on batch transcriptions running at once across all
+            # instances, kept with expiring leases; the excess waits
+            self.speech_max_concurrent_transcriptions: int = max(
+                1, int(os.getenv("AZURE_SPEECH_MAX_CONCURRENT_TRANSCRIPTIONS", "20"))
+            )
+            self.speech_slot_lease_seconds: int = int(
+                os.getenv("AZURE_SPEECH_SLOT_LEASE_SECONDS", "900")
+            )
+            self.speech_slot_retry_seconds: int = int(
+                os.getenv("AZURE_SPEECH_SLOT_RETRY_SECONDS", "60")
+            )
+
+            # Scheduling of Speech submissions: a queue shared fairly between
+            # users, with a cap on jobs in flight overall and per user
+            self.scheduler_max_inflight_jobs: int = max(
+                1,
+                int(
+                    os.getenv(
+                        "SCHEDULER_MAX_INFLIGHT_JOBS",
+                        str(self.speech_max_concurrent_transcriptions),
+                    )
+                ),
+            )
+            self.scheduler_max_inflight_per_user: int = max(
+                1, int(os.getenv("SCHEDULER_MAX_INFLIGHT_PER_USER", "3"))
+            )
+            # Used to order jobs and estimate start times
+            self.scheduler_default_audio_seconds: float = float(
+                os.getenv("SCHEDULER_DEFAULT_AUDIO_SECONDS", "900")
+            )
+            self.scheduler_seconds_per_audio_second: float = float(
+                os.getenv("SCHEDULER_SECONDS_PER_AUDIO_SECOND", "0.5")
+            )
+            self.scheduler_job_overhead_seconds: float = float(
+                os.getenv("SCHEDULER_JOB_OVERHEAD_SECONDS", "120")
+            )
+
+            # Normalized audio longer than the threshold is split into
+            # overlapping segments that Speech transcribes in parallel
+            self.speech_segment_threshold_seconds: float = float(
+                os.getenv("AZURE_SPEECH_SEGMENT_THRESHOLD_SECONDS", "3600")
+            )
+            self.speech_segment_seconds: float = float(
+                os.getenv("AZURE_SPEECH_SEGMENT_SECONDS", "1200")
+            )
+            self.speech_segment_overlap_seconds: float = float(
+                os.getenv("AZURE_SPEECH_SEGMENT_OVERLAP_SECONDS", "15")
+            )
+
+            # Optional pre-processing of recordings before Speech: mono,
+            # resampled and with long silences shortened
+            self.audio_normalization_enabled: bool = (
+                os.getenv("AUDIO_NORMALIZATION_ENABLED", "false").lower() == "true"
+            )
+            self.audio_target_sample_rate: int = int(
+                os.getenv("AUDIO_TARGET_SAMPLE_RATE", "16000")
+            )
+            self.audio_vad_frame_ms: int = int(os.getenv("AUDIO_VAD_FRAME_MS", "30"))
+            self.audio_vad_margin_db: float = float(
+                os.getenv("AUDIO_VAD_MARGIN_DB", "10")
+            )
+            self.audio_min_silence_seconds: float = float(
+                os.getenv("AUDIO_MIN_SILENCE_SECONDS", "2.0")
+            )
+            self.audio_keep_silence_seconds: float = float(
+                os.getenv("AUDIO_KEEP_SILENCE_SECONDS", "0.5")
+            )
+
+            # Min/max waveform peaks stored next to the recording, at these
+            # zoom levels in peaks per second
+            self.audio_peaks_enabled: bool = (
+                os.getenv("AUDIO_PEAKS_ENABLED", "false").lower() == "true"
+            )
+            self.audio_peak_levels: List[int] = [
+                int(level)
+                for level in os.getenv("AUDIO_PEAK_LEVELS", "25,5,1").split(",")
+                if level.strip()
+            ]
 
             # Azure OpenAI settings
             self.azure_openai_endpoint: str = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -72,6 +232,77 @@ class AppConfig:
                 "AZURE_SPEECH_CANDIDATE_LOCALES"
             )
 
+            # Long transcripts are analysed with a map-reduce over chunks
+            self.analysis_map_reduce_threshold_tokens: int = int(
+                os.getenv("AZURE_OPENAI_MAP_REDUCE_THRESHOLD_TOKENS", "30000")
+            )
+            self.analysis_chunk_tokens: int = int(
+                os.getenv("AZURE_OPENAI_CHUNK_TOKENS", "12000")
+            )
+            self.analysis_max_parallel_chunks: int = int(
+                os.getenv("AZURE_OPENAI_MAX_PARALLEL_CHUNKS", "4")
+            )
+            self.analysis_max_concurrency: int = int(
+                os.getenv("AZURE_OPENAI_MAX_CONCURRENCY", "8")
+            )
+
+            # Compact the transcript before it is sent for analysis
+            self.analysis_transcript_compaction: bool = (
+                os.getenv("ANALYSIS_TRANSCRIPT_COMPACTION", "true").lower() == "true"
+            )
+
+            # Shared Azure OpenAI rate limiting (0 TPM disables the limiter)
+            self.azure_openai_tpm_limit: int = int(
+                os.getenv("AZURE_OPENAI_TPM_LIMIT", "0")
+            )
+            self.azure_openai_rpm_limit: int = int(
+                os.getenv("AZURE_OPENAI_RPM_LIMIT", "0")
+            )
+            self.analysis_max_completion_tokens: int = int(
+                os.getenv("AZURE_OPENAI_MAX_COMPLETION_TOKENS", "2000")
+            )
+            self.analysis_rate_limit_max_retries: int = int(
+                os.getenv("AZURE_OPENAI_RATE_LIMIT_MAX_RETRIES", "8")
+            )
+
+            # Analysis requests are routed to a deployment tier by transcript size
+            self.analysis_deployment_tiers: List[Dict[str, Any]] = parse_deployment_tiers(
+                os.getenv("AZURE_OPENAI_DEPLOYMENT_TIERS", ""),
+                self.azure_openai_deployment,
+                self.azure_openai_tpm_limit,
+                self.azure_openai_rpm_limit,
+            )
+
+            # Deferred (low priority) jobs are analysed through the Batch API
+            self.analysis_batch_deployment: str = os.getenv(
+                "AZURE_OPENAI_BATCH_DEPLOYMENT", self.azure_openai_deployment
+            )
+            self.analysis_batch_max_requests: int = int(
+                os.getenv("AZURE_OPENAI_BATCH_MAX_REQUESTS", "10000")
+            )
+
+            # Throttling of streamed partial analysis writes to the job
+            self.analysis_partial_flush_seconds: float = float(
+                os.getenv("ANALYSIS_PARTIAL_FLUSH_SECONDS", "1.0")
+            )
+            self.analysis_partial_flush_tokens: int = int(
+                os.getenv("ANALYSIS_PARTIAL_FLUSH_TOKENS", "200")
+            )
+
+            # Content-addressed cache of analysis results
+            self.analysis_cache_enabled: bool = (
+                os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+            )
+            self.analysis_cache_ttl_seconds: int = int(
+                os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600))
+            )
+
+            # Prompt subcategories are cached per warm instance; edits take
+            # up to this long to reach the pipeline
+            self.prompts_cache_ttl_seconds: int = int(
+                os.getenv("PROMPTS_CACHE_TTL_SECONDS", "300")
+            )
+
             logger.debug("AppConfig initialization completed successfully")
         except Exception as e:
             logger.error(f"Error initializing AppConfig: {str(e)}")
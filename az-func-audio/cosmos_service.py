@@ -1,16 +1,28 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+import copy
+import json
 import logging
+import threading
+import time
+from azure.core import MatchConditions
 from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosBatchOperationError,
+)
 from config import AppConfig
 from azure.identity import DefaultAzureCredential
 
 logger = logging.getLogger(__name__)
 
+# Cosmos DB accepts at most this many operations in one patch
+MAX_PATCH_OPERATIONS = 10
+
 
 class CosmosService:
-    def __init__(self, config: AppConfig):
-        credential = DefaultAzureCredential(logging_enable=True)
+    def __init__(self, config: AppConfig, credential=None):
+        credential = credential or DefaultAzureCredential(logging_enable=True)
         self.config = config
         self.client = CosmosClient(url=config.cosmos_endpoint, credential=credential)
         self.database = self.client.get_database_client(config.cosmos_database)
@@ -20,51 +32,111 @@ class CosmosService:
         self.prompts_container = self.database.get_container_client(
             config.cosmos_prompts_container
         )
+        self.analysis_cache_container = self.database.get_container_client(
+            config.cosmos_analysis_cache_container
+        )
+        self.leases_container = self.database.get_container_client(
+            config.cosmos_leases_container
+        )
+        # Subcategory documents by id, with the time they expire
+        self._subcategory_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._subcategory_cache_lock = threading.Lock()
+
+    def get_job_by_id(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get job by ID"""
+        job = self.jobs_container.read_item(item=job_id, partition_key=job_id)
+        return job if job else None
 
-    def get_file_by_blob_url(self, blob_url: str) -> Optional[Dict[str, Any]]:
-        """Get file document by name"""
-        query = "SELECT * FROM c WHERE c.file_path = @file_path"
-        files = list(
+    def get_jobs_by_status(self, status: str) -> List[Dict[str, Any]]:
+        """Get all jobs currently in a status"""
+        query = "SELECT * FROM c WHERE c.type = 'job' AND c.status = @status"
+        return list(
             self.jobs_container.query_items(
                 query=query,
-                parameters=[{"name": "@file_path", "value": blob_url}],
+                parameters=[{"name": "@status", "value": status}],
                 enable_cross_partition_query=True,
             )
         )
-        return files[0] if files else None
 
-    def get_job_by_id(self, job_id: str) -> Optional[Dict[str, Any]]:
-        """Get job by ID"""
-        job = self.jobs_container.read_item(item=job_id, partition_key=job_id)
-        return job if job else None
+    def update_job_status(
+        self,
+        job_id: str,
+        status: str,
+        expected_status: Optional[str] = None,
+        etag: Optional[str] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Update job status and additional fields.
 
-    def update_job_status(self, job_id: str, status: str, **kwargs) -> Dict[str, Any]:
-        """Update job status and additional fields"""
+        Only the given fields are sent, as a partial-document patch.
+        expected_status or etag make the transition conditional; when the job
+        has moved on, CosmosAccessConditionFailedError is raised.
+        """
         try:
-            job = self.get_job_by_id(job_id)
-            if not job:
-                raise ValueError(f"Job not found: {job_id}")
-
-            updates = {
-                "status": status,
-                "updated_at": datetime.utcnow().isoformat(),
-                **kwargs,
-            }
-            job.update(updates)
-            return self.jobs_container.upsert_item(body=job)
+            fields = {**kwargs, "updated_at": datetime.utcnow().isoformat()}
+            # Status goes last so a split patch reveals the transition only
+            # once every other field is written
+            operations = [
+                {"op": "set", "path": f"/{name}", "value": value}
+                for name, value in [*fields.items(), ("status", status)]
+            ]
+            conditions: Dict[str, Any] = {}
+            if expected_status is not None:
+                conditions["filter_predicate"] = (
+                    f"FROM c WHERE c.status = {json.dumps(expected_status)}"
+                )
+
+            if len(operations) <= MAX_PATCH_OPERATIONS:
+                if etag:
+                    conditions["etag"] = etag
+                    conditions["match_condition"] = MatchConditions.IfNotModified
+                return self.jobs_container.patch_item(
+                    item=job_id,
+                    partition_key=job_id,
+                    patch_operations=operations,
+                    **conditions,
+                )
+
+            # Larger transitions are applied as one transactional batch; the
+            # precondition on the first patch guards the whole batch
+            if etag:
+                conditions["if_match_etag"] = etag
+            chunks = [
+                operations[start : start + MAX_PATCH_OPERATIONS]
+                for start in range(0, len(operations), MAX_PATCH_OPERATIONS)
+            ]
+            batch = [("patch", (job_id, chunks[0]), conditions)] + [
+                ("patch", (job_id, chunk)) for chunk in chunks[1:]
+            ]
+            try:
+                results = self.jobs_container.execute_item_batch(
+                    batch_operations=batch, partition_key=job_id
+                )
+            except CosmosBatchOperationError as e:
+                if e.status_code == 412:
+                    raise CosmosAccessConditionFailedError(
+                        status_code=412, message=f"Job {job_id} changed: {e.message}"
+                    )
+                raise
+            return results[-1]["resourceBody"]
         except Exception as e:
             logger.error(f"Error updating job status: {str(e)}")
             raise
 
-    def get_prompts(self, subcategory_id: str) -> Dict[str, Any]:
-        """Get prompts for a subcategory"""
+    def get_subcategory(self, subcategory_id: str) -> Dict[str, Any]:
+        """Get a prompt subcategory document with its prompts and settings"""
+        with self._subcategory_cache_lock:
+            cached = self._subcategory_cache.get(subcategory_id)
+        if cached and cached[0] > time.monotonic():
+            return copy.deepcopy(cached[1])
+
         try:
             query = """
                 SELECT * FROM c 
                 WHERE c.type = 'prompt_subcategory' 
                 AND c.id = @subcategory_id
             """
-            prompts = list(
+            subcategories = list(
                 self.prompts_container.query_items(
                     query=query,
                     parameters=[{"name": "@subcategory_id", "value": subcategory_id}],
@@ -72,20 +144,31 @@ class CosmosService:
                 )
             )
 
-            if not prompts:
+            if not subcategories:
                 raise ValueError(f"No prompts found for subcategory: {subcategory_id}")
 
+            if self.config.prompts_cache_ttl_seconds > 0:
+                with self._subcategory_cache_lock:
+                    self._subcategory_cache[subcategory_id] = (
+                        time.monotonic() + self.config.prompts_cache_ttl_seconds,
+                        copy.deepcopy(subcategories[0]),
+                    )
+            return subcategories[0]
+
+        except Exception as e:
+            logger.error(f"Error retrieving subcategory: {str(e)}")
+            raise
+
+    def get_prompts(self, subcategory_id: str) -> Dict[str, str]:
+        """Get all prompts of a subcategory, keyed by prompt key"""
+        try:
             # Get all prompts from the prompts object
-            prompt_data = prompts[0].get("prompts", {})
+            prompt_data = self.get_subcategory(subcategory_id).get("prompts", {})
 
             if not prompt_data:
                 raise ValueError("No prompts found in subcategory")
 
-            # Get the first (and only) value from the prompts object
-            prompt_text = next(iter(prompt_data.values()))
-
-            # Return the entire prompts object along with metadata
-            return prompt_text
+            return prompt_data
 
         except Exception as e:
             logger.error(f"Error retrieving prompts: {str(e)}")
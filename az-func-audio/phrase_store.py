@@ -0,0 +1,142 @@
+import bisect
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List, Sequence
+
+from audio_processing import TICKS_PER_SECOND
+
+# Phrase store blob, all little-endian:
+#
+#   header   magic, version, reserved, reserved, phrase count, record bytes
+#   index    offset_ms uint32 per phrase (start in the original recording),
+#            then record_end uint32 per phrase (end of its record)
+#   records  per phrase: duration_ms uint32, confidence float32,
+#            speaker int16 (-1 when Speech gave none), channel uint8, then
+#            the phrase's UTF-8 text
+#
+# Phrases are in time order, so a time range is found by binary search over
+# the index, and any run of phrases is one contiguous byte range of records.
+PHRASE_STORE_MAGIC = b"PHRS"
+PHRASE_STORE_VERSION = 2
+PHRASE_STORE_HEADER = struct.Struct("<4sBBHII")
+PHRASE_RECORD = struct.Struct("<IfhB")
+
+NO_SPEAKER = -1
+
+
+def _column_bytes(values: Sequence[int]) -> bytes:
+    column = array("I", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column_values(data: bytes) -> array:
+    column = array("I")
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def records_start(phrase_count: int) -> int:
+    """Byte offset of the first record, just after the header and index"""
+    return PHRASE_STORE_HEADER.size + 8 * phrase_count
+
+
+def encode_phrase_store(phrases: Sequence[Dict[str, Any]]) -> bytes:
+    """Pack Speech recognized phrases into a phrase store blob"""
+    rows = sorted(
+        phrases, key=lambda p: (p.get("offsetInTicks", 0), p.get("channel", 0))
+    )
+    offsets: List[int] = []
+    ends: List[int] = []
+    records = bytearray()
+    for phrase in rows:
+        best = (phrase.get("nBest") or [{}])[0]
+        speaker = phrase.get("speaker")
+        offsets.append(
+            int(round(phrase.get("offsetInTicks", 0) * 1000 / TICKS_PER_SECOND))
+        )
+        records += PHRASE_RECORD.pack(
+            int(round(phrase.get("durationInTicks", 0) * 1000 / TICKS_PER_SECOND)),
+            best.get("confidence", 0.0),
+            NO_SPEAKER if speaker is None else int(speaker),
+            phrase.get("channel", 0),
+        )
+        records += best.get("display", "").strip().encode("utf-8")
+        ends.append(len(records))
+
+    return b"".join(
+        [
+            PHRASE_STORE_HEADER.pack(
+                PHRASE_STORE_MAGIC, PHRASE_STORE_VERSION, 0, 0, len(rows), len(records)
+            ),
+            _column_bytes(offsets),
+            _column_bytes(ends),
+            bytes(records),
+        ]
+    )
+
+
+def decode_phrase_store(data: bytes) -> Dict[str, Any]:
+    """
+    Unpack a phrase store blob into columns.
+
+    Every column is a list-like array over the phrases in time order; "text"
+    is a list of strings.
+    """
+    magic, version, _, _, count, record_bytes = PHRASE_STORE_HEADER.unpack_from(data)
+    if magic != PHRASE_STORE_MAGIC or version != PHRASE_STORE_VERSION:
+        raise ValueError(f"Unsupported phrase store version {version}")
+    start = records_start(count)
+    if len(data) < start + record_bytes:
+        raise ValueError("Phrase store is truncated")
+
+    columns: Dict[str, Any] = {
+        "offset_ms": _column_values(data[PHRASE_STORE_HEADER.size : start - 4 * count]),
+        "duration_ms": array("I"),
+        "confidence": array("f"),
+        "speaker": array("h"),
+        "channel": array("B"),
+        "text": [],
+    }
+    position = 0
+    for end in _column_values(data[start - 4 * count : start]):
+        record = start + position
+        duration_ms, confidence, speaker, channel = PHRASE_RECORD.unpack_from(
+            data, record
+        )
+        columns["duration_ms"].append(duration_ms)
+        columns["confidence"].append(confidence)
+        columns["speaker"].append(speaker)
+        columns["channel"].append(channel)
+        columns["text"].append(
+            data[record + PHRASE_RECORD.size : start + end].decode("utf-8")
+        )
+        position = end
+    return columns
+
+
+def slice_phrases(columns: Dict[str, Any], from_ms: int, to_ms: int) -> Dict[str, Any]:
+    """Columns of the phrases that start in [from_ms, to_ms)"""
+    first = bisect.bisect_left(columns["offset_ms"], from_ms)
+    last = bisect.bisect_left(columns["offset_ms"], to_ms)
+    return {name: values[first:last] for name, values in columns.items()}
+
+
+def to_recognized_phrases(columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Phrases in the Speech result layout, for TranscriptionService.format_transcription"""
+    phrases = []
+    for index, text in enumerate(columns["text"]):
+        phrase = {
+            "channel": columns["channel"][index],
+            "offsetInTicks": columns["offset_ms"][index] * TICKS_PER_SECOND // 1000,
+            "durationInTicks": columns["duration_ms"][index] * TICKS_PER_SECOND // 1000,
+            "nBest": [{"display": text, "confidence": columns["confidence"][index]}],
+        }
+        if columns["speaker"][index] != NO_SPEAKER:
+            phrase["speaker"] = columns["speaker"][index]
+        phrases.append(phrase)
+    return phrases
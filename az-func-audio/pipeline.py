@@ -0,0 +1,623 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from azure.identity import DefaultAzureCredential
+
+from analysis_report import build_report, publish_report, raise_for_failed
+from analysis_service import PartialAnalysisWriter
+from audio_processing import process_audio
+from batch_service import BATCH_STATUSES
+from config import AppConfig
+from phrase_store import encode_phrase_store
+from scheduler import STATUS_SCHEDULED, TranscriptionScheduler
+from transcript_compaction import compact_transcript, compaction_stats
+from transcription_service import FastTranscriptionRejected
+
+logger = logging.getLogger(__name__)
+
+# Stages, in order; each one is recorded in the job's completed_stages
+STAGE_SUBMIT = "submit"
+STAGE_TRANSCRIBE = "transcribe"
+STAGE_FORMAT = "format"
+STAGE_ANALYZE = "analyze"
+STAGE_FINALIZE = "finalize"
+
+# Queue feeding each stage; the backend enqueues job-dispatch messages
+JOB_DISPATCH_QUEUE = "job-dispatch"
+POLL_QUEUE = "transcription-poll"
+FORMAT_QUEUE = "transcript-format"
+ANALYZE_QUEUE = "transcript-analysis"
+FINALIZE_QUEUE = "analysis-finalize"
+
+STAGE_QUEUES = {
+    STAGE_SUBMIT: JOB_DISPATCH_QUEUE,
+    STAGE_TRANSCRIBE: POLL_QUEUE,
+    STAGE_FORMAT: FORMAT_QUEUE,
+    STAGE_ANALYZE: ANALYZE_QUEUE,
+    STAGE_FINALIZE: FINALIZE_QUEUE,
+}
+STAGE_ORDER = [STAGE_SUBMIT, STAGE_TRANSCRIBE, STAGE_FORMAT, STAGE_ANALYZE, STAGE_FINALIZE]
+
+# How a job's recording is transcribed
+ENGINE_BATCH = "batch"
+ENGINE_FAST = "fast"
+
+# Must match extensions.queues.maxDequeueCount in host.json
+MAX_DEQUEUE_COUNT = 5
+
+
+def blob_base_path(blob_url: str, container: str) -> str:
+    """Blob name without container and extension; the prefix of every artifact"""
+    path = unquote(urlparse(blob_url).path).lstrip("/")
+    if path.startswith(f"{container}/"):
+        path = path[len(container) + 1 :]
+    return os.path.splitext(path)[0]
+
+
+def speech_slot(job_id: str, index: int) -> str:
+    """Holder name of the Speech concurrency lease of one transcription of a job"""
+    return f"{job_id}/{index}"
+
+
+class QueueDispatcher:
+    """Sends stage messages to the Storage queues of the pipeline"""
+
+    def __init__(self, config: AppConfig, credential=None):
+        self.config = config
+        self.credential = credential or DefaultAzureCredential()
+        self._clients: Dict[str, Any] = {}
+
+    def _client(self, queue_name: str):
+        if queue_name not in self._clients:
+            from azure.storage.queue import QueueClient
+
+            self._clients[queue_name] = QueueClient(
+                account_url=self.config.storage_queue_account_url,
+                queue_name=queue_name,
+                credential=self.credential,
+            )
+        return self._clients[queue_name]
+
+    def send(self, queue_name: str, message: Dict[str, Any], delay_seconds: int = 0) -> None:
+        """Enqueue a message, invisible for delay_seconds"""
+        self._client(queue_name).send_message(
+            json.dumps(message), visibility_timeout=delay_seconds or None
+        )
+
+
+class InMemoryQueueDispatcher:
+    """Process-local stand-in for QueueDispatcher that records sent messages"""
+
+    def __init__(self):
+        self.sent: List[Tuple[str, Dict[str, Any], int]] = []
+
+    def send(self, queue_name: str, message: Dict[str, Any], delay_seconds: int = 0) -> None:
+        self.sent.append((queue_name, message, delay_seconds))
+
+    def pop(self) -> Tuple[str, Dict[str, Any], int]:
+        return self.sent.pop(0)
+
+
+class Pipeline:
+    """
+    The audio processing flow as separately triggered stages.
+
+    submit -> transcribe (poll) -> format -> analyze -> finalize
+
+    Every stage loads the job, skips work that completed_stages says is
+    already done, records its artifacts together with the stage name and
+    enqueues the next stage. A retried message therefore resumes from the
+    last good stage instead of starting a new Speech job.
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        cosmos_service,
+        storage_service,
+        transcription_service,
+        analysis_service,
+        dispatcher,
+        clock: Callable[[], float] = time.time,
+        speech_slots=None,
+        batch_service=None,
+    ):
+        self.config = config
+        self.cosmos_service = cosmos_service
+        self.storage_service = storage_service
+        self.transcription_service = transcription_service
+        self.analysis_service = analysis_service
+        self.dispatcher = dispatcher
+        self.clock = clock
+        self.scheduler = TranscriptionScheduler(config, cosmos_service, clock)
+        # LeaseSemaphore over running Speech transcriptions; None for no limit
+        self.speech_slots = speech_slots
+        # BatchAnalysisService for deferred jobs; None analyses them right away
+        self.batch_service = batch_service
+
+    @staticmethod
+    def _done(job: Dict[str, Any], stage: str) -> bool:
+        return stage in job.get("completed_stages", [])
+
+    def _checkpoint(
+        self, job: Dict[str, Any], stage: str, status: str, **artifacts
+    ) -> Dict[str, Any]:
+        """Record a completed stage and its artifacts on the job"""
+        stages = list(job.get("completed_stages", []))
+        if stage not in stages:
+            stages.append(stage)
+        return self.cosmos_service.update_job_status(
+            job["id"], status, completed_stages=stages, **artifacts
+        )
+
+    def _enqueue(self, stage: str, job_id: str, delay_seconds: int = 0) -> None:
+        self.dispatcher.send(STAGE_QUEUES[stage], {"job_id": job_id}, delay_seconds)
+
+    def resume(self, job: Dict[str, Any]) -> Optional[str]:
+        """Enqueue the first stage the job has not completed; returns that stage"""
+        for stage in STAGE_ORDER[1:]:
+            if not self._done(job, stage):
+                self._enqueue(stage, job["id"])
+                return stage
+        return None
+
+    def start(self, job: Dict[str, Any], blob_url: str) -> None:
+        """
+        Queue a new recording and, once the scheduler lets it through,
+        submit its Speech job and start polling it
+        """
+        if self._done(job, STAGE_SUBMIT):
+            logger.info(f"Job {job['id']} already submitted, resuming pipeline")
+            self.resume(job)
+            return
+
+        extension = os.path.splitext(urlparse(blob_url).path)[1]
+        if extension not in self.config.supported_audio_extensions:
+            # Retrying cannot fix the file type
+            self.cosmos_service.update_job_status(
+                job["id"],
+                "failed",
+                error_message=f"Unsupported audio file extension: {extension}",
+            )
+            return
+
+        if job.get("status") != STATUS_SCHEDULED:
+            # Jobs queued behind other work come back here once dispatched
+            job = self.scheduler.admit(job)
+            if not self.schedule(admitted_job_id=job["id"]):
+                logger.info(f"Job {job['id']} queued for transcription")
+                return
+
+        base_path = blob_base_path(blob_url, self.config.storage_recordings_container)
+        if job.get("prepared_segments"):
+            # Prepared by an attempt that found Speech at its ceiling
+            segments = job["prepared_segments"]
+            audio_artifacts = dict(
+                job.get("prepared_artifacts") or {},
+                prepared_segments=None,
+                prepared_artifacts=None,
+            )
+        else:
+            segments, audio_artifacts = [{"url": blob_url}], {}
+            if self.config.audio_normalization_enabled or self.config.audio_peaks_enabled:
+                segments, audio_artifacts = self._process_audio(
+                    blob_url, extension, base_path
+                )
+
+        if self._use_fast_transcription(job, segments, audio_artifacts):
+            # Nothing to submit or poll: the format stage transcribes the
+            # audio in one request
+            stages = list(job.get("completed_stages", []))
+            stages += [s for s in (STAGE_SUBMIT, STAGE_TRANSCRIBE) if s not in stages]
+            job = self.cosmos_service.update_job_status(
+                job["id"],
+                "transcribing",
+                completed_stages=stages,
+                transcription_engine=ENGINE_FAST,
+                transcription_audio_url=segments[0]["url"],
+                blob_base_path=base_path,
+                **audio_artifacts,
+            )
+            self._enqueue(STAGE_FORMAT, job["id"])
+            return
+
+        holders = [speech_slot(job["id"], index) for index in range(len(segments))]
+        if self.speech_slots and not self.speech_slots.try_acquire(holders):
+            # Waiting is cheaper than a rejected submission; the prepared
+            # audio is kept for the next attempt
+            logger.info(f"Speech is at its concurrency ceiling, job {job['id']} waits")
+            self.cosmos_service.update_job_status(
+                job["id"],
+                STATUS_SCHEDULED,
+                prepared_segments=segments,
+                prepared_artifacts=audio_artifacts,
+                submit_attempted_at=self.clock(),
+            )
+            self._enqueue(STAGE_SUBMIT, job["id"], self.config.speech_slot_retry_seconds)
+            return
+
+        # Segments are transcribed as separate Speech jobs running in parallel
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            transcription_ids = list(
+                executor.map(
+                    self.transcription_service.submit_transcription_job,
+                    [segment["url"] for segment in segments],
+                )
+            )
+        logger.debug(f"Transcription jobs submitted: Transcription IDs = {transcription_ids}")
+        if len(segments) > 1:
+            audio_artifacts["transcription_segments"] = [
+                {**segment, "transcription_id": transcription_id, "files_url": None}
+                for segment, transcription_id in zip(segments, transcription_ids)
+            ]
+        job = self._checkpoint(
+            job,
+            STAGE_SUBMIT,
+            "transcribing",
+            transcription_id=transcription_ids[0],
+            transcription_engine=ENGINE_BATCH,
+            transcription_submitted_at=self.clock(),
+            blob_base_path=base_path,
+            **audio_artifacts,
+        )
+        self._enqueue(STAGE_TRANSCRIBE, job["id"])
+
+    def _use_fast_transcription(
+        self,
+        job: Dict[str, Any],
+        segments: List[Dict[str, Any]],
+        audio_artifacts: Dict[str, Any],
+    ) -> bool:
+        """Short recordings skip the batch submit, poll and download round trips"""
+        if (
+            not self.config.speech_fast_transcription_enabled
+            or job.get("transcription_engine") == ENGINE_BATCH
+            or len(segments) != 1
+        ):
+            return False
+        duration = audio_artifacts.get("audio_normalized_seconds") or (
+            job.get("audio_metadata") or {}
+        ).get("duration_seconds")
+        return bool(duration) and duration <= self.config.speech_fast_max_seconds
+
+    def _release_speech_slots(self, job_id: str, holders: Optional[List[str]] = None) -> None:
+        """Give back the given Speech leases of a job, or all of them"""
+        if not self.speech_slots:
+            return
+        if holders is None:
+            self.speech_slots.release_prefix(speech_slot(job_id, ""))
+        elif holders:
+            self.speech_slots.release(holders)
+
+    def schedule(self, admitted_job_id: Optional[str] = None) -> bool:
+        """
+        Start the queued jobs the scheduler lets through.
+
+        Returns whether admitted_job_id is among them; the caller submits
+        that one itself, the others go through the dispatch queue.
+        """
+        started = self.scheduler.dispatch()
+        for job_id in started:
+            if job_id != admitted_job_id:
+                self._enqueue(STAGE_SUBMIT, job_id)
+        return admitted_job_id in started
+
+    def _process_audio(
+        self, blob_url: str, extension: str, base_path: str
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Store the derivatives of the recording: waveform peaks and a compact
+        version for Speech.
+
+        Returns the segments to transcribe, each with its URL, and the job
+        fields describing the derivatives. A recording that cannot be decoded
+        here is transcribed as uploaded.
+        """
+        try:
+            processed = process_audio(
+                self.storage_service.download_blob_url(blob_url), extension, self.config
+            )
+        except Exception as e:
+            logger.warning(f"Audio processing failed, using the original: {str(e)}")
+            return [{"url": blob_url}], {}
+
+        artifacts: Dict[str, Any] = {}
+        if "peaks" in processed:
+            artifacts["peaks_file_path"] = self.storage_service.upload_bytes(
+                self.config.storage_results_container,
+                f"{base_path}_peaks.bin",
+                processed["peaks"],
+                "application/octet-stream",
+            )
+        if "segments" not in processed:
+            return [{"url": blob_url}], artifacts
+
+        segments = processed["segments"]
+        for index, segment in enumerate(segments):
+            blob_name = (
+                f"{base_path}_normalized.flac"
+                if len(segments) == 1
+                else f"{base_path}_segment_{index:03d}.flac"
+            )
+            segment["url"] = self.storage_service.upload_bytes(
+                self.config.storage_results_container,
+                blob_name,
+                segment.pop("audio"),
+                processed["content_type"],
+            )
+        artifacts.update(
+            audio_offset_map=processed["offset_map"],
+            audio_original_seconds=processed["original_seconds"],
+            audio_normalized_seconds=processed["normalized_seconds"],
+        )
+        if len(segments) == 1:
+            artifacts["audio_normalized_path"] = segments[0]["url"]
+        return segments, artifacts
+
+    def poll(self, job: Dict[str, Any]) -> None:
+        """Check the Speech jobs once; re-enqueue with a delay while they run"""
+        segmented = bool(job.get("transcription_segments"))
+        segments = job.get("transcription_segments") or [
+            {"transcription_id": job["transcription_id"], "files_url": None}
+        ]
+        progressed = False
+        finished: List[str] = []
+        for index, segment in enumerate(segments):
+            if segment.get("files_url"):
+                continue
+            status_data = self.transcription_service.get_status(
+                segment["transcription_id"]
+            )
+            status = status_data.get("status")
+            if status == "Succeeded":
+                segment["files_url"] = status_data["links"]["files"]
+                finished.append(speech_slot(job["id"], index))
+                progressed = True
+            elif status == "Failed":
+                error = status_data.get("properties", {}).get("error", {})
+                # A failed Speech job will not succeed on retry
+                self.cosmos_service.update_job_status(
+                    job["id"],
+                    "failed",
+                    error_message=f"Transcription failed: {error.get('message', 'Unknown error')}",
+                )
+                self._release_speech_slots(job["id"])
+                self.schedule()
+                return
+        self._release_speech_slots(job["id"], finished)
+
+        if all(segment["files_url"] for segment in segments):
+            artifacts = (
+                {"transcription_segments": segments}
+                if segmented
+                else {"transcription_files_url": segments[0]["files_url"]}
+            )
+            job = self._checkpoint(job, STAGE_TRANSCRIBE, "transcribing", **artifacts)
+            self._enqueue(STAGE_FORMAT, job["id"])
+            self.schedule()
+        elif (
+            self.clock() - job.get("transcription_submitted_at", self.clock())
+            > self.config.speech_poll_timeout_seconds
+        ):
+            self.cosmos_service.update_job_status(
+                job["id"], "failed", error_message="Transcription timed out"
+            )
+            self._release_speech_slots(job["id"])
+            self.schedule()
+        else:
+            if self.speech_slots:
+                self.speech_slots.renew(
+                    [
+                        speech_slot(job["id"], index)
+                        for index, segment in enumerate(segments)
+                        if not segment["files_url"]
+                    ]
+                )
+            if segmented and progressed:
+                # Finished segments are not polled again
+                self.cosmos_service.update_job_status(
+                    job["id"], "transcribing", transcription_segments=segments
+                )
+            self._enqueue(
+                STAGE_TRANSCRIBE, job["id"], self.config.speech_poll_interval_seconds
+            )
+
+    def format(self, job: Dict[str, Any]) -> None:
+        """
+        Download and format the transcript, storing it, its phrase store and
+        the analysis input
+        """
+        if job.get("transcription_engine") == ENGINE_FAST:
+            audio_url = job["transcription_audio_url"]
+            try:
+                result_data = self.transcription_service.get_fast_result_data(
+                    self.storage_service.download_blob_url(audio_url),
+                    os.path.basename(unquote(urlparse(audio_url).path)),
+                    offset_map=job.get("audio_offset_map"),
+                )
+            except FastTranscriptionRejected as e:
+                logger.warning(
+                    f"Fast transcription refused job {job['id']}, using a batch job: {str(e)}"
+                )
+                self.cosmos_service.update_job_status(
+                    job["id"],
+                    STATUS_SCHEDULED,
+                    completed_stages=[
+                        stage
+                        for stage in job.get("completed_stages", [])
+                        if stage not in (STAGE_SUBMIT, STAGE_TRANSCRIBE)
+                    ],
+                    transcription_engine=ENGINE_BATCH,
+                )
+                self._enqueue(STAGE_SUBMIT, job["id"])
+                return
+        elif job.get("transcription_segments"):
+            result_data = self.transcription_service.get_segmented_result_data(
+                job["transcription_segments"], offset_map=job.get("audio_offset_map")
+            )
+        else:
+            result_data = self.transcription_service.get_result_data(
+                {"links": {"files": job["transcription_files_url"]}},
+                offset_map=job.get("audio_offset_map"),
+            )
+        formatted_text = self.transcription_service.format_transcription(result_data)
+        base_path = job["blob_base_path"]
+        container = self.config.storage_results_container
+
+        # Speech deletes its results after a while; the phrases are kept so
+        # transcripts can be re-rendered, sliced or re-analyzed without
+        # transcribing again
+        phrase_store_url = self.storage_service.upload_bytes(
+            container,
+            f"{base_path}_phrases.bin",
+            encode_phrase_store(result_data.get("recognizedPhrases", [])),
+            "application/octet-stream",
+        )
+
+        transcription_blob_url = self.storage_service.upload_text(
+            container_name=container,
+            blob_name=f"{base_path}_transcription.txt",
+            text_content=formatted_text,
+        )
+
+        # The stored transcript stays human-readable; the model gets a
+        # compacted copy with far fewer tokens
+        analysis_input = formatted_text
+        transcript_tokens = None
+        if self.config.analysis_transcript_compaction:
+            analysis_input = compact_transcript(formatted_text)
+            transcript_tokens = compaction_stats(formatted_text, analysis_input)
+            logger.info(f"Transcript compacted for analysis: {transcript_tokens}")
+        analysis_input_blob_name = f"{base_path}_analysis_input.txt"
+        self.storage_service.upload_text(
+            container_name=container,
+            blob_name=analysis_input_blob_name,
+            text_content=analysis_input,
+        )
+
+        job = self._checkpoint(
+            job,
+            STAGE_FORMAT,
+            "transcribed",
+            transcription_file_path=transcription_blob_url,
+            phrase_store_path=phrase_store_url,
+            transcript_tokens=transcript_tokens,
+            analysis_input_blob_name=analysis_input_blob_name,
+        )
+        self._enqueue(STAGE_ANALYZE, job["id"])
+
+    def analyze(self, job: Dict[str, Any]) -> None:
+        """Run every prompt of the job's subcategory against the transcript"""
+        analysis_input = self.storage_service.download_text(
+            self.config.storage_results_container, job["analysis_input_blob_name"]
+        )
+        subcategory = self.cosmos_service.get_subcategory(job["prompt_subcategory_id"])
+        prompts = subcategory.get("prompts", {})
+        if not prompts:
+            raise ValueError("No prompts found")
+        logger.debug(f"Retrieved {len(prompts)} analysis prompts successfully")
+        pdf_blob_name = f"{job['blob_base_path']}_analysis.pdf"
+
+        # Deferred jobs are analysed later through the Batch API, which
+        # completes them itself
+        if job.get("priority") == "deferred" and self.batch_service:
+            if self.batch_service.can_defer(analysis_input):
+                if self.batch_service.defer(
+                    job["id"],
+                    prompts,
+                    input_blob_name=job["analysis_input_blob_name"],
+                    pdf_blob_name=pdf_blob_name,
+                ):
+                    logger.info(f"Analysis deferred to the Batch API for Job ID = {job['id']}")
+                return
+            logger.info("Transcript too long for a single batch request, analysing now")
+
+        # Stream partial text into the job while the completions run
+        partial_writer = PartialAnalysisWriter(
+            lambda partials: self.cosmos_service.update_job_status(
+                job["id"], "analyzing", analysis_partial=partials
+            ),
+            min_interval_seconds=self.config.analysis_partial_flush_seconds,
+            flush_every_tokens=self.config.analysis_partial_flush_tokens,
+        )
+        analysis_results = self.analysis_service.analyze_prompts(
+            analysis_input,
+            prompts,
+            partial_writer=partial_writer,
+            min_tier=subcategory.get("analysis_tier"),
+        )
+        raise_for_failed(analysis_results)
+        analysis_text, analysis_sections = build_report(analysis_results)
+
+        job = self._checkpoint(
+            job,
+            STAGE_ANALYZE,
+            "analyzing",
+            analysis_text=analysis_text,
+            analysis_sections=analysis_sections,
+            analysis_pdf_blob_name=pdf_blob_name,
+        )
+        self._enqueue(STAGE_FINALIZE, job["id"])
+
+    def finalize(self, job: Dict[str, Any]) -> None:
+        """Generate the PDF from the stored analysis and complete the job"""
+        stages = list(job.get("completed_stages", [])) + [STAGE_FINALIZE]
+        publish_report(
+            job["id"],
+            job["analysis_text"],
+            job["analysis_sections"],
+            job["analysis_pdf_blob_name"],
+            self.cosmos_service,
+            self.storage_service,
+            # Stored by the analyze checkpoint
+            analysis_stored=True,
+            completed_stages=stages,
+        )
+
+    def run(self, stage: str, message: Dict[str, Any], dequeue_count: int = 1) -> None:
+        """
+        Handle one queue message for a stage.
+
+        Errors propagate so the queue retries the message; on its last
+        delivery the job is marked failed.
+        """
+        job_id = message["job_id"]
+        handlers = {
+            STAGE_SUBMIT: lambda job: self.start(
+                job, message.get("blob_url") or job["file_path"]
+            ),
+            STAGE_TRANSCRIBE: self.poll,
+            STAGE_FORMAT: self.format,
+            STAGE_ANALYZE: self.analyze,
+            STAGE_FINALIZE: self.finalize,
+        }
+        try:
+            job = self.cosmos_service.get_job_by_id(job_id)
+            if job.get("status") == "failed":
+                logger.info(f"Job {job_id} has failed, dropping {stage} message")
+                return
+            if job.get("status") in BATCH_STATUSES:
+                logger.info(f"Job {job_id} is with the Batch API, dropping {stage} message")
+                return
+            if self._done(job, stage):
+                # A redelivered message may have lost the enqueue that
+                # followed the checkpoint; first deliveries are duplicates
+                if dequeue_count > 1:
+                    logger.info(f"Stage {stage} of job {job_id} already done, resuming")
+                    self.resume(job)
+                return
+            logger.info(f"Running stage {stage} of job {job_id} (attempt {dequeue_count})")
+            handlers[stage](job)
+        except Exception as e:
+            logger.error(f"Stage {stage} of job {job_id} failed: {str(e)}", exc_info=True)
+            if dequeue_count >= MAX_DEQUEUE_COUNT:
+                self.cosmos_service.update_job_status(
+                    job_id, "failed", error_message=str(e), failed_stage=stage
+                )
+                self._release_speech_slots(job_id)
+            raise
@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+logger = logging.getLogger(__name__)
+
+# Attempts at a compare-and-swap before backing off for a moment
+MAX_SWAP_ATTEMPTS = 5
+
+# Upper bound for a single sleep so waiters re-check the shared state
+MAX_SLEEP_SECONDS = 10.0
+
+
+class CosmosStateStore:
+    """
+    Small documents in a Cosmos DB container, updated with optimistic
+    concurrency on the ETag so every Function instance sees one state.
+    """
+
+    def __init__(self, container):
+        self.container = container
+
+    def load(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Return the state document and its ETag, or (None, None)"""
+        try:
+            item = self.container.read_item(item=key, partition_key=key)
+        except CosmosResourceNotFoundError:
+            return None, None
+        return item, item.get("_etag")
+
+    def save(self, key: str, state: Dict[str, Any], etag: Optional[str]) -> bool:
+        """Write the state if nobody changed it since load; False on conflict"""
+        body = {**state, "id": key}
+        try:
+            if etag is None:
+                self.container.create_item(body=body)
+            else:
+                self.container.replace_item(
+                    item=key,
+                    body=body,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                )
+            return True
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+            return False
+
+
+class InMemoryStateStore:
+    """Process-local stand-in for CosmosStateStore"""
+
+    def __init__(self):
+        self._items: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+    def load(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        with self._lock:
+            if key not in self._items:
+                return None, None
+            state, etag = self._items[key]
+            return dict(state), etag
+
+    def save(self, key: str, state: Dict[str, Any], etag: Optional[str]) -> bool:
+        with self._lock:
+            current = self._items.get(key)
+            if (current[1] if current else None) != etag:
+                return False
+            self._version += 1
+            self._items[key] = (dict(state, id=key), str(self._version))
+            return True
+
+
+def retry_after_seconds(error: Exception, default: float) -> float:
+    """Read the server's Retry-After from an HTTP error, if it sent one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return default
+
+
+class TokenBucketRateLimiter:
+    """
+    Token and request buckets for one model deployment, shared through a
+    state store so all Function instances draw from the same TPM/RPM budget.
+
+    Callers reserve an estimate before dispatch and settle it with the
+    actual usage afterwards. When the budget is exhausted callers wait for
+    it to refill instead of failing. A 429 blocks every caller until the
+    server's Retry-After has passed.
+    """
+
+    def __init__(
+        self,
+        store,
+        key: str,
+        tokens_per_minute: int,
+        requests_per_minute: int,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.store = store
+        self.key = key
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.clock = clock
+        self.sleep = sleep
+
+    def _refill(self, state: Optional[Dict[str, Any]], now: float) -> Dict[str, Any]:
+        if not state:
+            return {
+                "tokens": float(self.tokens_per_minute),
+                "requests": float(self.requests_per_minute),
+                "updated_at": now,
+                "blocked_until": 0.0,
+            }
+        elapsed = max(0.0, now - state.get("updated_at", now))
+        return {
+            "tokens": min(
+                float(self.tokens_per_minute),
+                state.get("tokens", 0.0) + elapsed * self.tokens_per_minute / 60,
+            ),
+            "requests": min(
+                float(self.requests_per_minute),
+                state.get("requests", 0.0) + elapsed * self.requests_per_minute / 60,
+            ),
+            "updated_at": now,
+            "blocked_until": state.get("blocked_until", 0.0),
+        }
+
+    def try_acquire(self, tokens: int) -> float:
+        """Take tokens and one request from the buckets.
+
+        Returns 0 when acquired, otherwise the seconds to wait before retrying.
+        """
+        # A request larger than the whole bucket would otherwise never fit
+        tokens = min(tokens, self.tokens_per_minute)
+        for _ in range(MAX_SWAP_ATTEMPTS):
+            current, etag = self.store.load(self.key)
+            now = self.clock()
+            state = self._refill(current, now)
+
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+
+            if state["tokens"] < tokens or state["requests"] < 1:
+                return max(
+                    (tokens - state["tokens"]) * 60 / self.tokens_per_minute,
+                    (1 - state["requests"]) * 60 / self.requests_per_minute,
+                )
+
+            state["tokens"] -= tokens
+            state["requests"] -= 1
+            if self.store.save(self.key, state, etag):
+                return 0.0
+        # Lost every race; try again shortly
+        return random.uniform(0.05, 0.25)
+
+    def acquire(self, tokens: int) -> None:
+        """Block until the tokens are available"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                if waited:
+                    logger.info(
+                        f"Rate limiter {self.key} admitted request after {waited:.1f}s"
+                    )
+                return
+            wait = min(wait, MAX_SLEEP_SECONDS)
+            waited += wait
+            self.sleep(wait)
+
+    async def acquire_async(self, tokens: int) -> None:
+        """Async variant of acquire; store calls run off the event loop"""
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, tokens)
+            if not wait:
+                return
+            await asyncio.sleep(min(wait, MAX_SLEEP_SECONDS))
+
+    def _update(self, change: Callable[[Dict[str, Any], float], None]) -> None:
+        for _ in range(MAX_SWAP_ATTEMPTS):
+            current, etag = self.store.load(self.key)
+            now = self.clock()
+            state = self._refill(current, now)
+            change(state, now)
+            if self.store.save(self.key, state, etag):
+                return
+        logger.warning(f"Rate limiter {self.key} state update lost to contention")
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Return the unused part of a reservation, or charge an overrun"""
+        difference = min(reserved, self.tokens_per_minute) - used
+        if not difference:
+            return
+
+        def apply(state, now):
+            state["tokens"] = min(
+                float(self.tokens_per_minute), state["tokens"] + difference
+            )
+
+        self._update(apply)
+
+    def block_for(self, seconds: float) -> None:
+        """Stop all callers, on every instance, for the given number of seconds"""
+        logger.warning(f"Rate limiter {self.key} blocked for {seconds:.1f}s")
+
+        def apply(state, now):
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+
+        self._update(apply)
+
+
+class LeaseSemaphore:
+    """
+    A counting semaphore shared through a state store, so all Function
+    instances together hold at most capacity leases.
+
+    Leases are named by their holder and expire unless renewed, so a slot
+    held by an instance that died comes back on its own. Acquiring and
+    releasing the same holder twice is harmless.
+    """
+
+    def __init__(
+        self,
+        store,
+        key: str,
+        capacity: int,
+        lease_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.key = key
+        self.capacity = capacity
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    @staticmethod
+    def _live(state: Optional[Dict[str, Any]], now: float) -> Dict[str, float]:
+        """Unexpired leases by holder"""
+        leases = (state or {}).get("leases", {})
+        return {holder: expires for holder, expires in leases.items() if expires > now}
+
+    def _update(self, change: Callable[[Dict[str, float], float], bool]) -> bool:
+        """Apply change to the live leases; it returns False to skip the write"""
+        for _ in range(MAX_SWAP_ATTEMPTS):
+            current, etag = self.store.load(self.key)
+            now = self.clock()
+            leases = self._live(current, now)
+            if not change(leases, now):
+                return False
+            if self.store.save(self.key, {"leases": leases, "updated_at": now}, etag):
+                return True
+        logger.warning(f"Semaphore {self.key} update lost to contention")
+        return False
+
+    def try_acquire(self, holders: Sequence[str]) -> bool:
+        """
+        Take a lease for every holder, or none of them when they do not fit.
+
+        A request larger than the whole capacity is let through only when
+        nothing else holds a lease, so it cannot wait forever.
+        """
+
+        def apply(leases, now):
+            missing = [holder for holder in holders if holder not in leases]
+            fits = len(leases) + len(missing) <= self.capacity
+            alone = not leases.keys() - set(holders)
+            if not fits and not (alone and len(holders) > self.capacity):
+                return False
+            for holder in holders:
+                leases[holder] = now + self.lease_seconds
+            return True
+
+        acquired = self._update(apply)
+        if not acquired:
+            logger.info(f"Semaphore {self.key} is full, {len(holders)} leases refused")
+        return acquired
+
+    def renew(self, holders: Sequence[str]) -> None:
+        """Extend leases that are past half their lifetime"""
+
+        def apply(leases, now):
+            stale = [
+                holder
+                for holder in holders
+                if leases.get(holder, 0.0) < now + self.lease_seconds / 2
+            ]
+            for holder in stale:
+                leases[holder] = now + self.lease_seconds
+            return bool(stale)
+
+        self._update(apply)
+
+    def release(self, holders: Sequence[str]) -> None:
+        """Give back the holders' leases"""
+
+        def apply(leases, now):
+            held = [holder for holder in holders if holder in leases]
+            for holder in held:
+                del leases[holder]
+            return bool(held)
+
+        self._update(apply)
+
+    def release_prefix(self, prefix: str) -> None:
+        """Give back every lease whose holder starts with prefix"""
+
+        def apply(leases, now):
+            held = [holder for holder in leases if holder.startswith(prefix)]
+            for holder in held:
+                del leases[holder]
+            return bool(held)
+
+        self._update(apply)
+
+    def in_use(self) -> int:
+        current, _ = self.store.load(self.key)
+        return len(self._live(current, self.clock()))
@@ -0,0 +1,237 @@
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+# Job statuses before a Speech job is submitted
+STATUS_QUEUED = "queued"
+STATUS_SCHEDULED = "scheduled"
+STATUS_TRANSCRIBING = "transcribing"
+
+# Lower ranks are scheduled first; unknown priorities count as normal
+PRIORITY_RANKS = {"urgent": 0, "normal": 1, "deferred": 2}
+
+# Estimated start times that moved less than this are not rewritten
+ESTIMATE_TOLERANCE_SECONDS = 60
+
+# Scheduled jobs that have not tried to submit by then lost their dispatch
+# message
+STALE_SCHEDULED_SECONDS = 900
+
+
+def priority_rank(job: Dict[str, Any]) -> int:
+    return PRIORITY_RANKS.get(job.get("priority"), PRIORITY_RANKS["normal"])
+
+
+def expected_audio_seconds(job: Dict[str, Any], config: AppConfig) -> float:
+    """Audio duration probed at upload, or the configured default"""
+    duration = (job.get("audio_metadata") or {}).get("duration_seconds")
+    return duration or config.scheduler_default_audio_seconds
+
+
+def expected_processing_seconds(job: Dict[str, Any], config: AppConfig) -> float:
+    """How long the job's Speech transcription is expected to run"""
+    return (
+        config.scheduler_job_overhead_seconds
+        + expected_audio_seconds(job, config) * config.scheduler_seconds_per_audio_second
+    )
+
+
+def _slot_times(finishes: List[float], capacity: int, now: float) -> List[float]:
+    """
+    Times at which each of capacity slots is next free, as a heap.
+
+    While more jobs run than there are slots, the earliest finishes free no
+    slot; every later one frees one.
+    """
+    finishes = sorted(max(finish, now) for finish in finishes)
+    overflow = max(0, len(finishes) - capacity)
+    slots = finishes[overflow:] + [now] * max(0, capacity - len(finishes))
+    heapq.heapify(slots)
+    return slots
+
+
+def plan_schedule(
+    queued: List[Dict[str, Any]],
+    in_flight: List[Dict[str, Any]],
+    now: float,
+    config: AppConfig,
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Order queued jobs and estimate when each one starts.
+
+    Slots free up as in-flight jobs are expected to finish, both the global
+    ones (scheduler_max_inflight_jobs) and each user's own
+    (scheduler_max_inflight_per_user). Whenever a slot is free, the next job
+    is the head of one of the users who have a free slot of their own: the
+    most urgent one, then the one of the user who has had the fewest turns
+    so far, then the shortest. Each user's jobs are queued shortest first
+    within a priority.
+
+    Returns (job, estimated start) in start order; jobs that can start now
+    have an estimated start of now.
+    """
+    user_finishes: Dict[Any, List[float]] = defaultdict(list)
+    turns: Dict[Any, int] = defaultdict(int)
+    for job in in_flight:
+        # Scheduled jobs have yet to submit
+        started = job.get("transcription_submitted_at") or now
+        user_finishes[job.get("user_id")].append(
+            started + expected_processing_seconds(job, config)
+        )
+        turns[job.get("user_id")] += 1
+
+    waiting: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    for job in queued:
+        waiting[job.get("user_id")].append(job)
+    for jobs in waiting.values():
+        jobs.sort(
+            key=lambda job: (
+                priority_rank(job),
+                expected_audio_seconds(job, config),
+                job.get("queued_at") or now,
+            ),
+            reverse=True,
+        )
+
+    global_slots = _slot_times(
+        [finish for finishes in user_finishes.values() for finish in finishes],
+        config.scheduler_max_inflight_jobs,
+        now,
+    )
+    user_slots = {
+        user: _slot_times(user_finishes[user], config.scheduler_max_inflight_per_user, now)
+        for user in waiting
+    }
+
+    plan = []
+    while waiting and global_slots:
+        # The next moment both a global slot and some user's slot are free
+        start = max(global_slots[0], min(user_slots[user][0] for user in waiting))
+        user = min(
+            (user for user in waiting if user_slots[user][0] <= start),
+            key=lambda user: (
+                priority_rank(waiting[user][-1]),
+                turns[user],
+                expected_audio_seconds(waiting[user][-1], config),
+                waiting[user][-1].get("queued_at") or now,
+            ),
+        )
+        job = waiting[user].pop()
+        if not waiting[user]:
+            del waiting[user]
+        turns[user] += 1
+
+        finish = start + expected_processing_seconds(job, config)
+        heapq.heapreplace(global_slots, finish)
+        heapq.heapreplace(user_slots[user], finish)
+        plan.append((job, start))
+    return plan
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class TranscriptionScheduler:
+    """
+    Decides when queued jobs may submit their Speech transcription.
+
+    New jobs are queued rather than submitted straight away. Each dispatch
+    plans the whole queue (see plan_schedule), claims the jobs that may start
+    now and records the queue position and estimated start of the others on
+    their job documents. Claims are conditional on the job still being
+    queued, so concurrent dispatches never start a job twice.
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        cosmos_service,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.config = config
+        self.cosmos_service = cosmos_service
+        self.clock = clock
+
+    def admit(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a new job; a redelivered one keeps its place"""
+        if job.get("status") in (STATUS_QUEUED, STATUS_SCHEDULED):
+            return job
+        return self.cosmos_service.update_job_status(
+            job["id"], STATUS_QUEUED, queued_at=job.get("queued_at") or self.clock()
+        )
+
+    def dispatch(self) -> List[str]:
+        """
+        Claim every queued job that may start now; returns their ids, and
+        those of scheduled jobs whose dispatch message was lost.
+        """
+        now = self.clock()
+        scheduled = self.cosmos_service.get_jobs_by_status(STATUS_SCHEDULED)
+        # Jobs waiting for a Speech slot record each attempt to submit
+        started = [
+            job["id"]
+            for job in scheduled
+            if (job.get("submit_attempted_at") or job.get("scheduled_at", now))
+            < now - STALE_SCHEDULED_SECONDS
+        ]
+        queued = self.cosmos_service.get_jobs_by_status(STATUS_QUEUED)
+        if not queued:
+            return started
+
+        in_flight = scheduled + [
+            job
+            for job in self.cosmos_service.get_jobs_by_status(STATUS_TRANSCRIBING)
+            # Jobs keep this status until their transcript is formatted
+            if "transcribe" not in job.get("completed_stages", [])
+        ]
+        plan = plan_schedule(queued, in_flight, now, self.config)
+
+        position = 0
+        for job, start in plan:
+            try:
+                if start <= now:
+                    self.cosmos_service.update_job_status(
+                        job["id"],
+                        STATUS_SCHEDULED,
+                        expected_status=STATUS_QUEUED,
+                        scheduled_at=now,
+                        queue_position=None,
+                        estimated_start_at=_iso(now),
+                    )
+                    started.append(job["id"])
+                    continue
+                position += 1
+                if self._estimate_changed(job, position, start):
+                    self.cosmos_service.update_job_status(
+                        job["id"],
+                        STATUS_QUEUED,
+                        expected_status=STATUS_QUEUED,
+                        queue_position=position,
+                        estimated_start_at=_iso(start),
+                    )
+            except CosmosAccessConditionFailedError:
+                # Another dispatch got to the job first
+                logger.info(f"Job {job['id']} is no longer queued")
+        logger.info(
+            f"Scheduled {len(started)} jobs, {position} waiting "
+            f"({len(queued)} were queued)"
+        )
+        return started
+
+    @staticmethod
+    def _estimate_changed(job: Dict[str, Any], position: int, start: float) -> bool:
+        if job.get("queue_position") != position or not job.get("estimated_start_at"):
+            return True
+        estimated = datetime.fromisoformat(job["estimated_start_at"]).timestamp()
+        return abs(estimated - start) >= ESTIMATE_TOLERANCE_SECONDS
+
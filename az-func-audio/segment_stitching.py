@@ -0,0 +1,110 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Sequence, Tuple
+
+from audio_processing import TICKS_PER_SECOND, phrase_words, shift_offset
+
+logger = logging.getLogger(__name__)
+
+
+def _span(phrase: Dict[str, Any]) -> Tuple[float, float]:
+    start = phrase.get("offsetInTicks", 0) / TICKS_PER_SECOND
+    return start, start + phrase.get("durationInTicks", 0) / TICKS_PER_SECOND
+
+
+def _overlaps(phrase: Dict[str, Any], start: float, end: float) -> bool:
+    phrase_start, phrase_end = _span(phrase)
+    return phrase_start < end and phrase_end > start
+
+
+def match_speakers(
+    previous: Sequence[Dict[str, Any]], current: Sequence[Dict[str, Any]]
+) -> Dict[Any, Any]:
+    """
+    Map speaker labels of a segment onto those of the segment before it.
+
+    Both segments transcribed the overlap between them, so a local speaker
+    is the global speaker they most often talk over in time there. Every
+    global speaker is claimed at most once.
+    """
+    votes: Dict[Tuple[Any, Any], float] = defaultdict(float)
+    for before in previous:
+        before_start, before_end = _span(before)
+        for after in current:
+            after_start, after_end = _span(after)
+            shared = min(before_end, after_end) - max(before_start, after_start)
+            if shared > 0:
+                votes[(after.get("speaker"), before.get("speaker"))] += shared
+
+    mapping: Dict[Any, Any] = {}
+    for (local, known), _ in sorted(votes.items(), key=lambda item: -item[1]):
+        if local not in mapping and known not in mapping.values():
+            mapping[local] = known
+    return mapping
+
+
+def stitch_segments(
+    segment_results: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    Join the results of overlapping segment transcriptions into one result.
+
+    segment_results pairs each segment (start, end, keep_from, keep_until in
+    seconds of the segmented audio) with its merged Speech result, in
+    segment order. Offsets are moved to the segmented audio's timeline, each
+    segment contributes only the phrases that start inside its own keep
+    range, which drops the duplicates from the overlaps, and speaker labels
+    follow the first segment's numbering.
+    """
+    phrases: List[Dict[str, Any]] = []
+    previous_segment, previous_phrases = None, []
+    next_speaker = 1
+
+    for segment, result in segment_results:
+        shifted = []
+        for phrase in result.get("recognizedPhrases", []):
+            phrase = dict(phrase)
+            phrase["nBest"] = [
+                dict(best, words=[dict(word) for word in best.get("words", [])])
+                for best in phrase.get("nBest", [])
+            ]
+            shift_offset(phrase, segment["start"])
+            for word in phrase_words(phrase):
+                shift_offset(word, segment["start"])
+            shifted.append(phrase)
+
+        mapping: Dict[Any, Any] = {}
+        if previous_segment:
+            # Audio both this segment and the one before transcribed
+            shared_from, shared_until = segment["start"], previous_segment["end"]
+            mapping = match_speakers(
+                [p for p in previous_phrases if _overlaps(p, shared_from, shared_until)],
+                [p for p in shifted if _overlaps(p, shared_from, shared_until)],
+            )
+        local_speakers = {p["speaker"] for p in shifted if "speaker" in p}
+        for local in sorted(local_speakers - set(mapping), key=str):
+            mapping[local] = next_speaker
+            next_speaker += 1
+        for phrase in shifted:
+            if "speaker" in phrase:
+                phrase["speaker"] = mapping[phrase["speaker"]]
+
+        phrases.extend(
+            p
+            for p in shifted
+            if segment["keep_from"] <= _span(p)[0] < segment["keep_until"]
+        )
+        previous_segment, previous_phrases = segment, shifted
+
+    phrases.sort(key=lambda p: (p.get("offsetInTicks", 0), p.get("channel", 0)))
+    logger.info(
+        f"Stitched {len(segment_results)} segment transcriptions into "
+        f"{len(phrases)} phrases and {next_speaker - 1} speakers"
+    )
+    return {
+        "durationInTicks": max(
+            (_span(p)[1] * TICKS_PER_SECOND for p in phrases), default=0
+        ),
+        "combinedRecognizedPhrases": [],
+        "recognizedPhrases": phrases,
+    }
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from azure.identity import DefaultAzureCredential
+
+from analysis_cache import AnalysisCache
+from analysis_service import AnalysisService
+from batch_service import BatchAnalysisService
+from config import AppConfig
+from cosmos_service import CosmosService
+from pipeline import Pipeline, QueueDispatcher
+from rate_limiter import CosmosStateStore, LeaseSemaphore, TokenBucketRateLimiter
+from storage_service import StorageService
+from transcription_service import TranscriptionService
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    The services of the Function app, wired together once per host.
+
+    A warm host reuses the container across invocations, so configuration is
+    parsed once and every service shares one credential (with its token
+    cache) and keeps its connection pools.
+    """
+
+    def __init__(self, config: AppConfig, credential=None):
+        started = time.perf_counter()
+        self.config = config
+        self.credential = credential or DefaultAzureCredential()
+
+        self.cosmos_service = CosmosService(config, self.credential)
+        self.storage_service = StorageService(config, self.credential)
+        self.transcription_service = TranscriptionService(config, self.credential)
+        analysis_cache = (
+            AnalysisCache(
+                self.cosmos_service.analysis_cache_container,
+                config.analysis_cache_ttl_seconds,
+            )
+            if config.analysis_cache_enabled
+            else None
+        )
+        # One shared token bucket per deployment that has a TPM limit
+        rate_limiters = {
+            tier["deployment"]: TokenBucketRateLimiter(
+                CosmosStateStore(self.cosmos_service.leases_container),
+                key=f"openai-{tier['deployment']}",
+                tokens_per_minute=tier["tpm_limit"],
+                requests_per_minute=tier["rpm_limit"]
+                or max(1, tier["tpm_limit"] // 1000),
+            )
+            for tier in config.analysis_deployment_tiers
+            if tier["tpm_limit"]
+        }
+        self.analysis_service = AnalysisService(
+            config,
+            cache=analysis_cache,
+            rate_limiters=rate_limiters,
+            credential=self.credential,
+        )
+        self.batch_service = BatchAnalysisService(
+            config,
+            self.cosmos_service,
+            self.storage_service,
+            self.analysis_service.client,
+        )
+        self.pipeline = Pipeline(
+            config,
+            self.cosmos_service,
+            self.storage_service,
+            self.transcription_service,
+            self.analysis_service,
+            QueueDispatcher(config, self.credential),
+            speech_slots=LeaseSemaphore(
+                CosmosStateStore(self.cosmos_service.leases_container),
+                key="speech-transcriptions",
+                capacity=config.speech_max_concurrent_transcriptions,
+                lease_seconds=config.speech_slot_lease_seconds,
+            ),
+            batch_service=self.batch_service,
+        )
+
+        # Cold-start cost of wiring the services, for the startup log
+        self.init_ms = int((time.perf_counter() - started) * 1000)
+
+
+_services: Optional[ServiceContainer] = None
+_services_lock = threading.Lock()
+
+
+def get_services() -> ServiceContainer:
+    """Return the host's service container, creating it on first use"""
+    global _services
+    if _services is None:
+        with _services_lock:
+            if _services is None:
+                started = time.perf_counter()
+                config = AppConfig()
+                config_ms = int((time.perf_counter() - started) * 1000)
+                _services = ServiceContainer(config)
+                logger.info(
+                    f"Cold start: config parsed in {config_ms}ms, "
+                    f"services initialized in {_services.init_ms}ms"
+                )
+    return _services
+
+
+def reset_services() -> None:
+    """Drop the container so the next invocation builds a fresh one"""
+    global _services
+    with _services_lock:
+        _services = None
@@ -1,7 +1,13 @@
 import os
 import logging
 from typing import Optional
-from azure.storage.blob import BlobServiceClient, BlobSasPermissions, generate_blob_sas
+from azure.storage.blob import (
+    BlobClient,
+    BlobServiceClient,
+    BlobSasPermissions,
+    ContentSettings,
+    generate_blob_sas,
+)
 from azure.identity import DefaultAzureCredential
 from azure.core.exceptions import AzureError
 from datetime import datetime, timedelta
@@ -13,9 +19,9 @@ logger = logging.getLogger(__name__)
 
 
 class StorageService:
-    def __init__(self, config: AppConfig):
+    def __init__(self, config: AppConfig, credential=None):
         self.config = config
-        self.credential = DefaultAzureCredential()
+        self.credential = credential or DefaultAzureCredential()
 
         # Initialize blob service client
         self.blob_service_client = BlobServiceClient(
@@ -67,6 +73,44 @@ class StorageService:
             logger.error(f"Error uploading text: {str(e)}")
             raise
 
+    def upload_bytes(
+        self, container_name: str, blob_name: str, data: bytes, content_type: str
+    ) -> str:
+        """Upload binary content to blob storage"""
+        try:
+            blob_client = self.blob_service_client.get_blob_client(
+                container=container_name, blob=blob_name
+            )
+            blob_client.upload_blob(
+                data,
+                overwrite=True,
+                content_settings=ContentSettings(content_type=content_type),
+            )
+            return blob_client.url
+        except Exception as e:
+            logger.error(f"Error uploading bytes: {str(e)}")
+            raise
+
+    def download_blob_url(self, blob_url: str) -> bytes:
+        """Download a blob by its URL"""
+        try:
+            blob_client = BlobClient.from_blob_url(blob_url, credential=self.credential)
+            return blob_client.download_blob().readall()
+        except Exception as e:
+            logger.error(f"Error downloading blob: {str(e)}")
+            raise
+
+    def download_text(self, container_name: str, blob_name: str) -> str:
+        """Download a text blob"""
+        try:
+            blob_client = self.blob_service_client.get_blob_client(
+                container=container_name, blob=blob_name
+            )
+            return blob_client.download_blob().readall().decode("utf-8")
+        except Exception as e:
+            logger.error(f"Error downloading text: {str(e)}")
+            raise
+
     def generate_and_upload_pdf(self, analysis_text: str, blob_url: str) -> str:
         """Generate PDF from analysis text and upload to blob storage"""
         try:
@@ -92,7 +136,7 @@ class StorageService:
 
             # Upload PDF
             container_client = self.blob_service_client.get_container_client(
-                self.config.storage_recordings_container
+                self.config.storage_results_container
             )
             blob_client = container_client.get_blob_client(blob_url)
 
@@ -3,10 +3,15 @@ import sys
 # Add the parent directory to the system path to import modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from dotenv import load_dotenv
+import asyncio
 import unittest
 from unittest.mock import patch, MagicMock
-from analysis_service import AnalysisService
-from config import AppConfig
+from analysis_service import AnalysisService, PartialAnalysisWriter, split_transcript
+from analysis_cache import InMemoryAnalysisCache
+from rate_limiter import InMemoryStateStore, TokenBucketRateLimiter
+import httpx
+from openai import RateLimitError
+from config import AppConfig, parse_deployment_tiers
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 
 
@@ -63,6 +68,334 @@ class TestAnalysisService(unittest.TestCase):
         self.assertEqual(result["status"], "success")
         self.assertIn("Child expressed excitement", result["analysis_text"])
 
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_long_conversation_uses_map_reduce(self, mock_cred, mock_openai, mock_token):
+        mock_client = MagicMock()
+
+        def fake_create(model, messages):
+            response = MagicMock()
+            choice = MagicMock()
+            if "Merge the partial analyses" in messages[-1]["content"]:
+                choice.message.content = "Merged summary."
+            else:
+                choice.message.content = "Partial summary."
+            response.choices = [choice]
+            return response
+
+        mock_client.chat.completions.create.side_effect = fake_create
+        mock_openai.return_value = mock_client
+        self.config.analysis_map_reduce_threshold_tokens = 50
+        self.config.analysis_chunk_tokens = 40
+
+        conversation = "\n".join(
+            f"\n--- Speaker {i % 2 + 1} ---\n  This is sentence number {i} of the visit."
+            for i in range(10)
+        )
+        result = self.service.analyze_conversation(conversation, "Summarize this.")
+
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["analysis_text"], "Merged summary.")
+        self.assertGreater(result["chunk_count"], 1)
+        # one call per chunk plus the reduce call
+        self.assertEqual(
+            mock_client.chat.completions.create.call_count, result["chunk_count"] + 1
+        )
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AsyncAzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_async_map_reduce_bounded_by_parallel_chunks(self, mock_cred, mock_async_openai, mock_token):
+        self.config.analysis_map_reduce_threshold_tokens = 50
+        self.config.analysis_chunk_tokens = 40
+        self.config.analysis_max_parallel_chunks = 2
+        in_flight = {"current": 0, "max": 0}
+
+        async def fake_create(model, messages):
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            await asyncio.sleep(0.01)
+            in_flight["current"] -= 1
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = "Partial summary."
+            return response
+
+        mock_async_openai.return_value.chat.completions.create.side_effect = fake_create
+        conversation = "\n".join(
+            f"\n--- Speaker {i % 2 + 1} ---\n  This is sentence number {i} of the visit."
+            for i in range(10)
+        )
+
+        results = self.service.analyze_prompts(conversation, {"summary": "Summarize this."})
+
+        self.assertGreater(results["summary"]["chunk_count"], 2)
+        self.assertEqual(in_flight["max"], 2)
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_repeated_analysis_served_from_cache(self, mock_cred, mock_openai, mock_token):
+        mock_client = MagicMock()
+        mock_choice = MagicMock()
+        mock_choice.message.content = "Cached summary."
+        mock_client.chat.completions.create.return_value.choices = [mock_choice]
+        mock_openai.return_value = mock_client
+        service = AnalysisService(self.config, cache=InMemoryAnalysisCache(ttl_seconds=60))
+
+        first = service.analyze_conversation("Hello there.", "Summarize this.")
+        second = service.analyze_conversation("Hello there.", "Summarize this.")
+        other_prompt = service.analyze_conversation("Hello there.", "List actions.")
+
+        self.assertFalse(first["cache_hit"])
+        self.assertTrue(second["cache_hit"])
+        self.assertEqual(second["analysis_text"], "Cached summary.")
+        self.assertFalse(other_prompt["cache_hit"])
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_client_reused_across_analyses(self, mock_cred, mock_openai, mock_token):
+        mock_choice = MagicMock()
+        mock_choice.message.content = "Summary."
+        mock_openai.return_value.chat.completions.create.return_value.choices = [
+            mock_choice
+        ]
+
+        self.service.analyze_conversation("First visit.", "Summarize this.")
+        self.service.analyze_conversation("Second visit.", "Summarize this.")
+
+        self.assertEqual(mock_openai.call_count, 1)
+        self.assertEqual(mock_token.call_count, 1)
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_analysis_routed_to_tier_by_length(self, mock_cred, mock_openai, mock_token):
+        self.config.analysis_deployment_tiers = parse_deployment_tiers(
+            '[{"name": "large", "deployment": "gpt-4o"},'
+            ' {"name": "small", "deployment": "gpt-4o-mini", "max_tokens": 100}]',
+            "unused", 0, 0,
+        )
+        mock_choice = MagicMock()
+        mock_choice.message.content = "Summary."
+        create = mock_openai.return_value.chat.completions.create
+        create.return_value.choices = [mock_choice]
+
+        short = self.service.analyze_conversation("A short check-in.", "Summarize this.")
+        long = self.service.analyze_conversation("word " * 200, "Summarize this.")
+        forced = self.service.analyze_conversation(
+            "A short check-in.", "List actions.", min_tier="large"
+        )
+
+        self.assertEqual((short["tier"], short["deployment"]), ("small", "gpt-4o-mini"))
+        self.assertEqual((long["tier"], long["deployment"]), ("large", "gpt-4o"))
+        self.assertEqual(forced["tier"], "large")
+        self.assertGreaterEqual(short["latency_ms"], 0)
+        self.assertEqual(
+            [c.kwargs["model"] for c in create.call_args_list],
+            ["gpt-4o-mini", "gpt-4o", "gpt-4o"],
+        )
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_rate_limited_request_retried_after_retry_after(self, mock_cred, mock_openai, mock_token):
+        sleeps = []
+        clock = {"now": 1000.0}
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock["now"] += seconds
+
+        limiter = TokenBucketRateLimiter(
+            InMemoryStateStore(),
+            key="openai-test",
+            tokens_per_minute=100000,
+            requests_per_minute=100,
+            clock=lambda: clock["now"],
+            sleep=fake_sleep,
+        )
+        throttled = RateLimitError(
+            "Too many requests",
+            response=httpx.Response(
+                429,
+                headers={"retry-after": "2"},
+                request=httpx.Request("POST", "https://test-openai"),
+            ),
+            body=None,
+        )
+        ok = MagicMock()
+        ok.choices = [MagicMock()]
+        ok.choices[0].message.content = "Summary."
+        ok.usage.total_tokens = 50
+        mock_openai.return_value.chat.completions.create.side_effect = [throttled, ok]
+        service = AnalysisService(
+            self.config, rate_limiters={self.config.azure_openai_deployment: limiter}
+        )
+
+        result = service.analyze_conversation("Hello there.", "Summarize this.")
+
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(sleeps, [2.0])
+        # unused reservation was handed back after the actual usage was known
+        state, _ = limiter.store.load("openai-test")
+        self.assertGreater(state["tokens"], 100000 - 2 * 2100)
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AsyncAzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_async_analyses_bounded_by_semaphore(self, mock_cred, mock_async_openai, mock_token):
+        self.config.analysis_max_concurrency = 2
+        in_flight = {"current": 0, "max": 0}
+
+        async def fake_create(model, messages):
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            await asyncio.sleep(0.01)
+            in_flight["current"] -= 1
+            response = MagicMock()
+            choice = MagicMock()
+            choice.message.content = "Async summary."
+            response.choices = [choice]
+            return response
+
+        mock_async_openai.return_value.chat.completions.create.side_effect = fake_create
+
+        async def run_all():
+            return await asyncio.gather(
+                *(
+                    self.service.analyze_conversation_async(f"Visit {i}.", "Summarize this.")
+                    for i in range(5)
+                )
+            )
+
+        results = asyncio.run(run_all())
+
+        self.assertTrue(all(r["status"] == "success" for r in results))
+        self.assertEqual(in_flight["max"], 2)
+        self.assertEqual(mock_async_openai.call_count, 1)
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AsyncAzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_analyze_prompts_runs_every_prompt(self, mock_cred, mock_async_openai, mock_token):
+        sent_messages = []
+
+        async def fake_create(model, messages):
+            sent_messages.append(messages)
+            response = MagicMock()
+            choice = MagicMock()
+            choice.message.content = f"Answer to: {messages[-1]['content']}"
+            response.choices = [choice]
+            return response
+
+        mock_async_openai.return_value.chat.completions.create.side_effect = fake_create
+        conversation = "--- Speaker 1 ---\n  How was your week?"
+        prompts = {"summary": "Summarize this.", "actions": "List the actions."}
+
+        results = self.service.analyze_prompts(conversation, prompts)
+
+        self.assertEqual(list(results), ["summary", "actions"])
+        self.assertEqual(results["summary"]["analysis_text"], "Answer to: Summarize this.")
+        self.assertEqual(results["actions"]["analysis_text"], "Answer to: List the actions.")
+        # Transcript precedes the instructions so the prefix is shared
+        for messages in sent_messages:
+            self.assertEqual(messages[1]["content"], conversation)
+        self.assertEqual(sent_messages[0][:2], sent_messages[1][:2])
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AsyncAzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_analyses_reuse_one_async_client(self, mock_cred, mock_async_openai, mock_token):
+        async def fake_create(model, messages):
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = "Summary."
+            return response
+
+        mock_async_openai.return_value.chat.completions.create.side_effect = fake_create
+
+        for visit in ("First visit.", "Second visit.", "Third visit."):
+            results = self.service.analyze_prompts(visit, {"summary": "Summarize this."})
+            self.assertEqual(results["summary"]["status"], "success")
+
+        self.assertEqual(mock_async_openai.call_count, 1)
+        mock_async_openai.return_value.close.assert_not_called()
+
+    @patch("analysis_service.get_bearer_token_provider")
+    @patch("analysis_service.AsyncAzureOpenAI")
+    @patch("analysis_service.DefaultAzureCredential")
+    def test_streamed_analysis_flushes_partials(self, mock_cred, mock_async_openai, mock_token):
+        words = ["The ", "visit ", "went ", "well ", "overall."]
+
+        def stream_chunk(content, finish_reason=None):
+            chunk = MagicMock()
+            chunk.id = "chatcmpl-1"
+            chunk.model = "gpt-4o"
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = content
+            chunk.choices[0].finish_reason = finish_reason
+            return chunk
+
+        async def fake_stream():
+            # Content-filter results arrive first, without choices
+            filter_chunk = MagicMock()
+            filter_chunk.id, filter_chunk.model, filter_chunk.choices = "", "", []
+            yield filter_chunk
+            for word in words:
+                yield stream_chunk(word)
+            yield stream_chunk(None, "stop")
+
+        async def fake_create(model, messages, stream=False):
+            self.assertTrue(stream)
+            return fake_stream()
+
+        mock_async_openai.return_value.chat.completions.create.side_effect = fake_create
+        snapshots = []
+        writer = PartialAnalysisWriter(
+            snapshots.append, min_interval_seconds=3600, flush_every_tokens=2
+        )
+
+        results = self.service.analyze_prompts(
+            "--- Speaker 1 ---\n  Hello.", {"summary": "Summarize this."}, writer
+        )
+
+        self.assertEqual(results["summary"]["analysis_text"], "The visit went well overall.")
+        # Two flushes throttled by token count plus the final flush
+        self.assertEqual(len(snapshots), 3)
+        self.assertEqual(snapshots[0], {"summary": "The visit "})
+        self.assertEqual(snapshots[-1], {"summary": "The visit went well overall."})
+
+    def test_split_transcript_cuts_on_speaker_turns(self):
+        with open(os.path.join(DATA_DIR, "conversation.txt"), "r") as conv_file:
+            conversation = conv_file.read()
+
+        chunks = split_transcript(conversation, max_tokens=200)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("--- Speaker"))
+        # No text is lost or reordered by the split
+        original_lines = [l.strip() for l in conversation.splitlines() if l.strip()]
+        split_lines = [
+            l.strip() for chunk in chunks for l in chunk.splitlines() if l.strip()
+        ]
+        self.assertEqual(original_lines, split_lines)
+
+    def test_split_transcript_breaks_oversized_turn(self):
+        conversation = "--- Speaker 1 ---\n" + "\n".join(
+            f"  line {i} " + "x" * 40 for i in range(20)
+        )
+
+        chunks = split_transcript(conversation, max_tokens=60)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("--- Speaker 1 ---"))
+
     def test_real_conversation_summarization(self):
         # Load conversation and prompt from files
         with open(os.path.join(DATA_DIR, "conversation.txt"), "r") as conv_file:
@@ -0,0 +1,174 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from config import AppConfig
+from audio_processing import (
+    TICKS_PER_SECOND,
+    Resampler,
+    build_offset_map,
+    compute_peaks,
+    decode_audio,
+    normalize_samples,
+    plan_kept_regions,
+    plan_segments,
+    read_peaks_header,
+    remap_phrase_offsets,
+    to_original_seconds,
+)
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+class TestAudioProcessing(unittest.TestCase):
+    def test_long_silences_shortened_short_ones_kept(self):
+        regions = plan_kept_regions(
+            [(0.0, 5.0), (12.0, 13.0), (20.0, 50.0), (58.0, 60.0)],
+            duration=60.0,
+            min_silence=2.0,
+            keep_silence=0.5,
+        )
+
+        # Leading silence trimmed to the pad, the 1 s pause untouched, the
+        # 30 s gap shortened to 0.5 s; the trailing 2 s is not long enough
+        self.assertEqual(regions, [(4.75, 20.25), (49.75, 60.0)])
+
+    def test_all_silence_keeps_the_recording(self):
+        regions = plan_kept_regions([(0.0, 30.0)], 30.0, 2.0, 0.5)
+
+        self.assertEqual(regions, [(0.0, 30.0)])
+
+    def test_offset_map_maps_back_to_original_time(self):
+        offset_map = build_offset_map([(4.75, 20.25), (49.75, 60.0)])
+
+        self.assertEqual(offset_map, [[0.0, 4.75], [15.5, 49.75]])
+        self.assertAlmostEqual(to_original_seconds(offset_map, 1.0), 5.75)
+        self.assertAlmostEqual(to_original_seconds(offset_map, 16.0), 50.25)
+
+    def test_phrase_and_word_offsets_remapped(self):
+        phrase = {
+            "offset": "PT16S",
+            "offsetInTicks": 16 * TICKS_PER_SECOND,
+            "offsetMilliseconds": 16000,
+            "nBest": [{"words": [{"offsetInTicks": 16.5 * TICKS_PER_SECOND}]}],
+        }
+
+        remap_phrase_offsets([phrase], [[0.0, 4.75], [15.5, 49.75]])
+
+        self.assertEqual(phrase["offsetMilliseconds"], 50250)
+        self.assertEqual(phrase["offset"], "PT50.25S")
+        self.assertAlmostEqual(
+            phrase["nBest"][0]["words"][0]["offsetInTicks"] / TICKS_PER_SECOND, 50.75
+        )
+
+    def test_segments_cut_in_longest_nearby_silence(self):
+        segments = plan_segments(
+            [(500.0, 501.0), (560.0, 564.0), (590.0, 591.0), (1150.0, 1152.0)],
+            duration=1500.0,
+            segment_seconds=600.0,
+            overlap_seconds=10.0,
+        )
+
+        self.assertEqual(
+            [(s["keep_from"], s["keep_until"]) for s in segments],
+            [(0.0, 562.0), (562.0, 1151.0), (1151.0, 1500.0)],
+        )
+        self.assertEqual((segments[1]["start"], segments[1]["end"]), (552.0, 1161.0))
+        self.assertEqual(segments[-1]["end"], 1500.0)
+
+    def test_quiet_speaker_survives_normalization(self):
+        import numpy as np
+
+        rate = 16000
+        noise = np.random.default_rng(0).normal
+        # A loud speaker, then a quiet one (about -24 dBFS) with no pauses
+        samples = np.concatenate(
+            [noise(0, 0.3, 60 * rate), noise(0, 0.06, 60 * rate)]
+        ).astype(np.float32)
+
+        normalized = normalize_samples(samples, rate, AppConfig())
+
+        self.assertEqual(normalized["normalized_seconds"], 120.0)
+        self.assertEqual(normalized["offset_map"], [[0.0, 0.0]])
+
+    def test_pauses_between_speech_shortened(self):
+        import numpy as np
+
+        rate = 16000
+        noise = np.random.default_rng(0).normal
+        samples = np.concatenate(
+            [
+                noise(0, 0.06, 10 * rate),
+                noise(0, 0.0005, 10 * rate),
+                noise(0, 0.06, 10 * rate),
+            ]
+        ).astype(np.float32)
+
+        normalized = normalize_samples(samples, rate, AppConfig())
+
+        self.assertLess(normalized["normalized_seconds"], 22.0)
+        self.assertEqual(len(normalized["offset_map"]), 2)
+
+    def test_resampling_in_blocks_matches_one_go(self):
+        import numpy as np
+
+        samples = np.random.default_rng(0).normal(0, 0.3, 44100 * 3 + 17).astype(np.float32)
+        whole = Resampler(44100, 16000)
+        expected = np.concatenate((whole.push(samples), whole.finish()))
+
+        blocks = Resampler(44100, 16000)
+        resampled = np.concatenate(
+            [blocks.push(samples[i : i + 1000]) for i in range(0, len(samples), 1000)]
+            + [blocks.finish()]
+        )
+
+        self.assertEqual(len(resampled), int(len(samples) * 16000 / 44100))
+        np.testing.assert_array_equal(resampled, expected)
+
+    def test_stereo_wav_decoded_to_mono_at_target_rate(self):
+        import io
+        import numpy as np
+        import soundfile
+
+        rate = 48000
+        tone = 0.5 * np.sin(2 * np.pi * 440 * np.arange(25 * rate) / rate)
+        buffer = io.BytesIO()
+        soundfile.write(buffer, np.stack((tone, tone), axis=1), rate, format="WAV")
+
+        samples, source_rate = decode_audio(buffer.getvalue(), "wav", 16000)
+
+        self.assertEqual(source_rate, rate)
+        self.assertEqual(samples.dtype, np.float32)
+        self.assertEqual(len(samples), 25 * 16000)
+        self.assertAlmostEqual(float(np.abs(samples).max()), 0.5, places=2)
+
+    def test_peaks_are_block_min_max_pairs_per_level(self):
+        import numpy as np
+
+        samples = np.array([0.0, 1.0, -1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+        blob = compute_peaks(samples, sample_rate=4, levels=[2, 1])
+
+        header = read_peaks_header(blob)
+        self.assertEqual(header["duration_ms"], 1500)
+        self.assertEqual(
+            [(l["peaks_per_second"], l["count"]) for l in header["levels"]],
+            [(2, 3), (1, 2)],
+        )
+        fine, coarse = header["levels"]
+        self.assertEqual(
+            list(np.frombuffer(blob, "<i1", fine["count"] * 2, fine["offset"])),
+            [0, 127, -127, 0, 0, 0],
+        )
+        # The last block is the shorter remainder
+        self.assertEqual(
+            list(np.frombuffer(blob, "<i1", coarse["count"] * 2, coarse["offset"])),
+            [-127, 127, 0, 0],
+        )
+        self.assertEqual(len(blob), coarse["offset"] + coarse["count"] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from unittest.mock import MagicMock
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+from batch_service import (
+    BatchAnalysisService,
+    InMemoryBatchClient,
+    STATUS_BATCHED,
+    STATUS_DEFERRED,
+    STATUS_SUBMITTING,
+)
+from config import AppConfig
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+class FakeCosmos:
+    """Jobs kept in a dict, updated like CosmosService.update_job_status"""
+
+    def __init__(self, jobs):
+        self.jobs = {job["id"]: job for job in jobs}
+
+    def get_jobs_by_status(self, status):
+        return [dict(job) for job in self.jobs.values() if job["status"] == status]
+
+    def update_job_status(self, job_id, status, expected_status=None, **kwargs):
+        if expected_status is not None and self.jobs[job_id]["status"] != expected_status:
+            raise CosmosAccessConditionFailedError(status_code=412, message="status changed")
+        self.jobs[job_id].update(status=status, **kwargs)
+        return self.jobs[job_id]
+
+
+class TestBatchAnalysisService(unittest.TestCase):
+    def setUp(self):
+        self.config = AppConfig()
+        self.cosmos = FakeCosmos(
+            [
+                {"id": "job_1", "status": "transcribed"},
+                {"id": "job_2", "status": "transcribed"},
+            ]
+        )
+        self.blobs = {}
+        self.storage = MagicMock()
+        self.storage.upload_text.side_effect = (
+            lambda container_name, blob_name, text_content: self.blobs.__setitem__(
+                blob_name, text_content
+            )
+        )
+        self.storage.download_text.side_effect = (
+            lambda container_name, blob_name: self.blobs[blob_name]
+        )
+        self.storage.generate_and_upload_pdf.side_effect = (
+            lambda text, blob_name: f"https://blob/{blob_name}"
+        )
+        self.client = InMemoryBatchClient(
+            lambda body: f"Summary of: {body['messages'][-1]['content']}"
+        )
+        self.service = BatchAnalysisService(
+            self.config, self.cosmos, self.storage, self.client
+        )
+
+    def _defer(self, job_id, prompts):
+        # Written by the format stage
+        self.blobs[f"{job_id}_analysis_input.txt"] = "S1: Hello there."
+        self.service.defer(
+            job_id,
+            prompts,
+            input_blob_name=f"{job_id}_analysis_input.txt",
+            pdf_blob_name=f"{job_id}_analysis.pdf",
+        )
+
+    def test_deferred_jobs_completed_through_batch(self):
+        self._defer("job_1", {"summary": "Summarize.", "actions": "List actions."})
+        self._defer("job_2", {"summary": "Summarize."})
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], STATUS_DEFERRED)
+
+        self.assertEqual(self.service.submit_pending(), 2)
+        batch_id = self.cosmos.jobs["job_1"]["batch_id"]
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], STATUS_BATCHED)
+        self.assertEqual(self.cosmos.jobs["job_2"]["batch_id"], batch_id)
+
+        self.assertEqual(self.service.collect_results(), 2)
+
+        job = self.cosmos.jobs["job_1"]
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(
+            job["analysis_sections"]["actions"]["analysis_text"],
+            "Summary of: List actions.",
+        )
+        self.assertEqual(job["analysis_file_path"], "https://blob/job_1_analysis.pdf")
+        self.assertEqual(self.cosmos.jobs["job_2"]["analysis_tier"], "batch")
+
+    def test_large_backlog_split_into_several_batches(self):
+        self.config.analysis_batch_max_requests = 2
+        self._defer("job_1", {"summary": "Summarize.", "actions": "List actions."})
+        self._defer("job_2", {"summary": "Summarize."})
+
+        self.service.submit_pending()
+
+        self.assertNotEqual(
+            self.cosmos.jobs["job_1"]["batch_id"], self.cosmos.jobs["job_2"]["batch_id"]
+        )
+
+    def test_failed_request_fails_only_its_job(self):
+        self._defer("job_1", {"summary": "Summarize."})
+        self._defer("job_2", {"summary": "Summarize."})
+        self.service.submit_pending()
+        batch = self.client.batches.retrieve(self.cosmos.jobs["job_1"]["batch_id"])
+        output = self.client.files.content(batch.output_file_id).text.splitlines()
+        self.client._files[batch.output_file_id] = "\n".join(
+            line.replace('"status_code": 200', '"status_code": 500')
+            if '"job_2:0"' in line
+            else line
+            for line in output
+        )
+
+        self.assertEqual(self.service.collect_results(), 1)
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], "completed")
+        self.assertEqual(self.cosmos.jobs["job_2"]["status"], "failed")
+
+    def test_job_collected_by_concurrent_run_left_completed(self):
+        self._defer("job_1", {"summary": "Summarize."})
+        self.service.submit_pending()
+        stale_jobs = self.cosmos.get_jobs_by_status(STATUS_BATCHED)
+        batch = self.client.batches.retrieve(stale_jobs[0]["batch_id"])
+
+        self.assertEqual(self.service.collect_results(), 1)
+        self.assertEqual(self.service._complete_jobs(batch, stale_jobs), 0)
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], "completed")
+
+    def test_failed_batch_leaves_jobs_that_moved_on(self):
+        self._defer("job_1", {"summary": "Summarize."})
+        self._defer("job_2", {"summary": "Summarize."})
+        self.service.submit_pending()
+        batch = self.client.batches.retrieve(self.cosmos.jobs["job_1"]["batch_id"])
+        batch.status = "failed"
+        stale_jobs = self.cosmos.get_jobs_by_status(STATUS_BATCHED)
+        # Another run already completed job_1
+        self.cosmos.jobs["job_1"]["status"] = "completed"
+        self.cosmos.get_jobs_by_status = lambda status: stale_jobs
+
+        self.service.collect_results()
+
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], "completed")
+        self.assertEqual(self.cosmos.jobs["job_2"]["status"], "failed")
+
+    def test_job_claimed_by_concurrent_run_not_submitted_twice(self):
+        self._defer("job_1", {"summary": "Summarize."})
+        self._defer("job_2", {"summary": "Summarize."})
+        listed = self.cosmos.get_jobs_by_status(STATUS_DEFERRED)
+
+        def list_then_race(status):
+            if status == STATUS_DEFERRED:
+                # Another run claims job_1 after this one listed it
+                self.cosmos.jobs["job_1"]["status"] = STATUS_SUBMITTING
+                return listed
+            return []
+
+        self.cosmos.get_jobs_by_status = list_then_race
+
+        self.assertEqual(self.service.submit_pending(), 1)
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], STATUS_SUBMITTING)
+        self.assertEqual(self.cosmos.jobs["job_2"]["status"], STATUS_BATCHED)
+        batch = self.client.batches.retrieve(self.cosmos.jobs["job_2"]["batch_id"])
+        self.assertNotIn("job_1:0", self.client.files.content(batch.input_file_id).text)
+
+    def test_failed_submission_defers_jobs_again(self):
+        self._defer("job_1", {"summary": "Summarize."})
+        self.client.batches.create = MagicMock(side_effect=RuntimeError("quota"))
+
+        with self.assertRaises(RuntimeError):
+            self.service.submit_pending()
+
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], STATUS_DEFERRED)
+
+    def test_stale_claim_deferred_again(self):
+        self._defer("job_1", {"summary": "Summarize."})
+        self.cosmos.jobs["job_1"].update(
+            status=STATUS_SUBMITTING, submitting_at="2025-01-01T00:00:00"
+        )
+
+        self.assertEqual(self.service.submit_pending(), 1)
+        self.assertEqual(self.cosmos.jobs["job_1"]["status"], STATUS_BATCHED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from unittest.mock import MagicMock, patch
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosBatchOperationError,
+)
+from config import AppConfig
+from cosmos_service import CosmosService, MAX_PATCH_OPERATIONS
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+class TestCosmosService(unittest.TestCase):
+    def setUp(self):
+        with patch("cosmos_service.CosmosClient"), patch(
+            "cosmos_service.DefaultAzureCredential"
+        ):
+            self.service = CosmosService(AppConfig())
+        self.container = MagicMock()
+        self.service.jobs_container = self.container
+
+    def test_status_transition_patches_only_changed_fields(self):
+        self.service.update_job_status("job_1", "transcribed", transcription_id="tx-1")
+
+        self.container.read_item.assert_not_called()
+        self.container.upsert_item.assert_not_called()
+        kwargs = self.container.patch_item.call_args.kwargs
+        self.assertEqual(kwargs["item"], "job_1")
+        self.assertEqual(kwargs["partition_key"], "job_1")
+        self.assertEqual(
+            [(op["op"], op["path"]) for op in kwargs["patch_operations"]],
+            [("set", "/transcription_id"), ("set", "/updated_at"), ("set", "/status")],
+        )
+        self.assertEqual(kwargs["patch_operations"][-1]["value"], "transcribed")
+
+    def test_preconditions_passed_to_patch(self):
+        self.service.update_job_status(
+            "job_1", "analysis_batched", expected_status="analysis_deferred", etag='"e1"'
+        )
+
+        kwargs = self.container.patch_item.call_args.kwargs
+        self.assertEqual(
+            kwargs["filter_predicate"], 'FROM c WHERE c.status = "analysis_deferred"'
+        )
+        self.assertEqual(kwargs["etag"], '"e1"')
+        self.assertEqual(kwargs["match_condition"], MatchConditions.IfNotModified)
+
+    def test_large_transition_applied_as_one_batch(self):
+        fields = {f"field_{index}": index for index in range(MAX_PATCH_OPERATIONS)}
+        self.container.execute_item_batch.return_value = [
+            {"resourceBody": {}},
+            {"resourceBody": {"id": "job_1", "status": "completed"}},
+        ]
+
+        job = self.service.update_job_status(
+            "job_1", "completed", expected_status="analyzed", **fields
+        )
+
+        self.assertEqual(job["status"], "completed")
+        self.container.patch_item.assert_not_called()
+        batch = self.container.execute_item_batch.call_args.kwargs["batch_operations"]
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(
+            batch[0][2], {"filter_predicate": 'FROM c WHERE c.status = "analyzed"'}
+        )
+        self.assertEqual(batch[1][1][1][-1], {"op": "set", "path": "/status", "value": "completed"})
+
+    def test_failed_batch_precondition_raises_access_condition_error(self):
+        fields = {f"field_{index}": index for index in range(MAX_PATCH_OPERATIONS)}
+        self.container.execute_item_batch.side_effect = CosmosBatchOperationError(
+            error_index=0,
+            headers={},
+            status_code=412,
+            message="Precondition failed",
+            operation_responses=[],
+        )
+
+        with self.assertRaises(CosmosAccessConditionFailedError):
+            self.service.update_job_status(
+                "job_1", "completed", expected_status="analyzed", **fields
+            )
+
+    def test_subcategory_cached_between_calls(self):
+        self.service.prompts_container = MagicMock()
+        self.service.prompts_container.query_items.return_value = [
+            {"id": "sub_1", "prompts": {"summary": "Summarize."}}
+        ]
+
+        first = self.service.get_prompts("sub_1")
+        first["summary"] = "Changed by the caller."
+        second = self.service.get_prompts("sub_1")
+
+        self.assertEqual(second, {"summary": "Summarize."})
+        self.service.prompts_container.query_items.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from config import AppConfig
+from phrase_store import (
+    decode_phrase_store,
+    encode_phrase_store,
+    slice_phrases,
+    to_recognized_phrases,
+)
+from transcription_service import TranscriptionService
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+def _phrase(offset_ms, text, speaker=1, confidence=0.95, channel=0):
+    phrase = {
+        "channel": channel,
+        "offsetInTicks": offset_ms * 10_000,
+        "durationInTicks": 1_500 * 10_000,
+        "nBest": [{"display": text, "confidence": confidence}],
+    }
+    if speaker is not None:
+        phrase["speaker"] = speaker
+    return phrase
+
+
+PHRASES = [
+    _phrase(0, "Good morning."),
+    _phrase(2_000, "Morning, how are you feeling?", speaker=2),
+    _phrase(4_500, "Un peu fatigué.", confidence=0.62),
+    _phrase(7_000, "Let's take a look.", speaker=None),
+]
+
+
+class TestPhraseStore(unittest.TestCase):
+    def test_round_trip_keeps_every_field(self):
+        columns = decode_phrase_store(encode_phrase_store(PHRASES))
+
+        self.assertEqual(list(columns["offset_ms"]), [0, 2000, 4500, 7000])
+        self.assertEqual(list(columns["duration_ms"]), [1500] * 4)
+        self.assertEqual(list(columns["speaker"]), [1, 2, 1, -1])
+        self.assertEqual(list(columns["channel"]), [0] * 4)
+        self.assertAlmostEqual(columns["confidence"][2], 0.62, places=6)
+        self.assertEqual(columns["text"][2], "Un peu fatigué.")
+
+    def test_rendering_matches_speech_result(self):
+        service = TranscriptionService(AppConfig())
+        columns = decode_phrase_store(encode_phrase_store(PHRASES))
+
+        self.assertEqual(
+            service.format_transcription({"recognizedPhrases": to_recognized_phrases(columns)}),
+            service.format_transcription({"recognizedPhrases": PHRASES}),
+        )
+
+    def test_slice_by_time_range(self):
+        columns = decode_phrase_store(encode_phrase_store(PHRASES))
+
+        sliced = slice_phrases(columns, 2_000, 7_000)
+
+        self.assertEqual(sliced["text"], ["Morning, how are you feeling?", "Un peu fatigué."])
+        self.assertEqual(list(sliced["offset_ms"]), [2000, 4500])
+
+    def test_empty_transcript(self):
+        columns = decode_phrase_store(encode_phrase_store([]))
+
+        self.assertEqual(columns["text"], [])
+        self.assertEqual(len(columns["offset_ms"]), 0)
+
+    def test_rejects_other_blobs(self):
+        with self.assertRaises(ValueError):
+            decode_phrase_store(b"PEAK" + bytes(12))
+
+
+if __name__ == "__main__":
+    unittest.main()
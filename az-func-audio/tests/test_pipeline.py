@@ -0,0 +1,460 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from unittest.mock import MagicMock, patch
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+from batch_service import BatchAnalysisService, InMemoryBatchClient, STATUS_BATCHED
+from config import AppConfig
+from phrase_store import decode_phrase_store
+from rate_limiter import InMemoryStateStore, LeaseSemaphore
+from transcription_service import FastTranscriptionRejected
+from pipeline import (
+    Pipeline,
+    InMemoryQueueDispatcher,
+    MAX_DEQUEUE_COUNT,
+    POLL_QUEUE,
+    STAGE_ANALYZE,
+    STAGE_SUBMIT,
+    STAGE_FINALIZE,
+    STAGE_FORMAT,
+    STAGE_TRANSCRIBE,
+)
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+BLOB_URL = "https://teststorage.blob.core.windows.net/recordingcontainer/2025-01-01/a/a%20b.wav"
+
+RESULT = {
+    "recognizedPhrases": [
+        {
+            "channel": 0,
+            "speaker": 1,
+            "offsetInTicks": 12_000_000,
+            "durationInTicks": 9_000_000,
+            "nBest": [{"display": "Hello.", "confidence": 0.5}],
+        }
+    ]
+}
+
+QUEUE_STAGES = {
+    "job-dispatch": STAGE_SUBMIT,
+    "transcription-poll": STAGE_TRANSCRIBE,
+    "transcript-format": STAGE_FORMAT,
+    "transcript-analysis": STAGE_ANALYZE,
+    "analysis-finalize": STAGE_FINALIZE,
+}
+
+
+class FakeCosmos:
+    def __init__(self, job):
+        self.job = job
+        self.get_subcategory = MagicMock(return_value={"prompts": {"summary": "Summarize."}})
+
+    def get_job_by_id(self, job_id):
+        return dict(self.job)
+
+    def get_jobs_by_status(self, status):
+        return [dict(self.job)] if self.job["status"] == status else []
+
+    def update_job_status(self, job_id, status, expected_status=None, **kwargs):
+        if expected_status is not None and self.job["status"] != expected_status:
+            raise CosmosAccessConditionFailedError(status_code=412, message="status changed")
+        self.job.update(status=status, **kwargs)
+        return dict(self.job)
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.config = AppConfig()
+        self.config.analysis_transcript_compaction = False
+        self.config.speech_fast_transcription_enabled = False
+        self.cosmos = FakeCosmos(
+            {"id": "job_1", "status": "uploaded", "prompt_subcategory_id": "sub_1", "file_path": BLOB_URL}
+        )
+        self.blobs = {}
+        self.storage = MagicMock()
+        self.storage.upload_text.side_effect = self._upload
+        self.storage.upload_bytes.side_effect = self._upload_bytes
+        self.storage.download_text.side_effect = lambda container, name: self.blobs[name]
+        self.storage.generate_and_upload_pdf.return_value = "https://blob/a_analysis.pdf"
+        self.transcription = MagicMock()
+        self.transcription.submit_transcription_job.return_value = "tx-1"
+        self.transcription.get_status.side_effect = [
+            {"status": "Running"},
+            {"status": "Succeeded", "links": {"files": "https://speech/files"}},
+        ]
+        self.transcription.get_result_data.return_value = RESULT
+        self.transcription.get_segmented_result_data.return_value = RESULT
+        self.transcription.get_fast_result_data.return_value = RESULT
+        self.transcription.format_transcription.return_value = "--- Speaker 1 ---\n  Hello."
+        self.analysis = MagicMock()
+        self.analysis.analyze_prompts.return_value = {
+            "summary": {"analysis_text": "A greeting.", "status": "success"}
+        }
+        self.queues = InMemoryQueueDispatcher()
+        self.pipeline = Pipeline(
+            self.config,
+            self.cosmos,
+            self.storage,
+            self.transcription,
+            self.analysis,
+            self.queues,
+            clock=lambda: 1000.0,
+        )
+
+    def _upload(self, container_name, blob_name, text_content):
+        self.blobs[blob_name] = text_content
+        return f"https://blob/{blob_name}"
+
+    def _upload_bytes(self, container_name, blob_name, data, content_type):
+        self.blobs[blob_name] = data
+        return f"https://blob/{blob_name}"
+
+    def _drain(self):
+        """Deliver queued messages until the queues are empty"""
+        while self.queues.sent:
+            queue_name, message, _ = self.queues.pop()
+            self.pipeline.run(QUEUE_STAGES[queue_name], message)
+
+    def test_job_runs_through_every_stage(self):
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        self._drain()
+
+        job = self.cosmos.job
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(
+            job["completed_stages"],
+            ["submit", "transcribe", "format", "analyze", "finalize"],
+        )
+        self.assertEqual(job["transcription_file_path"], "https://blob/2025-01-01/a/a b_transcription.txt")
+        self.assertEqual(job["analysis_text"], "A greeting.")
+        self.transcription.format_transcription.assert_called_once_with(RESULT)
+
+    def test_deferred_job_handed_to_batch_service(self):
+        self.cosmos.job["priority"] = "deferred"
+        self.pipeline.batch_service = MagicMock()
+        self.pipeline.batch_service.can_defer.return_value = True
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        self._drain()
+
+        self.pipeline.batch_service.defer.assert_called_once_with(
+            "job_1",
+            {"summary": "Summarize."},
+            input_blob_name="2025-01-01/a/a b_analysis_input.txt",
+            pdf_blob_name="2025-01-01/a/a b_analysis.pdf",
+        )
+        self.analysis.analyze_prompts.assert_not_called()
+        # The analysis input is only written once, by the format stage
+        self.assertEqual(
+            [c.kwargs["blob_name"] for c in self.storage.upload_text.call_args_list].count(
+                "2025-01-01/a/a b_analysis_input.txt"
+            ),
+            1,
+        )
+
+    def test_redelivered_analysis_of_deferred_job_batched_once(self):
+        self.cosmos.job["priority"] = "deferred"
+        client = InMemoryBatchClient(lambda body: "A greeting.")
+        client.batches.create = MagicMock(wraps=client.batches.create)
+        batch_service = BatchAnalysisService(self.config, self.cosmos, self.storage, client)
+        self.pipeline.batch_service = batch_service
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+        self._drain()
+        job = self.cosmos.get_job_by_id("job_1")
+
+        # Redelivered after the job was deferred, and again after it was batched
+        self.pipeline.analyze(job)
+        batch_service.submit_pending()
+        self.pipeline.analyze(job)
+        self.pipeline.run(STAGE_ANALYZE, {"job_id": "job_1"}, dequeue_count=2)
+        self.assertEqual(batch_service.submit_pending(), 0)
+
+        client.batches.create.assert_called_once()
+        self.assertEqual(self.cosmos.job["status"], STATUS_BATCHED)
+        self.assertEqual(batch_service.collect_results(), 1)
+        self.assertEqual(self.cosmos.job["status"], "completed")
+
+    def test_completion_does_not_resend_stored_analysis(self):
+        updates = []
+        update_job_status = self.cosmos.update_job_status
+
+        def record(job_id, status, **kwargs):
+            updates.append((status, kwargs))
+            return update_job_status(job_id, status, **kwargs)
+
+        self.cosmos.update_job_status = record
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        self._drain()
+
+        status, fields = updates[-1]
+        self.assertEqual(status, "completed")
+        self.assertNotIn("analysis_text", fields)
+        self.assertNotIn("analysis_sections", fields)
+        self.assertEqual(fields["analysis_file_path"], "https://blob/a_analysis.pdf")
+        self.assertEqual(self.cosmos.job["analysis_text"], "A greeting.")
+
+    def test_phrases_kept_next_to_transcript(self):
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        self._drain()
+
+        self.assertEqual(
+            self.cosmos.job["phrase_store_path"], "https://blob/2025-01-01/a/a b_phrases.bin"
+        )
+        columns = decode_phrase_store(self.blobs["2025-01-01/a/a b_phrases.bin"])
+        self.assertEqual(list(columns["offset_ms"]), [1200])
+        self.assertEqual(list(columns["speaker"]), [1])
+        self.assertEqual(columns["text"], ["Hello."])
+
+    def test_queued_job_submitted_once_dispatched(self):
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        with patch.object(self.pipeline.scheduler, "dispatch", return_value=[]):
+            self._drain()
+
+        self.assertEqual(self.cosmos.job["status"], "queued")
+        self.transcription.submit_transcription_job.assert_not_called()
+
+        # A slot frees up elsewhere
+        self.pipeline.schedule()
+        self._drain()
+
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        self.transcription.submit_transcription_job.assert_called_once_with(BLOB_URL)
+
+    def test_submission_waits_for_a_speech_slot(self):
+        self.config.audio_normalization_enabled = True
+        self.storage.download_blob_url.return_value = b"RIFF"
+        normalized = {
+            "segments": [{"audio": b"fLaC", "start": 0.0, "end": 5.0, "keep_from": 0.0, "keep_until": 5.0}],
+            "content_type": "audio/flac",
+            "offset_map": [[0.0, 0.0]],
+            "original_seconds": 5.0,
+            "normalized_seconds": 5.0,
+        }
+        slots = LeaseSemaphore(InMemoryStateStore(), "speech", capacity=1, lease_seconds=600)
+        self.pipeline.speech_slots = slots
+        slots.try_acquire(["other_job/0"])
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        with patch("pipeline.process_audio", return_value=normalized) as process:
+            self.pipeline.run(STAGE_SUBMIT, self.queues.pop()[1])
+
+            self.transcription.submit_transcription_job.assert_not_called()
+            self.assertEqual(
+                self.queues.sent,
+                [("job-dispatch", {"job_id": "job_1"}, self.config.speech_slot_retry_seconds)],
+            )
+
+            slots.release(["other_job/0"])
+            self._drain()
+
+        # The audio prepared by the first attempt is reused
+        self.assertEqual(process.call_count, 1)
+        self.transcription.submit_transcription_job.assert_called_once_with(
+            "https://blob/2025-01-01/a/a b_normalized.flac"
+        )
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        self.assertEqual(self.cosmos.job["audio_offset_map"], [[0.0, 0.0]])
+        self.assertIsNone(self.cosmos.job["prepared_segments"])
+        # The slot was given back when the transcription succeeded
+        self.assertEqual(slots.in_use(), 0)
+
+    def test_short_recording_transcribed_in_one_request(self):
+        self.config.speech_fast_transcription_enabled = True
+        self.cosmos.job["audio_metadata"] = {"duration_seconds": 95.0}
+        self.storage.download_blob_url.return_value = b"RIFF"
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        self._drain()
+
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        self.assertEqual(self.cosmos.job["transcription_engine"], "fast")
+        self.transcription.submit_transcription_job.assert_not_called()
+        self.transcription.get_status.assert_not_called()
+        self.storage.download_blob_url.assert_called_once_with(BLOB_URL)
+        self.assertEqual(self.transcription.get_fast_result_data.call_args.args, (b"RIFF", "a b.wav"))
+        self.assertEqual(self.blobs["2025-01-01/a/a b_transcription.txt"], "--- Speaker 1 ---\n  Hello.")
+
+    def test_refused_fast_transcription_falls_back_to_batch(self):
+        self.config.speech_fast_transcription_enabled = True
+        self.cosmos.job["audio_metadata"] = {"duration_seconds": 95.0}
+        self.transcription.get_fast_result_data.side_effect = FastTranscriptionRejected("413")
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        self._drain()
+
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        self.assertEqual(self.cosmos.job["transcription_engine"], "batch")
+        self.transcription.submit_transcription_job.assert_called_once_with(BLOB_URL)
+
+    def test_running_transcription_polled_again_later(self):
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+        self.pipeline.run(STAGE_SUBMIT, self.queues.pop()[1])
+        queue_name, message, _ = self.queues.pop()
+
+        self.pipeline.run(STAGE_TRANSCRIBE, message)
+
+        self.assertEqual(
+            self.queues.sent,
+            [(POLL_QUEUE, {"job_id": "job_1"}, self.config.speech_poll_interval_seconds)],
+        )
+
+    def test_retry_resumes_from_last_good_stage(self):
+        self.storage.generate_and_upload_pdf.side_effect = [
+            RuntimeError("PDF failed"),
+            "https://blob/a_analysis.pdf",
+        ]
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+        while self.queues.sent[0][0] != "analysis-finalize":
+            queue_name, message, _ = self.queues.pop()
+            self.pipeline.run(QUEUE_STAGES[queue_name], message)
+        _, message, _ = self.queues.pop()
+
+        with self.assertRaises(RuntimeError):
+            self.pipeline.run(STAGE_FINALIZE, message, dequeue_count=1)
+        self.pipeline.run(STAGE_FINALIZE, message, dequeue_count=2)
+
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        self.assertEqual(self.transcription.submit_transcription_job.call_count, 1)
+        self.assertEqual(self.analysis.analyze_prompts.call_count, 1)
+
+    def test_normalized_audio_submitted_with_offset_map(self):
+        self.config.audio_normalization_enabled = True
+        self.storage.download_blob_url.return_value = b"RIFF"
+        normalized = {
+            "segments": [
+                {"audio": b"fLaC", "start": 0.0, "end": 25.0, "keep_from": 0.0, "keep_until": 25.0}
+            ],
+            "content_type": "audio/flac",
+            "offset_map": [[0.0, 0.0], [10.0, 25.0]],
+            "original_seconds": 40.0,
+            "normalized_seconds": 25.0,
+        }
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        with patch("pipeline.process_audio", return_value=normalized):
+            self._drain()
+
+        self.transcription.submit_transcription_job.assert_called_once_with(
+            "https://blob/2025-01-01/a/a b_normalized.flac"
+        )
+        self.assertEqual(self.cosmos.job["audio_normalized_seconds"], 25.0)
+        self.assertEqual(
+            self.transcription.get_result_data.call_args.kwargs["offset_map"],
+            [[0.0, 0.0], [10.0, 25.0]],
+        )
+
+    def test_long_audio_transcribed_in_parallel_segments(self):
+        self.config.audio_normalization_enabled = True
+        self.storage.download_blob_url.return_value = b"RIFF"
+        self.transcription.submit_transcription_job.side_effect = ["tx-1", "tx-2"]
+        self.transcription.get_status.side_effect = lambda transcription_id: {
+            "tx-1": {"status": "Succeeded", "links": {"files": "https://speech/1/files"}},
+            "tx-2": {"status": "Running"},
+        }[transcription_id]
+        normalized = {
+            "segments": [
+                {"audio": b"1", "start": 0.0, "end": 1215.0, "keep_from": 0.0, "keep_until": 1200.0},
+                {"audio": b"2", "start": 1185.0, "end": 2000.0, "keep_from": 1200.0, "keep_until": 2000.0},
+            ],
+            "content_type": "audio/flac",
+            "offset_map": [[0.0, 0.0]],
+            "original_seconds": 2000.0,
+            "normalized_seconds": 2000.0,
+        }
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+        with patch("pipeline.process_audio", return_value=normalized):
+            self.pipeline.run(STAGE_SUBMIT, self.queues.pop()[1])
+        self.pipeline.run(STAGE_TRANSCRIBE, self.queues.pop()[1])
+
+        self.assertEqual(
+            self.transcription.submit_transcription_job.call_args_list[1].args,
+            ("https://blob/2025-01-01/a/a b_segment_001.flac",),
+        )
+        segments = self.cosmos.job["transcription_segments"]
+        self.assertEqual(segments[0]["files_url"], "https://speech/1/files")
+        self.assertIsNone(segments[1]["files_url"])
+
+        polled = []
+
+        def finish(transcription_id):
+            polled.append(transcription_id)
+            return {"status": "Succeeded", "links": {"files": "https://speech/2/files"}}
+
+        self.transcription.get_status.side_effect = finish
+        self._drain()
+
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        # The finished segment is not polled again
+        self.assertEqual(polled, ["tx-2"])
+        stitched = self.transcription.get_segmented_result_data.call_args.args[0]
+        self.assertEqual(
+            [segment["files_url"] for segment in stitched],
+            ["https://speech/1/files", "https://speech/2/files"],
+        )
+        self.transcription.get_result_data.assert_not_called()
+
+    def test_undecodable_audio_transcribed_as_uploaded(self):
+        self.config.audio_normalization_enabled = True
+        self.storage.download_blob_url.return_value = b"not audio"
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        with patch("pipeline.process_audio", side_effect=ValueError("bad header")):
+            self._drain()
+
+        self.transcription.submit_transcription_job.assert_called_once_with(BLOB_URL)
+        self.assertEqual(self.cosmos.job["status"], "completed")
+        self.assertNotIn("audio_offset_map", self.cosmos.job)
+
+    def test_waveform_peaks_stored_next_to_recording(self):
+        self.config.audio_peaks_enabled = True
+        self.storage.download_blob_url.return_value = b"RIFF"
+        self.queues.send("job-dispatch", {"job_id": "job_1", "blob_url": BLOB_URL})
+
+        with patch("pipeline.process_audio", return_value={"peaks": b"PEAK"}):
+            self._drain()
+
+        self.storage.upload_bytes.assert_any_call(
+            self.config.storage_results_container,
+            "2025-01-01/a/a b_peaks.bin",
+            b"PEAK",
+            "application/octet-stream",
+        )
+        self.assertEqual(
+            self.cosmos.job["peaks_file_path"], "https://blob/2025-01-01/a/a b_peaks.bin"
+        )
+        # Without normalization the recording is transcribed as uploaded
+        self.transcription.submit_transcription_job.assert_called_once_with(BLOB_URL)
+        self.assertNotIn("audio_offset_map", self.cosmos.job)
+
+    def test_unsupported_file_fails_without_submitting(self):
+        self.pipeline.run(
+            STAGE_SUBMIT, {"job_id": "job_1", "blob_url": "https://blob/notes.txt"}
+        )
+
+        self.assertEqual(self.cosmos.job["status"], "failed")
+        self.transcription.submit_transcription_job.assert_not_called()
+
+    def test_last_delivery_marks_job_failed(self):
+        self.cosmos.job.update(completed_stages=["submit"], transcription_id="tx-1")
+        self.transcription.get_status.side_effect = ConnectionError("speech down")
+
+        with self.assertRaises(ConnectionError):
+            self.pipeline.run(
+                STAGE_TRANSCRIBE, {"job_id": "job_1"}, dequeue_count=MAX_DEQUEUE_COUNT
+            )
+
+        self.assertEqual(self.cosmos.job["status"], "failed")
+        self.assertEqual(self.cosmos.job["failed_stage"], STAGE_TRANSCRIBE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from unittest.mock import MagicMock
+from rate_limiter import (
+    InMemoryStateStore,
+    LeaseSemaphore,
+    TokenBucketRateLimiter,
+    retry_after_seconds,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucketRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = InMemoryStateStore()
+
+    def _limiter(self, tokens_per_minute=600, requests_per_minute=60):
+        return TokenBucketRateLimiter(
+            self.store,
+            key="openai-test",
+            tokens_per_minute=tokens_per_minute,
+            requests_per_minute=requests_per_minute,
+            clock=self.clock,
+            sleep=self.clock.sleep,
+        )
+
+    def test_waits_for_tokens_to_refill(self):
+        limiter = self._limiter()
+
+        self.assertEqual(limiter.try_acquire(500), 0)
+        # 100 tokens left, 400 more needed at 10 tokens per second
+        self.assertAlmostEqual(limiter.try_acquire(500), 40)
+
+        limiter.acquire(500)
+        self.assertAlmostEqual(sum(self.clock.sleeps), 40)
+
+    def test_instances_share_the_budget(self):
+        first = self._limiter()
+        second = self._limiter()
+
+        self.assertEqual(first.try_acquire(400), 0)
+        self.assertGreater(second.try_acquire(400), 0)
+
+    def test_settle_returns_unused_tokens(self):
+        limiter = self._limiter()
+        limiter.try_acquire(500)
+
+        limiter.settle(reserved=500, used=100)
+
+        self.assertEqual(limiter.try_acquire(500), 0)
+
+    def test_block_for_stops_every_caller(self):
+        limiter = self._limiter()
+
+        limiter.block_for(5)
+
+        self.assertAlmostEqual(self._limiter().try_acquire(1), 5)
+        self.clock.now += 5
+        self.assertEqual(limiter.try_acquire(1), 0)
+
+    def test_lost_swap_is_retried(self):
+        limiter = self._limiter()
+        save = self.store.save
+        self.store.save = MagicMock(side_effect=[False, True])
+
+        self.assertEqual(limiter.try_acquire(10), 0)
+        self.assertEqual(self.store.save.call_count, 2)
+        self.store.save = save
+
+
+class TestLeaseSemaphore(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = InMemoryStateStore()
+
+    def _semaphore(self, capacity=3):
+        return LeaseSemaphore(
+            self.store, key="speech", capacity=capacity, lease_seconds=600, clock=self.clock
+        )
+
+    def test_instances_share_the_capacity(self):
+        first, second = self._semaphore(), self._semaphore()
+
+        self.assertTrue(first.try_acquire(["job_1/0", "job_1/1"]))
+        # All or nothing
+        self.assertFalse(second.try_acquire(["job_2/0", "job_2/1"]))
+        self.assertTrue(second.try_acquire(["job_2/0"]))
+        # Holding a lease already is not counted twice
+        self.assertTrue(first.try_acquire(["job_1/0", "job_1/1"]))
+
+        first.release(["job_1/0"])
+        self.assertTrue(second.try_acquire(["job_3/0"]))
+        self.assertEqual(second.in_use(), 3)
+
+    def test_unrenewed_leases_expire(self):
+        semaphore = self._semaphore(capacity=2)
+        semaphore.try_acquire(["crashed/0", "running/0"])
+
+        self.clock.now += 400
+        semaphore.renew(["running/0"])
+        self.clock.now += 400
+
+        self.assertEqual(semaphore.in_use(), 1)
+        self.assertTrue(semaphore.try_acquire(["next/0"]))
+
+    def test_release_prefix_frees_a_jobs_leases(self):
+        semaphore = self._semaphore()
+        semaphore.try_acquire(["job_1/0", "job_1/1", "job_2/0"])
+
+        semaphore.release_prefix("job_1/")
+
+        self.assertEqual(semaphore.in_use(), 1)
+
+    def test_oversized_request_waits_for_an_empty_semaphore(self):
+        semaphore = self._semaphore(capacity=2)
+        semaphore.try_acquire(["small/0"])
+
+        self.assertFalse(semaphore.try_acquire(["big/0", "big/1", "big/2"]))
+        semaphore.release(["small/0"])
+        self.assertTrue(semaphore.try_acquire(["big/0", "big/1", "big/2"]))
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_reads_retry_after_headers(self):
+        error = MagicMock()
+        error.response.headers = {"retry-after-ms": "1500"}
+        self.assertEqual(retry_after_seconds(error, default=9), 1.5)
+
+        error.response.headers = {"retry-after": "3"}
+        self.assertEqual(retry_after_seconds(error, default=9), 3)
+
+        error.response.headers = {}
+        self.assertEqual(retry_after_seconds(error, default=9), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from datetime import datetime
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+from config import AppConfig
+from scheduler import TranscriptionScheduler, plan_schedule
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+NOW = 1_000_000.0
+
+
+def job(job_id, user_id, seconds, priority="normal", status="queued", **fields):
+    return {
+        "id": job_id,
+        "user_id": user_id,
+        "status": status,
+        "priority": priority,
+        "queued_at": NOW - 100,
+        "audio_metadata": {"duration_seconds": seconds},
+        **fields,
+    }
+
+
+class FakeCosmos:
+    """Jobs kept in a dict, updated like CosmosService.update_job_status"""
+
+    def __init__(self, jobs):
+        self.jobs = {job["id"]: job for job in jobs}
+
+    def get_jobs_by_status(self, status):
+        return [dict(job) for job in self.jobs.values() if job["status"] == status]
+
+    def update_job_status(self, job_id, status, expected_status=None, **kwargs):
+        if expected_status is not None and self.jobs[job_id]["status"] != expected_status:
+            raise CosmosAccessConditionFailedError(status_code=412, message="status changed")
+        self.jobs[job_id].update(status=status, **kwargs)
+        return dict(self.jobs[job_id])
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.config = AppConfig()
+        self.config.scheduler_max_inflight_jobs = 3
+        self.config.scheduler_max_inflight_per_user = 2
+        self.config.scheduler_seconds_per_audio_second = 0.5
+        self.config.scheduler_job_overhead_seconds = 0
+
+    def test_bulk_import_does_not_block_other_users(self):
+        bulk = [job(f"bulk_{i}", "importer", 3600 + i) for i in range(5)]
+        clip = job("clip", "clinician", 300, queued_at=NOW)
+
+        plan = plan_schedule(bulk + [clip], [], NOW, self.config)
+
+        started = [j["id"] for j, start in plan if start <= NOW]
+        self.assertEqual(started, ["clip", "bulk_0", "bulk_1"])
+        waiting = [(j["id"], start) for j, start in plan if start > NOW]
+        # The clip frees its slot first, but the importer is at their own cap
+        self.assertEqual(waiting[0], ("bulk_2", NOW + 1800))
+        self.assertEqual([start for _, start in waiting], sorted(start for _, start in waiting))
+
+    def test_urgent_jobs_go_first_then_shortest(self):
+        self.config.scheduler_max_inflight_jobs = 1
+        queued = [
+            job("long", "a", 1200),
+            job("short", "b", 60),
+            job("urgent", "c", 7200, priority="urgent"),
+        ]
+
+        plan = plan_schedule(queued, [], NOW, self.config)
+
+        self.assertEqual([j["id"] for j, _ in plan], ["urgent", "short", "long"])
+        self.assertEqual([start for _, start in plan], [NOW, NOW + 3600, NOW + 3630])
+
+    def test_user_at_cap_waits_for_their_own_jobs(self):
+        in_flight = [
+            job("running_1", "a", 600, status="transcribing", transcription_submitted_at=NOW - 100),
+            job("running_2", "a", 600, status="scheduled", scheduled_at=NOW),
+        ]
+
+        plan = plan_schedule([job("next", "a", 60)], in_flight, NOW, self.config)
+
+        self.assertEqual(plan, [(plan[0][0], NOW + 200)])
+
+    def test_dispatch_claims_startable_jobs_and_records_positions(self):
+        self.config.scheduler_max_inflight_jobs = 1
+        cosmos = FakeCosmos(
+            [
+                job("first", "a", 60),
+                job("second", "b", 600),
+                job("stale", "c", 60, status="scheduled", scheduled_at=NOW - 3600),
+                job("done", "d", 60, status="transcribing", completed_stages=["submit", "transcribe"]),
+            ]
+        )
+        scheduler = TranscriptionScheduler(self.config, cosmos, clock=lambda: NOW)
+
+        # The stale scheduled job lost its dispatch message and still holds
+        # the only slot
+        self.assertEqual(scheduler.dispatch(), ["stale"])
+        self.assertEqual(cosmos.jobs["first"]["queue_position"], 1)
+        self.assertEqual(cosmos.jobs["second"]["queue_position"], 2)
+
+        cosmos.jobs["stale"]["status"] = "transcribing"
+        cosmos.jobs["stale"]["completed_stages"] = ["submit", "transcribe"]
+        self.assertEqual(scheduler.dispatch(), ["first"])
+        self.assertEqual(cosmos.jobs["first"]["status"], "scheduled")
+        self.assertEqual(cosmos.jobs["second"]["queue_position"], 1)
+        self.assertEqual(
+            datetime.fromisoformat(cosmos.jobs["second"]["estimated_start_at"]).timestamp(),
+            NOW + 30,
+        )
+
+    def test_admit_keeps_place_of_redelivered_job(self):
+        cosmos = FakeCosmos([job("a", "a", 60, status="uploaded", queued_at=None)])
+        scheduler = TranscriptionScheduler(self.config, cosmos, clock=lambda: NOW)
+
+        queued = scheduler.admit(cosmos.jobs["a"])
+        scheduler.admit(dict(queued, status="uploaded"))
+
+        self.assertEqual(cosmos.jobs["a"]["status"], "queued")
+        self.assertEqual(cosmos.jobs["a"]["queued_at"], NOW)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from audio_processing import TICKS_PER_SECOND
+from segment_stitching import stitch_segments
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+def phrase(start, duration, speaker, text):
+    return {
+        "offsetInTicks": start * TICKS_PER_SECOND,
+        "durationInTicks": duration * TICKS_PER_SECOND,
+        "speaker": speaker,
+        "nBest": [
+            {"display": text, "words": [{"offsetInTicks": start * TICKS_PER_SECOND}]}
+        ],
+    }
+
+
+class TestSegmentStitching(unittest.TestCase):
+    def setUp(self):
+        first = {"start": 0.0, "end": 110.0, "keep_from": 0.0, "keep_until": 100.0}
+        second = {"start": 90.0, "end": 200.0, "keep_from": 100.0, "keep_until": 200.0}
+        # Speech numbered the speakers of the second segment the other way round
+        self.stitched = stitch_segments(
+            [
+                (
+                    first,
+                    {
+                        "recognizedPhrases": [
+                            phrase(10, 5, 1, "Hello."),
+                            phrase(92, 6, 2, "Before the cut."),
+                            phrase(103, 5, 1, "After the cut."),
+                        ]
+                    },
+                ),
+                (
+                    second,
+                    {
+                        "recognizedPhrases": [
+                            phrase(2, 6, 1, "Before the cut."),
+                            phrase(13, 5, 2, "After the cut."),
+                            phrase(50, 5, 1, "Later."),
+                            phrase(60, 5, 3, "A newcomer."),
+                        ]
+                    },
+                ),
+            ]
+        )["recognizedPhrases"]
+
+    def test_overlap_duplicates_removed_and_offsets_corrected(self):
+        self.assertEqual(
+            [
+                (p["offsetInTicks"] / TICKS_PER_SECOND, p["nBest"][0]["display"])
+                for p in self.stitched
+            ],
+            [
+                (10.0, "Hello."),
+                (92.0, "Before the cut."),
+                (103.0, "After the cut."),
+                (140.0, "Later."),
+                (150.0, "A newcomer."),
+            ],
+        )
+        self.assertEqual(
+            self.stitched[3]["nBest"][0]["words"][0]["offsetInTicks"],
+            140 * TICKS_PER_SECOND,
+        )
+
+    def test_speakers_reconciled_across_segments(self):
+        self.assertEqual([p["speaker"] for p in self.stitched], [1, 2, 1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
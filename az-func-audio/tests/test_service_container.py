@@ -0,0 +1,51 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+from unittest.mock import MagicMock, patch
+import service_container
+from service_container import get_services, reset_services
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+class TestServiceContainer(unittest.TestCase):
+    def setUp(self):
+        reset_services()
+        patcher = patch("service_container.CosmosService")
+        self.cosmos_service = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(reset_services)
+
+    def test_services_reused_across_invocations(self):
+        with patch(
+            "service_container.DefaultAzureCredential", return_value=MagicMock()
+        ) as credential:
+            first = get_services()
+            second = get_services()
+
+        self.assertIs(first, second)
+        self.assertIs(first.pipeline, second.pipeline)
+        credential.assert_called_once()
+        self.cosmos_service.assert_called_once()
+
+    def test_services_share_one_credential(self):
+        with patch("service_container.DefaultAzureCredential", return_value=MagicMock()):
+            services = get_services()
+
+        self.assertIs(self.cosmos_service.call_args.args[1], services.credential)
+        self.assertIs(services.storage_service.credential, services.credential)
+        self.assertIs(services.transcription_service.credential, services.credential)
+        self.assertIs(services.analysis_service.credential, services.credential)
+        self.assertIs(services.pipeline.dispatcher.credential, services.credential)
+        self.assertIs(
+            services.batch_service.client, services.analysis_service.client
+        )
+        self.assertIs(services.pipeline.batch_service, services.batch_service)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+from analysis_service import split_transcript
+from token_utils import estimate_tokens
+from transcript_compaction import compact_transcript, compaction_stats, normalize_disfluencies
+
+FORMATTED = """
+--- Speaker 1 ---
+  Um, so how was your, uh, week?
+  I I I mean the weekend.
+--- Speaker 2 ---
+  It was fine [Confidence: 0.62]
+  We went to the park.
+--- Speaker 1 ---
+  Great."""
+
+
+class TestTranscriptCompaction(unittest.TestCase):
+    def test_merges_turns_with_short_tags(self):
+        self.assertEqual(
+            compact_transcript(FORMATTED).splitlines(),
+            [
+                "S1: So how was your week? I mean the weekend.",
+                "S2: It was fine (?) We went to the park.",
+                "S1: Great.",
+            ],
+        )
+
+    def test_uses_fewer_tokens(self):
+        compacted = compact_transcript(FORMATTED)
+        stats = compaction_stats(FORMATTED, compacted)
+
+        self.assertLess(stats["compacted_tokens"], stats["formatted_tokens"])
+        self.assertEqual(stats["compacted_tokens"], estimate_tokens(compacted))
+
+    def test_normalize_keeps_ordinary_words(self):
+        self.assertEqual(
+            normalize_disfluencies("the summer umbrella, er, is here"),
+            "The summer umbrella is here",
+        )
+
+    def test_normalize_keeps_meaningful_double_words(self):
+        self.assertEqual(
+            normalize_disfluencies("no, no, she had had very very little"),
+            "No, no, she had had very very little",
+        )
+        self.assertEqual(normalize_disfluencies("we we we left"), "We left")
+
+    def test_long_turn_continues_with_same_tag(self):
+        formatted = "--- Speaker 1 ---\n" + "\n".join(
+            f"  Sentence number {i} of a long answer." for i in range(20)
+        )
+
+        compacted = compact_transcript(formatted, max_turn_chars=200)
+        lines = compacted.splitlines()
+
+        self.assertGreater(len(lines), 1)
+        self.assertTrue(all(line.startswith("S1: ") for line in lines))
+        # compacted lines are turn boundaries for map-reduce chunking
+        chunks = split_transcript(compacted, max_tokens=60)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.startswith("S1: ") for chunk in chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
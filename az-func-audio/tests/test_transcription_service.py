@@ -0,0 +1,246 @@
+import os
+import sys
+# Add the parent directory to the system path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+import unittest
+import time
+from unittest.mock import patch, MagicMock
+from azure.core.credentials import AccessToken
+from transcription_service import FastTranscriptionRejected, TranscriptionService
+from config import AppConfig
+
+# ✅ Load test environment before anything else
+load_dotenv(dotenv_path=".env")
+
+
+def _json_response(payload):
+    response = MagicMock()
+    response.json.return_value = payload
+    response.content = b"{}"
+    response.raise_for_status.return_value = None
+    return response
+
+
+def _phrase(speaker, offset, text, channel=0):
+    return {
+        "speaker": speaker,
+        "channel": channel,
+        "offsetInTicks": offset,
+        "nBest": [{"display": text, "confidence": 0.95}],
+    }
+
+
+class TestTranscriptionResults(unittest.TestCase):
+    def setUp(self):
+        self.config = AppConfig()
+        self.service = TranscriptionService(self.config)
+        self.service._get_headers = MagicMock(return_value={})
+
+    def test_get_results_reads_all_pages_and_skips_reports(self):
+        pages = {
+            "https://speech/files": {
+                "values": [
+                    {
+                        "name": "contenturl_10.json",
+                        "kind": "Transcription",
+                        "links": {"contentUrl": "https://blob/10"},
+                    },
+                    {
+                        "name": "report.json",
+                        "kind": "TranscriptionReport",
+                        "links": {"contentUrl": "https://blob/report"},
+                    },
+                ],
+                "@nextLink": "https://speech/files?skip=2",
+            },
+            "https://speech/files?skip=2": {
+                "values": [
+                    {
+                        "name": "contenturl_2.json",
+                        "kind": "Transcription",
+                        "links": {"contentUrl": "https://blob/2"},
+                    }
+                ]
+            },
+            "https://blob/2": {
+                "source": "https://recordings/a.wav",
+                "recognizedPhrases": [_phrase(1, 300, "third")],
+            },
+            "https://blob/10": {
+                "source": "https://recordings/a.wav",
+                "recognizedPhrases": [
+                    _phrase(2, 500, "fourth"),
+                    _phrase(1, 100, "first"),
+                    _phrase(2, 200, "second"),
+                ],
+            },
+        }
+        requested = []
+
+        def fake_get(url, **kwargs):
+            requested.append(url)
+            return _json_response(pages[url])
+
+        self.service.session = MagicMock()
+        self.service.session.get.side_effect = fake_get
+        self.service.session.request.side_effect = (
+            lambda method, url, **kwargs: fake_get(url, **kwargs)
+        )
+
+        result = self.service.get_results({"links": {"files": "https://speech/files"}})
+
+        self.assertNotIn("https://blob/report", requested)
+        lines = [line.strip() for line in result.splitlines() if line.strip()]
+        self.assertEqual(
+            lines,
+            [
+                "--- Speaker 1 ---",
+                "first",
+                "--- Speaker 2 ---",
+                "second",
+                "--- Speaker 1 ---",
+                "third",
+                "--- Speaker 2 ---",
+                "fourth",
+            ],
+        )
+
+    def test_get_results_without_transcription_files(self):
+        self.service.session = MagicMock()
+        self.service.session.request.return_value = _json_response(
+            {"values": [{"name": "report.json", "kind": "TranscriptionReport"}]}
+        )
+
+        with self.assertRaises(ValueError):
+            self.service.get_results({"links": {"files": "https://speech/files"}})
+
+    def test_merge_keeps_separate_sources_in_file_order(self):
+        merged = self.service._merge_results(
+            [
+                {"source": "b.wav", "recognizedPhrases": [_phrase(1, 900, "b")]},
+                {"source": "a.wav", "recognizedPhrases": [_phrase(1, 100, "a")]},
+            ]
+        )
+
+        texts = [p["nBest"][0]["display"] for p in merged["recognizedPhrases"]]
+        self.assertEqual(texts, ["b", "a"])
+
+
+class TestFastTranscription(unittest.TestCase):
+    def setUp(self):
+        self.config = AppConfig()
+        self.service = TranscriptionService(self.config)
+        self.service._get_headers = MagicMock(
+            return_value={"Content-Type": "application/json", "Authorization": "Bearer t"}
+        )
+        self.service.session = MagicMock()
+
+    def test_phrases_formatted_like_batch_results(self):
+        response = _json_response(
+            {
+                "durationMilliseconds": 4000,
+                "combinedPhrases": [{"text": "Hello. How are you?"}],
+                "phrases": [
+                    {
+                        "speaker": 2,
+                        "offsetMilliseconds": 2000,
+                        "durationMilliseconds": 1500,
+                        "text": "How are you?",
+                        "confidence": 0.5,
+                        "words": [{"text": "How", "offsetMilliseconds": 2000, "durationMilliseconds": 300}],
+                    },
+                    {
+                        "speaker": 1,
+                        "offsetMilliseconds": 0,
+                        "durationMilliseconds": 900,
+                        "text": "Hello.",
+                        "confidence": 0.93,
+                    },
+                ],
+            }
+        )
+        response.status_code = 200
+        self.service.session.request.return_value = response
+
+        text = self.service.transcribe_fast(b"RIFF", "clip.wav", offset_map=[[0.0, 0.0], [1.0, 11.0]])
+
+        self.assertEqual(
+            text,
+            "\n--- Speaker 1 ---\n  Hello.\n\n--- Speaker 2 ---\n  How are you? [Confidence: 0.50]",
+        )
+        kwargs = self.service.session.request.call_args.kwargs
+        self.assertNotIn("Content-Type", kwargs["headers"])
+        self.assertEqual(kwargs["files"]["audio"], ("clip.wav", b"RIFF"))
+        self.assertIn("transcriptions:transcribe?api-version=2024-11-15", self.service.session.request.call_args.args[1])
+
+    def test_offsets_converted_to_ticks(self):
+        result = TranscriptionService._fast_to_batch_result(
+            {
+                "phrases": [
+                    {
+                        "offsetMilliseconds": 1250,
+                        "durationMilliseconds": 500,
+                        "text": "Hi",
+                        "words": [{"text": "Hi", "offsetMilliseconds": 1250, "durationMilliseconds": 500}],
+                    }
+                ]
+            }
+        )
+
+        phrase = result["recognizedPhrases"][0]
+        self.assertEqual(phrase["offsetInTicks"], 12_500_000)
+        self.assertEqual(phrase["durationInTicks"], 5_000_000)
+        self.assertEqual(phrase["nBest"][0]["words"][0]["word"], "Hi")
+
+    def test_refused_audio_raises_for_batch_fallback(self):
+        response = MagicMock(status_code=413, text="Audio too long")
+        self.service.session.request.return_value = response
+
+        with self.assertRaises(FastTranscriptionRejected):
+            self.service.transcribe_fast(b"RIFF", "long.wav")
+
+
+class TestTranscriptionAuth(unittest.TestCase):
+    def setUp(self):
+        self.config = AppConfig()
+        self.service = TranscriptionService(self.config)
+        self.service.credential = MagicMock()
+
+    def test_token_is_cached_until_refresh_margin(self):
+        self.service.credential.get_token.return_value = AccessToken(
+            "token-1", int(time.time()) + 3600
+        )
+
+        self.assertEqual(self.service._get_auth_token(), "token-1")
+        self.assertEqual(self.service._get_auth_token(), "token-1")
+        self.assertEqual(self.service.credential.get_token.call_count, 1)
+
+    def test_token_refreshed_ahead_of_expiry(self):
+        self.service.credential.get_token.side_effect = [
+            AccessToken("old", int(time.time()) + 60),
+            AccessToken("new", int(time.time()) + 3600),
+        ]
+
+        self.assertEqual(self.service._get_auth_token(), "old")
+        self.assertEqual(self.service._get_auth_token(), "new")
+
+    def test_request_retries_once_on_unauthorized(self):
+        self.service.credential.get_token.side_effect = [
+            AccessToken("revoked", int(time.time()) + 3600),
+            AccessToken("fresh", int(time.time()) + 3600),
+        ]
+        unauthorized = MagicMock(status_code=401)
+        ok = MagicMock(status_code=200)
+        self.service.session = MagicMock()
+        self.service.session.request.side_effect = [unauthorized, ok]
+
+        response = self.service._request("GET", "https://speech/transcriptions/1")
+
+        self.assertIs(response, ok)
+        retry_headers = self.service.session.request.call_args.kwargs["headers"]
+        self.assertEqual(retry_headers["Authorization"], "Bearer fresh")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import re
+from typing import List, Optional, Tuple
+
+from token_utils import estimate_tokens
+
+# Banner and confidence annotation as written by
+# TranscriptionService.format_transcription
+BANNER_PATTERN = re.compile(r"^\s*--- Speaker (.*?) ---\s*$")
+CONFIDENCE_PATTERN = re.compile(r"\s*\[Confidence: [0-9.]+\]")
+
+# Marker kept in place of a low-confidence annotation
+LOW_CONFIDENCE_MARKER = "(?)"
+
+FILLER_PATTERN = re.compile(
+    r"(?i)(?:,\s*)?(?<![\w'])(?:um+|uh+|erm+|er|hmm+|mm+)(?![\w']),?"
+)
+# Only runs of three or more are stutters; a doubled word ("no, no", "had
+# had") often carries meaning
+REPEATED_WORD_PATTERN = re.compile(r"(?i)\b(\w+)(?:[,\s]+\1\b){2,}")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.!?;:])")
+REPEATED_PUNCTUATION = re.compile(r"([,.!?;:])(?:\s*[,;:])+")
+
+
+def speaker_tag(label: str) -> str:
+    """Short tag for a speaker label: "1" -> "S1", unknown speakers -> "S?" """
+    label = label.strip()
+    return f"S{label}" if label.isdigit() else "S?"
+
+
+def normalize_disfluencies(text: str) -> str:
+    """Drop filler words and stutters like "I I I" from a phrase"""
+    text = FILLER_PATTERN.sub("", text)
+    text = REPEATED_WORD_PATTERN.sub(r"\1", text)
+    text = REPEATED_PUNCTUATION.sub(r"\1", text)
+    text = SPACE_BEFORE_PUNCTUATION.sub(r"\1", text)
+    text = re.sub(r"\s{2,}", " ", text).lstrip(" ,.;:").rstrip(" ,;:")
+    return text[:1].upper() + text[1:] if text else text
+
+
+def compact_transcript(formatted: str, max_turn_chars: int = 2000) -> str:
+    """
+    Token-lean rendering of a formatted transcript for the analysis prompt.
+
+    Each speaker turn becomes one "S1: ..." line with its phrases joined,
+    confidence annotations reduced to a "(?)" marker and disfluencies
+    removed. Turns longer than max_turn_chars continue on a new line with
+    the same tag so the transcript can still be split between lines.
+    """
+    turns: List[Tuple[str, List[str]]] = []
+    tag: Optional[str] = None
+
+    for line in formatted.splitlines():
+        banner = BANNER_PATTERN.match(line)
+        if banner:
+            tag = speaker_tag(banner.group(1))
+            continue
+
+        uncertain = bool(CONFIDENCE_PATTERN.search(line))
+        text = normalize_disfluencies(CONFIDENCE_PATTERN.sub("", line))
+        if not text:
+            continue
+        if uncertain:
+            text = f"{text} {LOW_CONFIDENCE_MARKER}"
+
+        current = tag or "S?"
+        if (
+            turns
+            and turns[-1][0] == current
+            and sum(len(p) + 1 for p in turns[-1][1]) + len(text) <= max_turn_chars
+        ):
+            turns[-1][1].append(text)
+        else:
+            turns.append((current, [text]))
+
+    return "\n".join(f"{tag}: {' '.join(phrases)}" for tag, phrases in turns)
+
+
+def compaction_stats(formatted: str, compacted: str) -> dict:
+    """Before/after token estimates for recording on the job"""
+    before = estimate_tokens(formatted)
+    after = estimate_tokens(compacted)
+    return {
+        "formatted_tokens": before,
+        "compacted_tokens": after,
+        "saved_ratio": round(1 - after / before, 3) if before else 0.0,
+    }
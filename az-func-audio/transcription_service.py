@@ -1,7 +1,13 @@
 import logging
+import re
+import threading
 import time
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.credentials import AccessToken
 from azure.identity import DefaultAzureCredential
 import os
 import sys
@@ -9,17 +15,58 @@ import json
 
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from audio_processing import TICKS_PER_SECOND, remap_phrase_offsets
 from config import AppConfig
-from storage_service import StorageService
+from segment_stitching import stitch_segments
+
+
+# Refresh the cached bearer token this long before it actually expires
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+# Synchronous fast transcription, for short recordings
+FAST_TRANSCRIPTION_API_VERSION = "2024-11-15"
+
+# Fast transcription has no per-phrase alternatives, so its phrases carry
+# this confidence when the service reports none
+FAST_DEFAULT_CONFIDENCE = 1.0
+
+
+class FastTranscriptionRejected(Exception):
+    """The fast transcription endpoint refused the audio; batch may still take it"""
 
 
 class TranscriptionService:
-    def __init__(self, config: AppConfig):
+    def __init__(self, config: AppConfig, credential=None):
         self.config = config
         self.logger = logging.getLogger(__name__)
-        self.credential = DefaultAzureCredential()
-        self.storage_service = StorageService(config)
+        self.credential = credential or DefaultAzureCredential()
         self.endpoint = f"https://{config.speech_deployment}.cognitiveservices.azure.com/speechtotext/v3.2"
+        self.fast_endpoint = (
+            f"https://{config.speech_deployment}.cognitiveservices.azure.com"
+            f"/speechtotext/transcriptions:transcribe?api-version={FAST_TRANSCRIPTION_API_VERSION}"
+        )
+
+        self._token: Optional[AccessToken] = None
+        self._token_lock = threading.Lock()
+
+        # Shared keep-alive connection pool, sized for the concurrent result
+        # downloads. Only idempotent GETs are retried; a retried POST could
+        # create a duplicate transcription.
+        retry = Retry(
+            total=config.speech_http_retries,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config.speech_result_download_workers,
+            pool_maxsize=config.speech_result_download_workers,
+            max_retries=retry,
+        )
+        self.session.mount("https://", adapter)
         self.logger.info(
             "Initialized TranscriptionService",
             extra={
@@ -30,8 +77,21 @@ class TranscriptionService:
             },
         )
 
-    def _get_auth_token(self) -> str:
-        """Get authentication token for Azure services"""
+    def _get_auth_token(self, force_refresh: bool = False) -> str:
+        """Get authentication token for Azure services, cached until shortly before expiry"""
+        with self._token_lock:
+            if (
+                not force_refresh
+                and self._token
+                and self._token.expires_on - time.time() > TOKEN_REFRESH_MARGIN_SECONDS
+            ):
+                return self._token.token
+
+            self._token = self._acquire_token()
+            return self._token.token
+
+    def _acquire_token(self) -> AccessToken:
+        """Request a new authentication token from the credential chain"""
         try:
             self.logger.debug(
                 "Attempting to acquire authentication token",
@@ -75,7 +135,7 @@ class TranscriptionService:
                 },
             )
 
-            return token.token
+            return token
 
         except Exception as e:
             self.logger.error(
@@ -96,10 +156,10 @@ class TranscriptionService:
             )
             raise
 
-    def _get_headers(self) -> Dict[str, str]:
+    def _get_headers(self, force_refresh: bool = False) -> Dict[str, str]:
         """Get headers for API requests"""
         self.logger.debug("Preparing API request headers")
-        token = self._get_auth_token()
+        token = self._get_auth_token(force_refresh=force_refresh)
 
         # Create headers
         headers = {
@@ -120,6 +180,31 @@ class TranscriptionService:
         )
         return headers
 
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send an authenticated Speech API request over the shared session.
+
+        A 401 means the cached token was revoked or expired early, so the
+        token is refreshed once and the request replayed. Multipart requests
+        (with files) let requests set their own Content-Type.
+        """
+
+        def headers(force_refresh: bool = False) -> Dict[str, str]:
+            prepared = self._get_headers(force_refresh=force_refresh)
+            if "files" in kwargs:
+                prepared.pop("Content-Type", None)
+            return prepared
+
+        response = self.session.request(method, url, headers=headers(), **kwargs)
+        if response.status_code == 401:
+            self.logger.warning(
+                "Speech API rejected the bearer token, refreshing",
+                extra={"url": url, "method": method},
+            )
+            response = self.session.request(
+                method, url, headers=headers(force_refresh=True), **kwargs
+            )
+        return response
+
     def _prepare_transcription_properties(self, blob_url: str) -> Dict[str, Any]:
         """Prepare transcription job properties"""
         properties = {
@@ -158,12 +243,11 @@ class TranscriptionService:
                 "Submitting transcription job", extra={"blob_url": blob_url}
             )
             properties = self._prepare_transcription_properties(blob_url)
-            headers = self._get_headers()
 
             start_time = time.time()
-            response = requests.post(
+            response = self._request(
+                "POST",
                 f"{self.endpoint}/transcriptions",
-                headers=headers,
                 json=properties,
                 timeout=30,
             )
@@ -210,13 +294,27 @@ class TranscriptionService:
             )
             raise
 
+    def get_status(self, transcription_id: str) -> Dict[str, Any]:
+        """Read the transcription status once, without waiting for completion"""
+        status_endpoint = f"{self.endpoint}/transcriptions/{transcription_id}"
+        response = self._request("GET", status_endpoint, timeout=30)
+        response.raise_for_status()
+        status_data = response.json()
+        self.logger.info(
+            "Retrieved transcription status",
+            extra={
+                "transcription_id": transcription_id,
+                "status": status_data.get("status"),
+            },
+        )
+        return status_data
+
     def check_status(
         self, transcription_id: str, timeout: int = 18000, interval: int = 20
     ) -> Dict[str, Any]:
         """Check transcription status with timeout"""
         start_time = time.time()
         status_endpoint = f"{self.endpoint}/transcriptions/{transcription_id}"
-        headers = self._get_headers()
         check_count = 0
 
         while True:
@@ -233,7 +331,8 @@ class TranscriptionService:
             )
 
             try:
-                response = requests.get(status_endpoint, headers=headers)
+                # Headers are resolved per poll so long jobs outlive the token
+                response = self._request("GET", status_endpoint, timeout=30)
                 response.raise_for_status()
                 status_data = response.json()
 
@@ -323,7 +422,121 @@ class TranscriptionService:
                 )
                 raise
 
-    def _format_transcription(self, results: Dict[str, Any]) -> str:
+    def _prepare_fast_definition(self) -> Dict[str, Any]:
+        """Fast transcription settings matching the batch job properties"""
+        return {
+            "locales": self.config.speech_candidate_locales.split(","),
+            "diarization": {
+                "enabled": True,
+                "maxSpeakers": int(self.config.speech_max_speakers),
+            },
+            "profanityFilterMode": "None",
+        }
+
+    @staticmethod
+    def _fast_to_batch_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Reshape a fast transcription response like a batch result file"""
+
+        def timing(item: Dict[str, Any]) -> Dict[str, Any]:
+            offset_ms = item.get("offsetMilliseconds", 0)
+            duration_ms = item.get("durationMilliseconds", 0)
+            return {
+                "offset": f"PT{offset_ms / 1000:.2f}S",
+                "offsetInTicks": offset_ms * TICKS_PER_SECOND // 1000,
+                "offsetMilliseconds": offset_ms,
+                "durationInTicks": duration_ms * TICKS_PER_SECOND // 1000,
+                "durationMilliseconds": duration_ms,
+            }
+
+        phrases = []
+        for phrase in result.get("phrases", []):
+            recognized = {
+                "channel": phrase.get("channel", 0),
+                **timing(phrase),
+                "nBest": [
+                    {
+                        "confidence": phrase.get("confidence", FAST_DEFAULT_CONFIDENCE),
+                        "display": phrase.get("text", ""),
+                        "words": [
+                            {"word": word.get("text", ""), **timing(word)}
+                            for word in phrase.get("words", [])
+                        ],
+                    }
+                ],
+            }
+            if "speaker" in phrase:
+                recognized["speaker"] = phrase["speaker"]
+            if "locale" in phrase:
+                recognized["locale"] = phrase["locale"]
+            phrases.append(recognized)
+
+        phrases.sort(key=lambda p: (p["offsetInTicks"], p["channel"]))
+        return {
+            "durationInTicks": result.get("durationMilliseconds", 0)
+            * TICKS_PER_SECOND
+            // 1000,
+            "combinedRecognizedPhrases": [
+                {"channel": combined.get("channel", 0), "display": combined.get("text", "")}
+                for combined in result.get("combinedPhrases", [])
+            ],
+            "recognizedPhrases": phrases,
+        }
+
+    def get_fast_result_data(
+        self,
+        audio: bytes,
+        file_name: str,
+        offset_map: Optional[List[List[float]]] = None,
+    ) -> Dict[str, Any]:
+        """Transcribe short audio in one synchronous request.
+
+        Returns the result in the batch result layout. Raises
+        FastTranscriptionRejected when the endpoint refuses the audio
+        (too long, unsupported format), so the caller can use a batch job.
+        """
+        start_time = time.time()
+        response = self._request(
+            "POST",
+            self.fast_endpoint,
+            files={
+                "audio": (file_name, audio),
+                "definition": (
+                    None,
+                    json.dumps(self._prepare_fast_definition()),
+                    "application/json",
+                ),
+            },
+            timeout=self.config.speech_fast_timeout_seconds,
+        )
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise FastTranscriptionRejected(
+                f"Fast transcription returned {response.status_code}: {response.text[:500]}"
+            )
+        response.raise_for_status()
+        transcription_data = self._fast_to_batch_result(response.json())
+        self.logger.info(
+            "Fast transcription completed",
+            extra={
+                "audio_bytes": len(audio),
+                "phrase_count": len(transcription_data["recognizedPhrases"]),
+                "request_time": f"{time.time() - start_time:.2f}s",
+            },
+        )
+        remap_phrase_offsets(transcription_data["recognizedPhrases"], offset_map)
+        return transcription_data
+
+    def transcribe_fast(
+        self,
+        audio: bytes,
+        file_name: str,
+        offset_map: Optional[List[List[float]]] = None,
+    ) -> str:
+        """Transcribe short audio in one synchronous request and format it"""
+        return self.format_transcription(
+            self.get_fast_result_data(audio, file_name, offset_map=offset_map)
+        )
+
+    def format_transcription(self, results: Dict[str, Any]) -> str:
         """Format transcription results as text"""
         formatted_lines = []
         current_speaker = None
@@ -368,8 +581,136 @@ class TranscriptionService:
 
         return "\n".join(formatted_lines)
 
-    def get_results(self, status_data: Dict[str, Any]) -> str:
-        """Retrieve transcription results"""
+    def _list_result_files(self, files_url: str) -> List[Dict[str, Any]]:
+        """Follow the paged files listing and return every file entry"""
+        files = []
+        page_count = 0
+        next_url = files_url
+
+        while next_url:
+            page_count += 1
+            response = self._request("GET", next_url, timeout=30)
+            response.raise_for_status()
+            page = response.json()
+            files.extend(page.get("values", []))
+            next_url = page.get("@nextLink")
+
+        self.logger.debug(
+            "Retrieved files list",
+            extra={"files_count": len(files), "page_count": page_count},
+        )
+        return files
+
+    @staticmethod
+    def _natural_sort_key(name: str) -> List[Any]:
+        """Sort key that orders contenturl_2 before contenturl_10"""
+        return [
+            int(part) if part.isdigit() else part
+            for part in re.split(r"(\d+)", name or "")
+        ]
+
+    def _download_result_file(self, file_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Download a single transcription result file"""
+        result_url = file_info["links"]["contentUrl"]
+        start_time = time.time()
+        # Content URLs are pre-signed, so no Authorization header is sent
+        response = self.session.get(result_url, timeout=60)
+        response.raise_for_status()
+        request_time = time.time() - start_time
+
+        self.logger.debug(
+            "Retrieved transcription content",
+            extra={
+                "file_name": file_info.get("name"),
+                "content_size": len(response.content),
+                "request_time": f"{request_time:.2f}s",
+            },
+        )
+        return response.json()
+
+    def _merge_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge several result files into a single result in a deterministic order"""
+        source_order: Dict[str, int] = {}
+        phrases = []
+        combined = []
+
+        for result in results:
+            order = source_order.setdefault(result.get("source"), len(source_order))
+            for phrase in result.get("recognizedPhrases", []):
+                phrases.append((order, phrase))
+            combined.extend(result.get("combinedRecognizedPhrases", []))
+
+        # Phrases of the same recording interleave by time, separate recordings
+        # keep the order of their result files
+        phrases.sort(
+            key=lambda item: (
+                item[0],
+                item[1].get("offsetInTicks", 0),
+                item[1].get("channel", 0),
+            )
+        )
+
+        return {
+            "durationInTicks": max(
+                (r.get("durationInTicks", 0) for r in results), default=0
+            ),
+            "combinedRecognizedPhrases": combined,
+            "recognizedPhrases": [phrase for _, phrase in phrases],
+        }
+
+    def _fetch_results(self, files_url: str) -> Dict[str, Any]:
+        """Download every transcription file of a job and merge them"""
+        self.logger.info("Retrieving transcription files list")
+
+        start_time = time.time()
+        files = self._list_result_files(files_url)
+        transcription_files = sorted(
+            (f for f in files if f.get("kind") == "Transcription"),
+            key=lambda f: self._natural_sort_key(f.get("name")),
+        )
+
+        if not transcription_files:
+            self.logger.error("No transcription files found in response")
+            raise ValueError("No transcription files found")
+
+        self.logger.info(
+            "Retrieving transcription content",
+            extra={
+                "transcription_files": len(transcription_files),
+                "skipped_files": len(files) - len(transcription_files),
+            },
+        )
+
+        workers = max(
+            1,
+            min(self.config.speech_result_download_workers, len(transcription_files)),
+        )
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map preserves the sorted file order regardless of completion order
+            results = list(executor.map(self._download_result_file, transcription_files))
+        request_time = time.time() - start_time
+
+        transcription_data = self._merge_results(results)
+        self.logger.debug(
+            "Merged transcription content",
+            extra={
+                "files_merged": len(results),
+                "phrase_count": len(transcription_data["recognizedPhrases"]),
+                "request_time": f"{request_time:.2f}s",
+            },
+        )
+        return transcription_data
+
+    def get_result_data(
+        self,
+        status_data: Dict[str, Any],
+        offset_map: Optional[List[List[float]]] = None,
+    ) -> Dict[str, Any]:
+        """Retrieve the merged transcription result of a finished job.
+
+        offset_map moves timestamps of a normalized derivative back onto the
+        original recording.
+        """
         try:
             files_url = status_data.get("links", {}).get("files")
             if not files_url:
@@ -379,58 +720,72 @@ class TranscriptionService:
                 )
                 raise ValueError("Files URL not found in status data")
 
-            self.logger.info("Retrieving transcription files list")
-            headers = self._get_headers()
-
-            start_time = time.time()
-            files_response = requests.get(files_url, headers=headers)
-            files_response.raise_for_status()
-
-            files_data = files_response.json()
-            request_time = time.time() - start_time
-
-            self.logger.debug(
-                "Retrieved files list",
-                extra={
-                    "files_count": len(files_data.get("values", [])),
-                    "request_time": f"{request_time:.2f}s",
-                },
-            )
-
-            if not files_data.get("values"):
-                self.logger.error("No transcription files found in response")
-                raise ValueError("No transcription files found")
+            transcription_data = self._fetch_results(files_url)
+            remap_phrase_offsets(transcription_data["recognizedPhrases"], offset_map)
+            return transcription_data
 
-            result_url = files_data["values"][0]["links"]["contentUrl"]
-            self.logger.info(
-                "Retrieving transcription content", extra={"result_url": result_url}
+        except Exception as e:
+            self.logger.error(
+                "Failed to retrieve transcription results",
+                extra={"error_type": type(e).__name__, "error_details": str(e)},
+                exc_info=True,
             )
+            raise
 
-            start_time = time.time()
-            result_response = requests.get(result_url)
-            result_response.raise_for_status()
-            request_time = time.time() - start_time
+    def get_results(
+        self,
+        status_data: Dict[str, Any],
+        offset_map: Optional[List[List[float]]] = None,
+    ) -> str:
+        """Retrieve transcription results, formatted as text"""
+        return self.format_transcription(
+            self.get_result_data(status_data, offset_map=offset_map)
+        )
 
-            transcription_data = result_response.json()
-            self.logger.debug(
-                "Retrieved transcription content",
-                extra={
-                    "content_size": len(str(transcription_data)),
-                    "request_time": f"{request_time:.2f}s",
-                },
-            )
+    def get_segmented_result_data(
+        self,
+        segments: List[Dict[str, Any]],
+        offset_map: Optional[List[List[float]]] = None,
+    ) -> Dict[str, Any]:
+        """Retrieve and stitch the results of a recording transcribed in segments.
 
-            formatted_text = self._format_transcription(transcription_data)
-            return formatted_text
+        Each segment carries the files_url of its finished transcription and
+        its position in the segmented audio (see audio_processing.plan_segments).
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                results = list(
+                    executor.map(
+                        lambda segment: self._fetch_results(segment["files_url"]),
+                        segments,
+                    )
+                )
+            transcription_data = stitch_segments(list(zip(segments, results)))
+            remap_phrase_offsets(transcription_data["recognizedPhrases"], offset_map)
+            return transcription_data
 
         except Exception as e:
             self.logger.error(
-                "Failed to retrieve transcription results",
-                extra={"error_type": type(e).__name__, "error_details": str(e)},
+                "Failed to retrieve segmented transcription results",
+                extra={
+                    "error_type": type(e).__name__,
+                    "error_details": str(e),
+                    "segments": len(segments),
+                },
                 exc_info=True,
             )
             raise
 
+    def get_segmented_results(
+        self,
+        segments: List[Dict[str, Any]],
+        offset_map: Optional[List[List[float]]] = None,
+    ) -> str:
+        """Retrieve segmented transcription results, formatted as text"""
+        return self.format_transcription(
+            self.get_segmented_result_data(segments, offset_map=offset_map)
+        )
+
     def transcribe(self, blob_url: str) -> Dict[str, Any]:
         """Main transcription workflow"""
         start_time = time.time()
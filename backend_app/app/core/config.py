@@ -32,9 +32,22 @@ def get_required_env_var(var_name: str) -> str:
 
 
 class StorageConfig:
-    def __init__(self, account_url: str, recordings_container: str):
+    def __init__(
+        self,
+        account_url: str,
+        recordings_container: str,
+        queue_account_url: str = None,
+        job_dispatch_queue: str = "job-dispatch",
+        results_container: str = "results",
+    ):
         self.account_url = account_url
         self.recordings_container = recordings_container
+        # Transcripts and PDFs written by the audio processor
+        self.results_container = results_container
+        self.queue_account_url = queue_account_url or account_url.replace(
+            ".blob.", ".queue."
+        )
+        self.job_dispatch_queue = job_dispatch_queue
 
 
 class AppConfig:
@@ -71,6 +84,9 @@ class AppConfig:
                 recordings_container=get_required_env_var(
                     "AZURE_STORAGE_RECORDINGS_CONTAINER"
                 ),
+                queue_account_url=os.getenv("AZURE_STORAGE_QUEUE_ACCOUNT_URL"),
+                job_dispatch_queue=os.getenv("AZURE_JOB_DISPATCH_QUEUE", "job-dispatch"),
+                results_container=os.getenv("AZURE_STORAGE_RESULTS_CONTAINER", "results"),
             )
 
             logger.debug("AppConfig initialization completed successfully")
@@ -38,6 +38,8 @@ class CategoryResponse(CategoryBase):
 class SubcategoryBase(BaseModel):
     name: str
     prompts: Dict[str, str]
+    # Smallest analysis deployment tier to use, e.g. "large" for complex reports
+    analysis_tier: Optional[str] = None
 
 
 class SubcategoryCreate(SubcategoryBase):
@@ -329,6 +331,7 @@ async def create_subcategory(
             "category_id": subcategory.category_id,
             "name": subcategory.name,
             "prompts": subcategory.prompts,
+            "analysis_tier": subcategory.analysis_tier,
             "created_at": timestamp,
             "updated_at": timestamp,
         }
@@ -464,6 +467,7 @@ async def update_subcategory(
         subcategory_data = subcategories[0]
         subcategory_data["name"] = subcategory.name
         subcategory_data["prompts"] = subcategory.prompts
+        subcategory_data["analysis_tier"] = subcategory.analysis_tier
         subcategory_data["updated_at"] = int(
             datetime.now(timezone.utc).timestamp() * 1000
         )
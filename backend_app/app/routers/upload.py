@@ -22,7 +22,26 @@ from urllib.parse import urlparse
 
 from app.core.config import AppConfig, CosmosDB, DatabaseError
 from app.services.storage_service import StorageService
+from app.services.queue_service import QueueService
 from app.routers.auth import get_current_user
+from app.utils.audio_probe import AudioProbeError, EXTENSION_FORMATS, probe_audio
+from app.utils.file_utils import FileUtils
+from app.utils.phrase_store import (
+    PHRASE_INDEX_PREFIX_SIZE,
+    PhraseStoreFormatError,
+    format_phrases,
+    index_size,
+    phrase_range,
+    read_phrase_index,
+    read_phrases,
+    record_range,
+)
+from app.utils.waveform_peaks import (
+    PEAKS_PREFIX_SIZE,
+    PeaksFormatError,
+    directory_size,
+    read_peaks_header,
+)
 import logging
 import traceback
 from azure.core.exceptions import AzureError
@@ -32,12 +51,17 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 router = APIRouter()
 
+# "urgent" jobs are transcribed ahead of everyone's queued work; "deferred"
+# ones are analysed through the Azure OpenAI Batch API within 24h
+JOB_PRIORITIES = ("urgent", "normal", "deferred")
+
 
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
     prompt_category_id: str = Form(None),
     prompt_subcategory_id: str = Form(None),
+    priority: str = Form("normal"),
     current_user: Dict[str, Any] = Depends(get_current_user),
 ) -> Dict[str, Any]:
     """
@@ -47,6 +71,8 @@ async def upload_file(
         file: The file to upload
         prompt_category_id: Category ID for the prompt
         prompt_subcategory_id: Subcategory ID for the prompt
+        priority: "normal", "urgent" to transcribe ahead of queued work, or
+            "deferred" to analyse within 24 hours at batch cost
         current_user: Authenticated user from token
 
     Returns:
@@ -60,6 +86,12 @@ async def upload_file(
             status_code=400, detail="Category and Subcategory IDs cannot be null"
         )
 
+    if priority not in JOB_PRIORITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Priority must be one of: {', '.join(JOB_PRIORITIES)}",
+        )
+
     try:
         config = AppConfig()
         try:
@@ -119,6 +151,19 @@ async def upload_file(
                 temp_file.write(content)
                 temp_file_path = temp_file.name
 
+            # Duration, codec and channels come from the headers alone; corrupt
+            # or mislabeled files are rejected before they reach Speech
+            audio_metadata = None
+            if FileUtils.get_extension(file.filename) in EXTENSION_FORMATS:
+                try:
+                    audio_metadata = probe_audio(
+                        temp_file_path, FileUtils.get_extension(file.filename)
+                    )
+                    logger.debug(f"Probed audio file: {audio_metadata}")
+                except AudioProbeError as e:
+                    os.unlink(temp_file_path)
+                    return {"status": 400, "message": f"Invalid audio file: {str(e)}"}
+
             # Upload file to blob storage
             storage_service = StorageService(config)
             blob_url = storage_service.upload_file(temp_file_path, file.filename)
@@ -147,18 +192,31 @@ async def upload_file(
             "prompt_category_id": prompt_category_id,
             "prompt_subcategory_id": prompt_subcategory_id,
             "status": "uploaded",
+            "priority": priority,
+            "audio_metadata": audio_metadata,
             "transcription_id": None,
             "created_at": timestamp,
             "updated_at": timestamp,
         }
         job = cosmos_db.create_job(job_data)
 
+        # Start processing right away instead of waiting for a blob trigger scan
+        try:
+            QueueService(config).dispatch_job(job_data)
+        except Exception as e:
+            logger.error(f"Error dispatching job {job_id}: {str(e)}")
+            job_data["status"] = "failed"
+            job_data["error_message"] = "Job could not be dispatched for processing"
+            cosmos_db.update_job(job_data)
+            return {"status": 503, "message": "Processing queue unavailable"}
+
         return {
             "job_id": job_id,
             "status": "uploaded",
             "message": "File uploaded successfully",
             "prompt_category_id": prompt_category_id,
             "prompt_subcategory_id": prompt_subcategory_id,
+            "priority": priority,
         }
 
     except Exception as e:
@@ -303,25 +361,110 @@ async def get_jobs(
         return {"status": 500, "message": f"An unexpected error occurred: {str(e)}"}
 
 
+async def _transcription_slice(
+    request_id: str,
+    storage_service: StorageService,
+    job: Dict[str, Any],
+    from_ms: Optional[int],
+    to_ms: Optional[int],
+    offset: int,
+    limit: Optional[int],
+) -> Response:
+    """
+    Part of a job's transcript, read from its phrase store: the index, then
+    only the records of the requested phrases.
+    """
+    store_url = job.get("phrase_store_path")
+    if not store_url:
+        logger.warning(f"[{request_id}] Phrase store not found for job: {job['id']}")
+        raise HTTPException(
+            status_code=404,
+            detail="Transcript slices are not available for this job",
+        )
+
+    try:
+        prefix = await storage_service.read_blob_range(
+            store_url, 0, PHRASE_INDEX_PREFIX_SIZE
+        )
+        size = index_size(prefix)
+        if len(prefix) < size:
+            prefix += await storage_service.read_blob_range(
+                store_url, len(prefix), size - len(prefix)
+            )
+        index = read_phrase_index(prefix)
+        first, last = phrase_range(index, from_ms, to_ms, offset, limit)
+        byte_offset, length = record_range(index, first, last)
+        if len(prefix) >= byte_offset + length:
+            # Short transcripts come whole with the index
+            records = prefix[byte_offset : byte_offset + length]
+        elif length:
+            records = await storage_service.read_blob_range(
+                store_url, byte_offset, length
+            )
+        else:
+            records = b""
+        phrases = read_phrases(records, index, first, last)
+    except PhraseStoreFormatError as e:
+        logger.error(f"[{request_id}] Unreadable phrase store: {str(e)}")
+        raise HTTPException(status_code=500, detail="Phrase store is corrupt")
+    except AzureError as e:
+        logger.error(f"[{request_id}] Azure storage error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=502, detail="Error accessing storage service")
+
+    logger.info(
+        f"[{request_id}] Returning phrases {first}-{last} of {index['count']} for job: {job['id']}"
+    )
+    return Response(
+        content=format_phrases(phrases),
+        media_type="text/plain",
+        headers={
+            "X-Phrase-Total": str(index["count"]),
+            "X-Phrase-Offset": str(first),
+            "X-Phrase-Count": str(len(phrases)),
+        },
+    )
+
+
 @router.get("/jobs/transcription/{job_id}")
 async def get_job_transcription(
     job_id: str,
+    from_ms: Optional[int] = Query(
+        None, ge=0, description="Only phrases starting at or after this time"
+    ),
+    to_ms: Optional[int] = Query(
+        None, ge=0, description="Only phrases starting before this time"
+    ),
+    offset: int = Query(0, ge=0, description="Phrases to skip"),
+    limit: Optional[int] = Query(None, ge=1, description="Most phrases to return"),
     current_user: Dict[str, Any] = Depends(get_current_user),
-) -> StreamingResponse:
+) -> Response:
     """
     Stream the transcription file content for a specific job.
 
+    With any of from_ms, to_ms, offset or limit, only the matching phrases
+    are returned, laid out like the transcript. Times are in ms from the
+    start of the recording; offset and limit page through the phrases in
+    the time range.
+
     Args:
         job_id: The ID of the job
+        from_ms: Start of the time range
+        to_ms: End of the time range
+        offset: Phrases of the range to skip
+        limit: Most phrases to return
         current_user: Authenticated user from token
 
     Returns:
-        StreamingResponse containing the transcription file content
+        StreamingResponse containing the transcription file content, or a
+        Response with the requested phrases and X-Phrase-Total,
+        X-Phrase-Offset and X-Phrase-Count headers
     """
     request_id = f"transcription_req_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{job_id[:8]}"
     logger.info(
         f"[{request_id}] Transcription request received for job_id: {job_id} by user: {current_user.get('username')}"
     )
+    if from_ms is not None and to_ms is not None and to_ms < from_ms:
+        raise HTTPException(status_code=400, detail="to_ms must not be before from_ms")
 
     # Initialize services (outside try-except for clarity)
     config = AppConfig()
@@ -426,6 +569,11 @@ async def get_job_transcription(
         logger.error(f"[{request_id}] Stack trace: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Error retrieving job information")
 
+    if from_ms is not None or to_ms is not None or offset or limit is not None:
+        return await _transcription_slice(
+            request_id, storage_service, job, from_ms, to_ms, offset, limit
+        )
+
     # Stream the content
     try:
         # Get the blob URL
@@ -489,3 +637,127 @@ async def get_job_transcription(
         raise HTTPException(
             status_code=500, detail="Error streaming transcription file"
         )
+
+
+# Peaks of a job never change once stored, so clients may cache them for good
+PEAKS_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+@router.get("/jobs/{job_id}/peaks")
+async def get_job_peaks(
+    job_id: str,
+    level: Optional[int] = Query(
+        None, description="Zoom level in peaks per second; the whole blob when omitted"
+    ),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+) -> Response:
+    """
+    Waveform peaks of a job's recording, for drawing it without downloading it.
+
+    Args:
+        job_id: The ID of the job
+        level: Peaks per second of the zoom level to return
+        current_user: Authenticated user from token
+
+    Returns:
+        Response with the level's int8 (min, max) pairs, or with the whole
+        peaks blob (header, level directory and every level) when no level
+        is given
+    """
+    request_id = f"peaks_req_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{job_id[:8]}"
+    logger.info(
+        f"[{request_id}] Peaks request received for job_id: {job_id}, level: {level} by user: {current_user.get('username')}"
+    )
+
+    config = AppConfig()
+    try:
+        cosmos_db = CosmosDB(config)
+        storage_service = StorageService(config)
+    except DatabaseError as e:
+        logger.error(
+            f"[{request_id}] Database initialization failed: {str(e)}", exc_info=True
+        )
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+    except Exception as e:
+        logger.error(
+            f"[{request_id}] Service initialization error: {str(e)}", exc_info=True
+        )
+        raise HTTPException(status_code=500, detail="Error initializing services")
+
+    try:
+        jobs = list(
+            cosmos_db.jobs_container.query_items(
+                query="SELECT * FROM c WHERE c.type = 'job' AND c.id = @job_id",
+                parameters=[{"name": "@job_id", "value": job_id}],
+                enable_cross_partition_query=True,
+            )
+        )
+    except Exception as e:
+        logger.error(f"[{request_id}] Error retrieving job: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error retrieving job information")
+
+    if not jobs:
+        logger.warning(f"[{request_id}] Job not found in database: {job_id}")
+        raise HTTPException(status_code=404, detail="Job not found")
+    peaks_url = jobs[0].get("peaks_file_path")
+    if not peaks_url:
+        logger.warning(f"[{request_id}] Peaks not found for job: {job_id}")
+        raise HTTPException(status_code=404, detail="Peaks not available for this job")
+
+    try:
+        if level is None:
+            content = await storage_service.read_blob_range(peaks_url)
+            header = read_peaks_header(content)
+            headers = {}
+        else:
+            # Header and directory first, then only the requested level
+            prefix = await storage_service.read_blob_range(
+                peaks_url, 0, PEAKS_PREFIX_SIZE
+            )
+            size = directory_size(prefix)
+            if len(prefix) < size:
+                prefix = await storage_service.read_blob_range(peaks_url, 0, size)
+            header = read_peaks_header(prefix)
+            entry = next(
+                (l for l in header["levels"] if l["peaks_per_second"] == level), None
+            )
+            if entry is None:
+                available = ", ".join(
+                    str(l["peaks_per_second"]) for l in header["levels"]
+                )
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown peaks level {level}; available levels: {available}",
+                )
+            content = (
+                await storage_service.read_blob_range(
+                    peaks_url, entry["offset"], entry["count"] * 2
+                )
+                if entry["count"]
+                else b""
+            )
+            headers = {
+                "X-Peaks-Per-Second": str(level),
+                "X-Peaks-Count": str(entry["count"]),
+            }
+    except HTTPException:
+        raise
+    except PeaksFormatError as e:
+        logger.error(f"[{request_id}] Unreadable peaks blob: {str(e)}")
+        raise HTTPException(status_code=500, detail="Peaks file is corrupt")
+    except AzureError as e:
+        logger.error(f"[{request_id}] Azure storage error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=502, detail="Error accessing storage service")
+
+    logger.info(
+        f"[{request_id}] Returning {len(content)} bytes of peaks for job: {job_id}"
+    )
+    return Response(
+        content=content,
+        media_type="application/octet-stream",
+        headers={
+            **headers,
+            "X-Duration-Ms": str(header["duration_ms"]),
+            "Cache-Control": PEAKS_CACHE_CONTROL,
+        },
+    )
@@ -0,0 +1,33 @@
+import json
+import logging
+from typing import Any, Dict
+
+from azure.identity import DefaultAzureCredential
+from azure.storage.queue import QueueClient
+
+from app.core.config import AppConfig
+
+
+class QueueService:
+    """Hands uploaded jobs to the audio processor through its dispatch queue"""
+
+    def __init__(self, config: AppConfig):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        self.credential = DefaultAzureCredential()
+        self.queue_client = QueueClient(
+            account_url=self.config.storage.queue_account_url,
+            queue_name=self.config.storage.job_dispatch_queue,
+            credential=self.credential,
+        )
+
+    def dispatch_job(self, job: Dict[str, Any]) -> None:
+        """Enqueue a job-dispatch message; processing starts as soon as it is read"""
+        message = {
+            "job_id": job["id"],
+            "blob_url": job["file_path"],
+            "prompt_category_id": job.get("prompt_category_id"),
+            "prompt_subcategory_id": job.get("prompt_subcategory_id"),
+        }
+        self.queue_client.send_message(json.dumps(message))
+        self.logger.info(f"Job dispatched for processing: {job['id']}")
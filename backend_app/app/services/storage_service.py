@@ -1,12 +1,12 @@
 import os
 import logging
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, Tuple
 from azure.storage.blob import BlobServiceClient, BlobSasPermissions, generate_blob_sas
 from azure.storage.blob.aio import BlobClient as AsyncBlobClient
 from azure.identity import DefaultAzureCredential
 from azure.core.exceptions import AzureError
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 from azure.core.exceptions import ResourceNotFoundError
 from app.core.config import AppConfig
 
@@ -105,6 +105,68 @@ class StorageService:
             self.logger.error(f"Error uploading file: {str(e)}")
             raise
 
+    def _blob_location(self, file_blob_url: str) -> Tuple[str, str]:
+        """
+        Container and blob name of a blob URL the API may serve.
+
+        Raises:
+            ValueError: If the URL is invalid or outside the served containers.
+        """
+        parsed_url = urlparse(file_blob_url)
+        if not parsed_url.path:
+            raise ValueError("Invalid blob URL: Missing path.")
+
+        # Extract the container and blob name from the URL; pipeline
+        # artifacts live in the results container, older ones next to
+        # the recordings
+        allowed_containers = (
+            self.config.storage.results_container,
+            self.config.storage.recordings_container,
+        )
+        container_name, _, blob_name = (
+            unquote(parsed_url.path).lstrip("/").partition("/")
+        )
+        if container_name not in allowed_containers or not blob_name:
+            raise ValueError(
+                f"Blob URL does not contain an expected container: {', '.join(allowed_containers)}"
+            )
+        self.logger.debug(f"Extracted blob name: {blob_name}")
+        return container_name, blob_name
+
+    async def read_blob_range(
+        self, file_blob_url: str, offset: int = 0, length: Optional[int] = None
+    ) -> bytes:
+        """
+        Read part of a blob asynchronously.
+
+        Args:
+            file_blob_url (str): URL of the blob to read.
+            offset (int): First byte to read.
+            length (Optional[int]): Bytes to read; to the end of the blob when None.
+
+        Returns:
+            bytes: The bytes read, fewer than length at the end of the blob.
+
+        Raises:
+            ValueError: If the provided URL is invalid or missing required parts.
+            ResourceNotFoundError: If the blob does not exist.
+        """
+        if not file_blob_url:
+            raise ValueError("Blob URL cannot be empty.")
+        container_name, blob_name = self._blob_location(file_blob_url)
+
+        async_blob_client = AsyncBlobClient(
+            account_url=self.config.storage.account_url,
+            container_name=container_name,
+            blob_name=blob_name,
+            credential=self.credential,
+        )
+        async with async_blob_client:
+            downloader = await async_blob_client.download_blob(
+                offset=offset, length=length
+            )
+            return await downloader.readall()
+
     async def stream_blob_content(
         self, file_blob_url: str
     ) -> AsyncGenerator[bytes, None]:
@@ -126,25 +188,12 @@ class StorageService:
             raise ValueError("Blob URL cannot be empty.")
 
         try:
-            parsed_url = urlparse(file_blob_url)
-            if not parsed_url.path:
-                raise ValueError("Invalid blob URL: Missing path.")
-
-            # Extract the blob name from the URL
-            if self.config.storage.recordings_container not in parsed_url.path:
-                raise ValueError(
-                    f"Blob URL does not contain the expected container: {self.config.storage.recordings_container}"
-                )
-
-            blob_name = parsed_url.path.split(
-                self.config.storage.recordings_container, 1
-            )[-1].lstrip("/")
-            self.logger.debug(f"Extracted blob name: {blob_name}")
+            container_name, blob_name = self._blob_location(file_blob_url)
 
             # Create an async blob client
             async_blob_client = AsyncBlobClient(
                 account_url=self.config.storage.account_url,
-                container_name=self.config.storage.recordings_container,
+                container_name=container_name,
                 blob_name=blob_name,
                 credential=self.credential,
             )
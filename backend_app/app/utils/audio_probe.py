@@ -0,0 +1,376 @@
+"""
+Header-only probing of uploaded recordings.
+
+Reads the container headers of WAV, MP3, FLAC, OGG (Vorbis/Opus), M4A and
+ADTS AAC files to learn their duration, codec, sample rate and channel
+count, without decoding any audio. Files whose headers do not parse, or
+whose content does not match their extension, are rejected.
+"""
+
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Optional
+
+# Bytes read from the start of a file to recognise its container
+HEAD_SIZE = 64 * 1024
+
+# Containers each probed upload extension may hold; other extensions are
+# accepted without probing
+EXTENSION_FORMATS = {
+    "wav": {"wav"},
+    "alaw": {"wav"},
+    "mulaw": {"wav"},
+    "mp3": {"mp3"},
+    "flac": {"flac"},
+    "ogg": {"ogg"},
+    "opus": {"ogg"},
+    "m4a": {"mp4"},
+    "mp4": {"mp4"},
+    "aac": {"aac", "mp4"},
+}
+
+MP3_BITRATES = {
+    # (MPEG-1, layer III) and (MPEG-2/2.5, layer III), kbit/s
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+AAC_SAMPLE_RATES = [
+    96000, 88200, 64000, 48000, 44100, 32000, 24000,
+    22050, 16000, 12000, 11025, 8000, 7350,
+]
+WAV_CODECS = {1: "pcm", 3: "ieee_float", 6: "alaw", 7: "mulaw", 0x55: "mp3"}
+MP4_CODECS = {"mp4a": "aac", "alac": "alac", "Opus": "opus", "fLaC": "flac"}
+
+
+class AudioProbeError(ValueError):
+    """The file is not a readable recording of the claimed format"""
+
+
+def _metadata(
+    container: str,
+    codec: str,
+    duration: Optional[float],
+    sample_rate: int,
+    channels: int,
+) -> Dict[str, Any]:
+    if not sample_rate or not channels:
+        raise AudioProbeError(f"{container} header has no sample rate or channels")
+    if duration is not None and duration <= 0:
+        raise AudioProbeError(f"{container} file contains no audio")
+    return {
+        "format": container,
+        "codec": codec,
+        "duration_seconds": round(duration, 3) if duration is not None else None,
+        "sample_rate": sample_rate,
+        "channels": channels,
+    }
+
+
+def _probe_wav(f: BinaryIO, size: int) -> Dict[str, Any]:
+    f.seek(12)
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise AudioProbeError("WAV file has no data chunk")
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", f.read(16))
+            f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+        elif chunk_id == b"data":
+            if not fmt:
+                raise AudioProbeError("WAV data chunk comes before its format")
+            audio_format, channels, sample_rate, byte_rate, _, _ = fmt
+            # Streaming writers leave the size unset; the data runs to the end
+            data_size = min(chunk_size, size - f.tell())
+            return _metadata(
+                "wav",
+                WAV_CODECS.get(audio_format, f"wav_0x{audio_format:04x}"),
+                data_size / byte_rate if byte_rate else None,
+                sample_rate,
+                channels,
+            )
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def _mp3_frame(header: bytes) -> Optional[Dict[str, Any]]:
+    """Decode an MPEG audio layer III frame header, or None"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits != 1:
+        return None
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    samples = 1152 if version == 1 else 576
+    padding = (header[2] >> 1) & 0x01
+    return {
+        "version": version,
+        "sample_rate": sample_rate,
+        "bitrate": bitrate,
+        "samples": samples,
+        "channels": 1 if header[3] >> 6 == 3 else 2,
+        "length": samples // 8 * bitrate // sample_rate + padding,
+    }
+
+
+def _probe_mp3(f: BinaryIO, size: int) -> Dict[str, Any]:
+    f.seek(0)
+    start = 0
+    head = f.read(10)
+    if head[:3] == b"ID3":
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+
+    f.seek(start)
+    window = f.read(HEAD_SIZE)
+    for index in range(len(window) - 4):
+        frame = _mp3_frame(window[index : index + 4])
+        # A real frame is followed by another one
+        if frame and _mp3_frame(
+            window[index + frame["length"] : index + frame["length"] + 4]
+        ):
+            break
+    else:
+        raise AudioProbeError("No MPEG audio frames found")
+
+    first = window[index : index + frame["length"]]
+    audio_size = size - start - index
+    f.seek(-128, os.SEEK_END)
+    if f.read(3) == b"TAG":
+        audio_size -= 128
+
+    # VBR files announce their frame count in a Xing/Info or VBRI header
+    frames = None
+    for tag in (b"Xing", b"Info"):
+        position = first.find(tag)
+        if position == -1:
+            continue
+        flags = struct.unpack(">I", first[position + 4 : position + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", first[position + 8 : position + 12])[0]
+    position = first.find(b"VBRI")
+    if frames is None and position != -1:
+        frames = struct.unpack(">I", first[position + 14 : position + 18])[0]
+
+    duration = (
+        frames * frame["samples"] / frame["sample_rate"]
+        if frames
+        else audio_size * 8 / frame["bitrate"]
+    )
+    return _metadata("mp3", "mp3", duration, frame["sample_rate"], frame["channels"])
+
+
+def _probe_flac(f: BinaryIO, size: int) -> Dict[str, Any]:
+    f.seek(4)
+    block_header = f.read(4)
+    if len(block_header) < 4 or block_header[0] & 0x7F != 0:
+        raise AudioProbeError("FLAC file does not start with STREAMINFO")
+    info = f.read(34)
+    if len(info) < 34:
+        raise AudioProbeError("FLAC STREAMINFO is truncated")
+    packed = int.from_bytes(info[10:18], "big")
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x07) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    return _metadata(
+        "flac",
+        "flac",
+        total_samples / sample_rate if total_samples and sample_rate else None,
+        sample_rate,
+        channels,
+    )
+
+
+def _probe_ogg(f: BinaryIO, size: int) -> Dict[str, Any]:
+    f.seek(0)
+    page = f.read(HEAD_SIZE)
+    segment_count = page[26]
+    packet = page[27 + segment_count :]
+    if packet.startswith(b"OpusHead"):
+        codec, channels = "opus", packet[9]
+        pre_skip, sample_rate = struct.unpack("<HI", packet[10:16])
+        # Opus granule positions always count 48 kHz samples
+        granule_rate = 48000
+    elif packet.startswith(b"\x01vorbis"):
+        codec, channels = "vorbis", packet[11]
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+        pre_skip, granule_rate = 0, sample_rate
+    else:
+        raise AudioProbeError("OGG stream is neither Vorbis nor Opus")
+
+    # The granule position of the last page is the stream length in samples
+    f.seek(max(0, size - HEAD_SIZE))
+    tail = f.read()
+    last_page = tail.rfind(b"OggS")
+    duration = None
+    if last_page != -1 and len(tail) >= last_page + 14:
+        granule = struct.unpack("<q", tail[last_page + 6 : last_page + 14])[0]
+        if granule > pre_skip:
+            duration = (granule - pre_skip) / granule_rate
+    return _metadata("ogg", codec, duration, sample_rate or granule_rate, channels)
+
+
+def _mp4_boxes(f: BinaryIO, start: int, end: int):
+    """Yield (type, payload_start, box_end) for the boxes in a byte range"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        box_size, box_type = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - position
+        if box_size < header_size:
+            raise AudioProbeError("MP4 box has an invalid size")
+        yield box_type.decode("latin-1"), position + header_size, position + box_size
+        position += box_size
+
+
+def _mp4_find(f: BinaryIO, start: int, end: int, path: str):
+    """Payload range of the first box along a path like 'moov/trak'"""
+    for name in path.split("/"):
+        for box_type, payload, box_end in _mp4_boxes(f, start, end):
+            if box_type == name:
+                start, end = payload, box_end
+                break
+        else:
+            return None
+    return start, end
+
+
+def _probe_mp4(f: BinaryIO, size: int) -> Dict[str, Any]:
+    moov = _mp4_find(f, 0, size, "moov")
+    if not moov:
+        raise AudioProbeError("MP4 file has no movie header")
+
+    # The first track with a sound media handler
+    for box_type, payload, box_end in _mp4_boxes(f, *moov):
+        if box_type != "trak":
+            continue
+        handler = _mp4_find(f, payload, box_end, "mdia/hdlr")
+        if not handler:
+            continue
+        f.seek(handler[0] + 8)
+        if f.read(4) != b"soun":
+            continue
+
+        mdhd = _mp4_find(f, payload, box_end, "mdia/mdhd")
+        stsd = _mp4_find(f, payload, box_end, "mdia/minf/stbl/stsd")
+        if not mdhd or not stsd:
+            raise AudioProbeError("MP4 audio track has no media or sample header")
+        f.seek(mdhd[0])
+        version = f.read(4)[0]
+        if version == 1:
+            f.seek(16, os.SEEK_CUR)
+            timescale, duration = struct.unpack(">IQ", f.read(12))
+        else:
+            f.seek(8, os.SEEK_CUR)
+            timescale, duration = struct.unpack(">II", f.read(8))
+
+        f.seek(stsd[0] + 8)
+        entry = f.read(36)
+        codec = entry[4:8].decode("latin-1")
+        channels, _ = struct.unpack(">HH", entry[24:28])
+        sample_rate = struct.unpack(">I", entry[32:36])[0] >> 16
+        return _metadata(
+            "mp4",
+            MP4_CODECS.get(codec, codec),
+            duration / timescale if timescale else None,
+            sample_rate or timescale,
+            channels,
+        )
+    raise AudioProbeError("MP4 file has no audio track")
+
+
+def _probe_adts(f: BinaryIO, size: int) -> Dict[str, Any]:
+    f.seek(0)
+    head = f.read(HEAD_SIZE)
+    position, frames = 0, 0
+    sample_rate = channels = 0
+    # Average the first frames to estimate the whole stream
+    while frames < 100 and position + 7 <= len(head):
+        header = head[position : position + 7]
+        if header[0] != 0xFF or header[1] & 0xF6 != 0xF0:
+            break
+        rate_index = (header[2] >> 2) & 0x0F
+        if rate_index >= len(AAC_SAMPLE_RATES):
+            break
+        sample_rate = AAC_SAMPLE_RATES[rate_index]
+        channels = ((header[2] & 0x01) << 2) | (header[3] >> 6)
+        length = ((header[3] & 0x03) << 11) | (header[4] << 3) | (header[5] >> 5)
+        if length < 7:
+            break
+        position += length
+        frames += 1
+    if not frames:
+        raise AudioProbeError("No AAC frames found")
+    duration = size / (position / frames) * 1024 / sample_rate
+    return _metadata("aac", "aac", duration, sample_rate, channels)
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    """Container of a file from its first bytes, or None"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head[:3] == b"ID3" or _mp3_frame(head[:4]):
+        return "mp3"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "aac"
+    return None
+
+
+PROBES = {
+    "wav": _probe_wav,
+    "mp3": _probe_mp3,
+    "flac": _probe_flac,
+    "ogg": _probe_ogg,
+    "mp4": _probe_mp4,
+    "aac": _probe_adts,
+}
+
+
+def probe_audio(file_path: str, extension: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read a recording's format, codec, duration, sample rate and channels.
+
+    Only headers are read. Raises AudioProbeError for files that cannot be
+    parsed, and for files whose content does not match their extension.
+    """
+    extension = (extension or os.path.splitext(file_path)[1]).lstrip(".").lower()
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        container = detect_format(f.read(16))
+        if not container:
+            raise AudioProbeError("File is not a recognised audio format")
+        allowed = EXTENSION_FORMATS.get(extension)
+        if allowed is not None and container not in allowed:
+            raise AudioProbeError(
+                f"File content is {container} but its extension is .{extension}"
+            )
+        try:
+            return PROBES[container](f, size)
+        except AudioProbeError:
+            raise
+        except (struct.error, IndexError, KeyError, OSError, ValueError) as e:
+            raise AudioProbeError(f"Corrupt {container} header: {str(e)}")
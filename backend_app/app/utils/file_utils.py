@@ -5,6 +5,8 @@ import shutil
 from datetime import datetime, timedelta
 from typing import Tuple
 
+from app.utils.audio_probe import AudioProbeError, probe_audio
+
 
 class FileUtils:
     AUDIO_EXTENSIONS = {
@@ -64,6 +66,12 @@ class FileUtils:
                     f"Supported formats: {', '.join(cls.AUDIO_EXTENSIONS.keys())}",
                 )
 
+            # Check the content matches the extension and its headers parse
+            try:
+                probe_audio(file_path, file_extension)
+            except AudioProbeError as e:
+                return False, f"Invalid audio file: {str(e)}"
+
             return True, "File is valid"
 
         except Exception as e:
@@ -0,0 +1,147 @@
+"""
+Reading the phrase stores the audio pipeline writes next to each transcript.
+
+A blob is little-endian: a header (magic b"PHRS", version, two reserved
+fields, phrase count, record bytes), the phrase index (each phrase's start in
+ms, then the end of each phrase's record), then one record per phrase in time
+order: duration in ms, confidence, speaker (-1 when unknown) and channel,
+followed by the phrase's UTF-8 text.
+
+Slices are served from the index alone: a binary search over the start times
+gives the phrases, and their records are one contiguous byte range.
+"""
+
+import bisect
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+PHRASE_STORE_MAGIC = b"PHRS"
+PHRASE_STORE_VERSION = 2
+PHRASE_STORE_HEADER = struct.Struct("<4sBBHII")
+PHRASE_RECORD = struct.Struct("<IfhB")
+
+# Bytes read to get the header and index in one request; enough for 4096
+# phrases, a few hours of conversation
+PHRASE_INDEX_PREFIX_SIZE = PHRASE_STORE_HEADER.size + 8 * 4096
+
+# Phrases below this confidence are marked, as in the stored transcript
+LOW_CONFIDENCE = 0.8
+
+
+class PhraseStoreFormatError(ValueError):
+    """A blob that is not a phrase store this code can read"""
+
+
+def _uint32_values(data: bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def index_size(prefix: bytes) -> int:
+    """Bytes of header and index, from a prefix holding at least the header"""
+    if len(prefix) < PHRASE_STORE_HEADER.size:
+        raise PhraseStoreFormatError("Phrase store is truncated")
+    phrase_count = PHRASE_STORE_HEADER.unpack_from(prefix)[4]
+    return PHRASE_STORE_HEADER.size + 8 * phrase_count
+
+
+def read_phrase_index(prefix: bytes) -> Dict[str, Any]:
+    """Phrase count, start times and record ends of a phrase store"""
+    size = index_size(prefix)
+    if len(prefix) < size:
+        raise PhraseStoreFormatError("Phrase store is truncated")
+    magic, version, _, _, count, _ = PHRASE_STORE_HEADER.unpack_from(prefix)
+    if magic != PHRASE_STORE_MAGIC or version != PHRASE_STORE_VERSION:
+        raise PhraseStoreFormatError(f"Unsupported phrase store version {version}")
+
+    ends_start = PHRASE_STORE_HEADER.size + 4 * count
+    return {
+        "count": count,
+        "offsets_ms": _uint32_values(prefix[PHRASE_STORE_HEADER.size : ends_start]),
+        "record_ends": _uint32_values(prefix[ends_start:size]),
+        "records_start": size,
+    }
+
+
+def phrase_range(
+    index: Dict[str, Any],
+    from_ms: Optional[int] = None,
+    to_ms: Optional[int] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    First and past-the-last phrase index of a slice.
+
+    Phrases starting in [from_ms, to_ms) are kept, then offset and limit page
+    through them.
+    """
+    first = 0 if from_ms is None else bisect.bisect_left(index["offsets_ms"], from_ms)
+    last = (
+        index["count"]
+        if to_ms is None
+        else bisect.bisect_left(index["offsets_ms"], to_ms, first)
+    )
+    first = min(first + offset, last)
+    if limit is not None:
+        last = min(last, first + limit)
+    return first, last
+
+
+def record_range(index: Dict[str, Any], first: int, last: int) -> Tuple[int, int]:
+    """Byte offset and length of the records of phrases [first, last)"""
+    start = index["record_ends"][first - 1] if first else 0
+    end = index["record_ends"][last - 1] if last > first else start
+    return index["records_start"] + start, end - start
+
+
+def read_phrases(
+    records: bytes, index: Dict[str, Any], first: int, last: int
+) -> List[Dict[str, Any]]:
+    """Phrases [first, last) from their records, as read with record_range"""
+    base = index["record_ends"][first - 1] if first else 0
+    if len(records) < (index["record_ends"][last - 1] - base if last > first else 0):
+        raise PhraseStoreFormatError("Phrase store is truncated")
+
+    phrases = []
+    start = 0
+    for position in range(first, last):
+        end = index["record_ends"][position] - base
+        duration_ms, confidence, speaker, channel = PHRASE_RECORD.unpack_from(
+            records, start
+        )
+        phrases.append(
+            {
+                "offset_ms": index["offsets_ms"][position],
+                "duration_ms": duration_ms,
+                "confidence": confidence,
+                "speaker": None if speaker < 0 else speaker,
+                "channel": channel,
+                "text": records[start + PHRASE_RECORD.size : end].decode("utf-8"),
+            }
+        )
+        start = end
+    return phrases
+
+
+def format_phrases(phrases: List[Dict[str, Any]]) -> str:
+    """Phrases as text, laid out like the stored transcript"""
+    lines = []
+    current_speaker = None
+    for phrase in phrases:
+        if not phrase["text"]:
+            continue
+        speaker = "Unknown" if phrase["speaker"] is None else phrase["speaker"]
+        if speaker != current_speaker:
+            lines.append(f"\n--- Speaker {speaker} ---")
+            current_speaker = speaker
+        line = phrase["text"]
+        if phrase["confidence"] < LOW_CONFIDENCE:
+            line = f"{line} [Confidence: {phrase['confidence']:.2f}]"
+        lines.append(f"  {line}")
+    return "\n".join(lines)
@@ -0,0 +1,53 @@
+"""
+Reading the waveform peaks blobs the audio pipeline stores next to each
+recording.
+
+A blob is little-endian: a header (magic b"PEAK", version, level count,
+reserved, duration in ms), one directory entry per zoom level (peaks per
+second, pair count, byte offset of its data), then each level's int8
+(min, max) pairs. Only the header and directory are parsed here; level data
+is served to clients as it is stored.
+"""
+
+import struct
+from typing import Any, Dict, List
+
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sBBHI")
+PEAKS_LEVEL = struct.Struct("<III")
+
+# Bytes read to get the header and directory in one request; enough for 16
+# zoom levels
+PEAKS_PREFIX_SIZE = PEAKS_HEADER.size + 16 * PEAKS_LEVEL.size
+
+
+class PeaksFormatError(ValueError):
+    """A blob that is not a waveform peaks blob this code can read"""
+
+
+def directory_size(prefix: bytes) -> int:
+    """Bytes of header and directory, from a prefix holding at least the header"""
+    if len(prefix) < PEAKS_HEADER.size:
+        raise PeaksFormatError("Waveform peaks blob is truncated")
+    level_count = PEAKS_HEADER.unpack_from(prefix)[2]
+    return PEAKS_HEADER.size + level_count * PEAKS_LEVEL.size
+
+
+def read_peaks_header(prefix: bytes) -> Dict[str, Any]:
+    """Duration and level directory of a waveform peaks blob"""
+    if len(prefix) < directory_size(prefix):
+        raise PeaksFormatError("Waveform peaks blob is truncated")
+    magic, version, level_count, _, duration_ms = PEAKS_HEADER.unpack_from(prefix)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise PeaksFormatError(f"Unsupported waveform peaks blob version {version}")
+
+    levels: List[Dict[str, int]] = []
+    for index in range(level_count):
+        peaks_per_second, count, offset = PEAKS_LEVEL.unpack_from(
+            prefix, PEAKS_HEADER.size + index * PEAKS_LEVEL.size
+        )
+        levels.append(
+            {"peaks_per_second": peaks_per_second, "count": count, "offset": offset}
+        )
+    return {"duration_ms": duration_ms, "levels": levels}
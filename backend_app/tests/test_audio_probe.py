@@ -0,0 +1,150 @@
+import os
+import struct
+import sys
+import wave
+
+import pytest
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.utils.audio_probe import AudioProbeError, probe_audio
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def wav_file(tmp_path, name="test.wav", seconds=2, rate=16000, channels=2):
+    path = str(tmp_path / name)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x00\x00" * channels * rate * seconds)
+    return path
+
+
+def mp3_frames(count):
+    # MPEG-1 layer III, 128 kbit/s, 44.1 kHz, joint stereo: 417 byte frames
+    header = bytes([0xFF, 0xFB, 0x90, 0x40])
+    return (header + b"\x00" * 413) * count
+
+
+def ogg_page(packet, granule):
+    return (
+        b"OggS"
+        + struct.pack("<BBqIIIB", 0, 0, granule, 1, 0, 0, 1)
+        + bytes([len(packet)])
+        + packet
+    )
+
+
+def mp4_box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def m4a_file(seconds, rate=44100, channels=2):
+    mdhd = mp4_box(b"mdhd", struct.pack(">B3xIIII", 0, 0, 0, rate, seconds * rate) + b"\x00" * 4)
+    hdlr = mp4_box(b"hdlr", b"\x00" * 8 + b"soun" + b"\x00" * 12)
+    entry = (
+        struct.pack(">I4s", 36, b"mp4a")
+        + b"\x00" * 6
+        + struct.pack(">H", 1)
+        + b"\x00" * 8
+        + struct.pack(">HHI", channels, 16, 0)
+        + struct.pack(">I", rate << 16)
+    )
+    stsd = mp4_box(b"stsd", struct.pack(">II", 0, 1) + entry)
+    stbl = mp4_box(b"stbl", stsd)
+    minf = mp4_box(b"minf", stbl)
+    mdia = mp4_box(b"mdia", mdhd + hdlr + minf)
+    moov = mp4_box(b"moov", mp4_box(b"trak", mdia))
+    ftyp = mp4_box(b"ftyp", b"M4A \x00\x00\x00\x00")
+    # The movie header after the media data, as phones often write it
+    return ftyp + mp4_box(b"mdat", b"\x00" * 1000) + moov
+
+
+def test_probe_wav(tmp_path):
+    metadata = probe_audio(wav_file(tmp_path, seconds=2, rate=16000, channels=2))
+
+    assert metadata == {
+        "format": "wav",
+        "codec": "pcm",
+        "duration_seconds": 2.0,
+        "sample_rate": 16000,
+        "channels": 2,
+    }
+
+
+def test_probe_cbr_mp3_after_id3_tag(tmp_path):
+    id3 = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + b"\x00" * 10
+    path = write(tmp_path, "test.mp3", id3 + mp3_frames(1000))
+
+    metadata = probe_audio(path)
+
+    assert metadata["codec"] == "mp3"
+    assert metadata["sample_rate"] == 44100
+    assert metadata["channels"] == 2
+    assert metadata["duration_seconds"] == pytest.approx(1000 * 1152 / 44100, rel=0.01)
+
+
+def test_probe_flac(tmp_path):
+    packed = (48000 << 44) | (0 << 41) | (15 << 36) | (48000 * 90)
+    streaminfo = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    path = write(tmp_path, "test.flac", b"fLaC" + b"\x80\x00\x00\x22" + streaminfo)
+
+    metadata = probe_audio(path)
+
+    assert metadata["duration_seconds"] == 90.0
+    assert metadata["sample_rate"] == 48000
+    assert metadata["channels"] == 1
+
+
+def test_probe_ogg_opus(tmp_path):
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, 16000, 0, 0)
+    data = ogg_page(head, 0) + ogg_page(b"\x00" * 50, 48000 * 30 + 312)
+    path = write(tmp_path, "test.ogg", data)
+
+    metadata = probe_audio(path)
+
+    assert metadata["codec"] == "opus"
+    assert metadata["duration_seconds"] == 30.0
+    assert metadata["channels"] == 1
+
+
+def test_probe_m4a_with_trailing_movie_header(tmp_path):
+    path = write(tmp_path, "test.m4a", m4a_file(seconds=75))
+
+    metadata = probe_audio(path)
+
+    assert metadata["format"] == "mp4"
+    assert metadata["codec"] == "aac"
+    assert metadata["duration_seconds"] == 75.0
+    assert metadata["sample_rate"] == 44100
+
+
+def test_mislabeled_file_rejected(tmp_path):
+    path = wav_file(tmp_path, name="test.mp3")
+
+    with pytest.raises(AudioProbeError, match="extension"):
+        probe_audio(path)
+
+
+def test_corrupt_file_rejected(tmp_path):
+    path = write(tmp_path, "test.mp3", b"test audio content")
+
+    with pytest.raises(AudioProbeError):
+        probe_audio(path)
+
+
+def test_truncated_wav_rejected(tmp_path):
+    with open(wav_file(tmp_path), "rb") as f:
+        header = f.read(20)
+    path = write(tmp_path, "truncated.wav", header)
+
+    with pytest.raises(AudioProbeError):
+        probe_audio(path)
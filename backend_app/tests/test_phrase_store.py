@@ -0,0 +1,81 @@
+import os
+import struct
+import sys
+
+import pytest
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.utils.phrase_store import (
+    PHRASE_RECORD,
+    PHRASE_STORE_HEADER,
+    PhraseStoreFormatError,
+    format_phrases,
+    index_size,
+    phrase_range,
+    read_phrase_index,
+    read_phrases,
+    record_range,
+)
+
+
+def phrase_store(phrases, magic=b"PHRS", version=2):
+    """Blob with phrases of (offset_ms, speaker, confidence, text)"""
+    records, ends = b"", []
+    for offset_ms, speaker, confidence, text in phrases:
+        records += PHRASE_RECORD.pack(1000, confidence, speaker, 0) + text.encode("utf-8")
+        ends.append(len(records))
+    count = len(phrases)
+    return (
+        PHRASE_STORE_HEADER.pack(magic, version, 0, 0, count, len(records))
+        + struct.pack(f"<{count}I", *(p[0] for p in phrases))
+        + struct.pack(f"<{count}I", *ends)
+        + records
+    )
+
+
+PHRASES = [(i * 5_000, i % 2 + 1, 0.95, f"Phrase {i}.") for i in range(1000)]
+
+
+def read_slice(blob, **kwargs):
+    index = read_phrase_index(blob[: index_size(blob)])
+    first, last = phrase_range(index, **kwargs)
+    byte_offset, length = record_range(index, first, last)
+    return read_phrases(blob[byte_offset : byte_offset + length], index, first, last)
+
+
+def test_time_range_is_one_contiguous_read():
+    phrases = read_slice(phrase_store(PHRASES), from_ms=2_400_000, to_ms=2_700_000)
+
+    assert [p["offset_ms"] for p in phrases] == list(range(2_400_000, 2_700_000, 5_000))
+    assert phrases[0]["text"] == "Phrase 480."
+    assert phrases[0]["speaker"] == 1
+
+
+def test_offset_and_limit_page_through_the_range():
+    blob = phrase_store(PHRASES)
+
+    page = read_slice(blob, from_ms=2_400_000, offset=10, limit=3)
+    assert [p["text"] for p in page] == ["Phrase 490.", "Phrase 491.", "Phrase 492."]
+    assert read_slice(blob, offset=2000) == []
+    assert read_slice(blob, from_ms=10_000, to_ms=10_000) == []
+
+
+def test_slice_laid_out_like_transcript():
+    blob = phrase_store(
+        [(0, 1, 0.95, "Hello."), (900, 1, 0.5, "Uh, hi."), (2000, -1, 0.9, "Café?")]
+    )
+
+    assert format_phrases(read_slice(blob)) == (
+        "\n--- Speaker 1 ---\n  Hello.\n  Uh, hi. [Confidence: 0.50]"
+        "\n\n--- Speaker Unknown ---\n  Café?"
+    )
+
+
+def test_other_blobs_are_rejected():
+    with pytest.raises(PhraseStoreFormatError):
+        read_phrase_index(phrase_store(PHRASES[:2], version=1))
+    with pytest.raises(PhraseStoreFormatError):
+        read_phrase_index(phrase_store(PHRASES)[:100])
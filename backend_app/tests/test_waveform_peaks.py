@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+# Add project root to path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from app.utils.waveform_peaks import (
+    PEAKS_HEADER,
+    PEAKS_LEVEL,
+    PEAKS_PREFIX_SIZE,
+    PeaksFormatError,
+    directory_size,
+    read_peaks_header,
+)
+
+
+def peaks_blob(levels, duration_ms=1500, magic=b"PEAK", version=1):
+    """Blob with levels of (peaks_per_second, [(min, max), ...])"""
+    header = PEAKS_HEADER.pack(magic, version, len(levels), 0, duration_ms)
+    offset = PEAKS_HEADER.size + PEAKS_LEVEL.size * len(levels)
+    directory, data = b"", b""
+    for peaks_per_second, pairs in levels:
+        directory += PEAKS_LEVEL.pack(peaks_per_second, len(pairs), offset)
+        level_data = bytes(value & 0xFF for pair in pairs for value in pair)
+        data += level_data
+        offset += len(level_data)
+    return header + directory + data
+
+
+def test_header_lists_each_level_and_its_data():
+    blob = peaks_blob([(2, [(0, 127), (-127, 0), (0, 0)]), (1, [(-127, 127), (0, 0)])])
+
+    header = read_peaks_header(blob[:PEAKS_PREFIX_SIZE])
+
+    assert header["duration_ms"] == 1500
+    coarse = header["levels"][1]
+    assert (coarse["peaks_per_second"], coarse["count"]) == (1, 2)
+    level_data = blob[coarse["offset"] : coarse["offset"] + coarse["count"] * 2]
+    assert [int.from_bytes([b], "little", signed=True) for b in level_data] == [-127, 127, 0, 0]
+
+
+def test_directory_size_tells_how_much_prefix_to_read():
+    blob = peaks_blob([(25, [(0, 0)] * 20)] * 20)
+    prefix = blob[:PEAKS_PREFIX_SIZE]
+
+    with pytest.raises(PeaksFormatError):
+        read_peaks_header(prefix)
+    assert len(read_peaks_header(blob[: directory_size(prefix)])["levels"]) == 20
+
+
+def test_other_blobs_are_rejected():
+    with pytest.raises(PeaksFormatError):
+        read_peaks_header(peaks_blob([(1, [(0, 0)])], magic=b"RIFF"))
+    with pytest.raises(PeaksFormatError):
+        read_peaks_header(b"PEAK")
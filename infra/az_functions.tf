@@ -63,6 +63,8 @@ resource "azurerm_linux_function_app" "function_call_function_app" {
 
     AZURE_STORAGE_ACCOUNT_URL          = "https://${azurerm_storage_account.storage.name}.blob.core.windows.net"
     AZURE_STORAGE_RECORDINGS_CONTAINER = azurerm_storage_container.container.name
+    AZURE_STORAGE_RESULTS_CONTAINER    = azurerm_storage_container.results.name
+    AZURE_STORAGE_QUEUE_ACCOUNT_URL    = "https://${azurerm_storage_account.storage.name}.queue.core.windows.net"
 
     audio__accountName = azurerm_storage_account.storage.name
     audio__credential  = "managedidentity"
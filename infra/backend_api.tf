@@ -66,6 +66,8 @@ resource "azurerm_linux_web_app" "backend_webapp" {
     AZURE_COSMOS_DB                    = azurerm_cosmosdb_sql_database.voice_db.name
     AZURE_STORAGE_ACCOUNT_URL          = "https://${azurerm_storage_account.storage.name}.blob.core.windows.net"
     AZURE_STORAGE_RECORDINGS_CONTAINER = var.storage_container_name
+    AZURE_STORAGE_RESULTS_CONTAINER    = azurerm_storage_container.results.name
+    AZURE_STORAGE_QUEUE_ACCOUNT_URL    = "https://${azurerm_storage_account.storage.name}.queue.core.windows.net"
 
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES = 3000
     JWT_ALGORITHM                   = "HS256"
@@ -116,6 +118,14 @@ resource "azurerm_role_assignment" "storage_blob_data_contributor" {
 }
 
 #recordingcontainer
+# Enqueue job-dispatch messages for the audio processor
+resource "azurerm_role_assignment" "storage_queue_data_message_sender" {
+  depends_on           = [azurerm_linux_web_app.backend_webapp, azurerm_storage_account.storage]
+  scope                = azurerm_storage_account.storage.id
+  role_definition_name = "Storage Queue Data Message Sender"
+  principal_id         = azurerm_linux_web_app.backend_webapp.identity[0].principal_id
+}
+
 resource "azurerm_role_assignment" "recording_container_storage_contributor" {
   depends_on           = [azurerm_linux_web_app.backend_webapp, azurerm_storage_container.container]
   scope                = azurerm_storage_container.container.id
@@ -213,6 +213,39 @@ resource "azurerm_cosmosdb_sql_container" "voice_prompts_container" {
 
 
 
+resource "azurerm_cosmosdb_sql_container" "voice_analysis_cache_container" {
+  name                = "voice_analysis_cache"
+  resource_group_name = azurerm_resource_group.rg.name
+  account_name        = azurerm_cosmosdb_account.voice_account.name
+  database_name       = azurerm_cosmosdb_sql_database.voice_db.name
+
+  partition_key_paths   = ["/id"]
+  partition_key_version = 2
+
+  # TTL enabled without a default: every cache entry carries its own ttl.
+  default_ttl = -1
+
+  indexing_policy {
+    indexing_mode = "none"
+  }
+}
+
+resource "azurerm_cosmosdb_sql_container" "voice_leases_container" {
+  name                = "voice_leases"
+  resource_group_name = azurerm_resource_group.rg.name
+  account_name        = azurerm_cosmosdb_account.voice_account.name
+  database_name       = azurerm_cosmosdb_sql_database.voice_db.name
+
+  partition_key_paths   = ["/id"]
+  partition_key_version = 2
+
+  indexing_policy {
+    indexing_mode = "none"
+  }
+}
+
+
+
 resource "azurerm_cosmosdb_sql_role_definition" "data_reader" {
   resource_group_name = azurerm_resource_group.rg.name
   account_name        = azurerm_cosmosdb_account.voice_account.name
@@ -19,5 +19,16 @@ resource "azurerm_storage_container" "container" {
   container_access_type = "private"
 }
 
+# Pipeline artifacts (transcripts, analysis inputs, PDFs)
+resource "azurerm_storage_container" "results" {
+  name                  = "results"
+  storage_account_id    = azurerm_storage_account.storage.id
+  container_access_type = "private"
+}
 
-
+# Queues connecting the audio processing pipeline stages
+resource "azurerm_storage_queue" "pipeline_queues" {
+  for_each             = toset(["job-dispatch", "transcription-poll", "transcript-format", "transcript-analysis", "analysis-finalize"])
+  name                 = each.value
+  storage_account_name = azurerm_storage_account.storage.name
+}